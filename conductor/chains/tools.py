@@ -1,4 +1,4 @@
-from serpapi import GoogleSearch
+from conductor.serp import serp_search
 from langchain_core.messages import HumanMessage
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.output_parsers import PydanticOutputParser
@@ -20,14 +20,13 @@ def image_search(query: str, api_key: str) -> dict:
     Returns:
         dict: image search results
     """
-    search = GoogleSearch(
+    return serp_search(
         {
             "engine": "google_images",
             "q": query,
             "api_key": api_key,
         }
     )
-    return search.get_dict()
 
 
 class ImageProcessor:
@@ -1,9 +1,9 @@
 from crewai_tools.tools.base_tool import BaseTool
 from crewai_tools.tools import ScrapeWebsiteTool
-from serpapi import GoogleSearch
 from pydantic.v1 import BaseModel, Field
 from typing import Optional, Any, Type
 from textwrap import dedent
+from concurrent.futures import ThreadPoolExecutor, wait
 import os
 from conductor.crews.functions import generate_apollo_person_domain_search_context
 from conductor.crews.marketing.utils import (
@@ -12,8 +12,15 @@ from conductor.crews.marketing.utils import (
     clean_html,
     send_request_with_cache,
 )
+from conductor.health import FetchSkipped, scrape_guard
+from conductor.http import (
+    MAX_RESPONSE_BYTES,
+    TEXT_KINDS,
+    UnsupportedContent,
+    http_client,
+)
+from conductor.serp import serp_search
 from redis import Redis
-import requests
 
 
 CONTEXT_LIMIT = os.getenv("CONTEXT_LIMIT", 200000)
@@ -108,14 +115,19 @@ class FilteredScrapeWebsiteToolSchema(ScrapeWebsiteTool):
         **kwargs: Any,
     ) -> Any:
         website_url = kwargs.get("website_url", self.website_url)
-        response = requests.request(
-            url=website_url,
-            method="GET",
-            headers=self.headers,
-            cookies=self.cookies if self.cookies else {},
-            timeout=5,
-        )
-        if response.ok:
+        try:
+            response = http_client.request(
+                url=website_url,
+                method="GET",
+                headers=self.headers,
+                cookies=self.cookies if self.cookies else {},
+                timeout=5,
+                max_bytes=MAX_RESPONSE_BYTES,
+                accept=TEXT_KINDS,
+            )
+        except UnsupportedContent as e:
+            return f"Error: {e}, not a webpage."
+        if response.is_success:
             return clean_html(response=response)
         else:
             return f"Error: Unable to fetch page content for {website_url}."
@@ -126,6 +138,9 @@ class SerpSearchTool(BaseTool):
     name: str = "Google Tool"
     description: str = "A tool that can be used to scrape search engine results page (SERP) using a search query on Google."
     args_schema: Type[BaseModel] = SerpSearchToolSchema
+    # pages are fetched concurrently, slow pages are skipped at the deadline
+    max_workers: int = 8
+    deadline: float = 30.0
     cookies: Optional[dict] = None
     headers: Optional[dict] = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36",
@@ -145,32 +160,47 @@ class SerpSearchTool(BaseTool):
             self._generate_description()
 
     def _get_page_content(self, url: str) -> str:
-        response = requests.request(
-            url=url,
-            method="GET",
-            headers=self.headers,
-            cookies=self.cookies if self.cookies else {},
-            timeout=5,
-        )
-        if response.ok:
-            return clean_html(response=response)
-        else:
-            return f"Error: Unable to fetch page content for {url}."
-
-    def _run(self, **kwargs: Any) -> Any:
-        if os.getenv("SERPAPI_API_KEY") is None:
-            raise ValueError("SERPAPI_API_KEY is not set in environment variables")
+        # recently failed urls and failing domains are skipped without a request
+        with scrape_guard.track(url):
+            response = http_client.request(
+                url=url,
+                method="GET",
+                headers=self.headers,
+                cookies=self.cookies if self.cookies else {},
+                timeout=5,
+                max_bytes=MAX_RESPONSE_BYTES,
+                accept=TEXT_KINDS,
+            )
+            response.raise_for_status()
+        return clean_html(response=response)
+
+    def _get_page_contents(self, urls: list[str]) -> list[str]:
+        """
+        Fetch pages concurrently, skipping the ones still loading at the deadline
+        """
+        if not urls:
+            return []
+        executor = ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls)))
+        futures = [executor.submit(self._get_page_content, url) for url in urls]
+        wait(futures, timeout=self.deadline)
+        # don't block the agent on slow pages, their threads finish in the background
+        executor.shutdown(wait=False, cancel_futures=True)
+        contents = []
+        for url, future in zip(urls, futures):
+            if not future.done() or future.cancelled():
+                contents.append(
+                    f"Skipped: {url} did not load within {self.deadline} seconds."
+                )
+            elif isinstance(future.exception(), FetchSkipped):
+                contents.append(f"Skipped: {future.exception()}.")
+            elif future.exception() is not None:
+                contents.append(f"Error: Unable to fetch page content for {url}.")
+            else:
+                contents.append(future.result())
+        return contents
+
+    def _build_search_context(self, results_dict: dict) -> str:
         search_context = []
-        search_query = kwargs.get("search_query")
-        search = GoogleSearch(
-            {
-                "q": search_query,
-                "hl": "en",
-                "gl": "us",
-                "api_key": os.getenv("SERPAPI_API_KEY"),
-            }
-        )
-        results_dict = search.get_dict()
         # add answer box to search context
         if "answer_box" in results_dict:
             search_context.append(
@@ -181,22 +211,38 @@ class SerpSearchTool(BaseTool):
             """
                 )
             )
-        # add organic results to search context
-        if "organic_results" in results_dict:
-            for result in results_dict["organic_results"]:
-                page_content = self._get_page_content(result["link"])
-                search_context.append(
-                    dedent(
-                        f"""
-                Title: {result["title"]}
-                Link: {result["link"]}
-                Snippet: {result["snippet"]}
-                Content: {page_content}
-                """
-                    )
+        # add organic results to search context in result order
+        organic_results = results_dict.get("organic_results", [])
+        page_contents = self._get_page_contents(
+            [result["link"] for result in organic_results]
+        )
+        for result, page_content in zip(organic_results, page_contents):
+            search_context.append(
+                dedent(
+                    f"""
+            Title: {result["title"]}
+            Link: {result["link"]}
+            Snippet: {result["snippet"]}
+            Content: {page_content}
+            """
                 )
+            )
         return check_context_limit("\n".join(search_context))
 
+    def _run(self, **kwargs: Any) -> Any:
+        if os.getenv("SERPAPI_API_KEY") is None:
+            raise ValueError("SERPAPI_API_KEY is not set in environment variables")
+        search_query = kwargs.get("search_query")
+        results_dict = serp_search(
+            {
+                "q": search_query,
+                "hl": "en",
+                "gl": "us",
+                "api_key": os.getenv("SERPAPI_API_KEY"),
+            }
+        )
+        return self._build_search_context(results_dict)
+
 
 # SERP Bing Search Tool
 class SerpBingSearchTool(SerpSearchTool):
@@ -217,9 +263,8 @@ class SerpBingSearchTool(SerpSearchTool):
     def _run(self, **kwargs: Any) -> Any:
         if os.getenv("SERPAPI_API_KEY") is None:
             raise ValueError("SERPAPI_API_KEY is not set in environment variables")
-        search_context = []
         search_query = kwargs.get("search_query")
-        search = GoogleSearch(
+        results_dict = serp_search(
             {
                 "engine": "bing",
                 "q": search_query,
@@ -227,32 +272,7 @@ class SerpBingSearchTool(SerpSearchTool):
                 "api_key": os.getenv("SERPAPI_API_KEY"),
             }
         )
-        results_dict = search.get_dict()
-        # add answer box to search context
-        if "answer_box" in results_dict:
-            search_context.append(
-                dedent(
-                    f"""
-            Answer Box: {results_dict["answer_box"]["answer"] if "answer" in results_dict["answer_box"] else "No answer found"}
-            Answer Box Source Link: {results_dict["answer_box"]["displayed_link"] if "displayed_link" in results_dict["answer_box"] else "No source link found"}
-            """
-                )
-            )
-        # add organic results to search context
-        if "organic_results" in results_dict:
-            for result in results_dict["organic_results"]:
-                page_content = self._get_page_content(result["link"])
-                search_context.append(
-                    dedent(
-                        f"""
-                Title: {result["title"]}
-                Link: {result["link"]}
-                Snippet: {result["snippet"]}
-                Content: {page_content}
-                """
-                    )
-                )
-        return check_context_limit("\n".join(search_context))
+        return self._build_search_context(results_dict)
 
 
 class ApolloPersonDomainSearchTool(BaseTool):
@@ -383,7 +403,7 @@ class SerpBingSearchCacheTool(SerpBingSearchTool):
         self._cache = Redis.from_url(os.getenv("REDIS_TOOL_CACHE_URL"))
 
     def _get_page_content(self, url: str) -> str:
-        response = send_request_with_cache(
+        content = send_request_with_cache(
             url=url,
             method="GET",
             cache=self._cache,
@@ -391,7 +411,6 @@ class SerpBingSearchCacheTool(SerpBingSearchTool):
             cookies=self.cookies,
             timeout=30,
         )
-        content = clean_html(response=response)
         return check_context_limit(content)
 
 
@@ -622,7 +641,7 @@ class SerpBingSearchOxylabsCacheTool(SerpSearchTool):
 
     def _get_page_content(self, url: str) -> str:
         # check cache for url
-        response = send_request_proxy_with_cache(
+        content = send_request_proxy_with_cache(
             url=url,
             method="GET",
             oxylabs_username=os.getenv("OXYLABS_USERNAME"),
@@ -632,5 +651,4 @@ class SerpBingSearchOxylabsCacheTool(SerpSearchTool):
             cookies=self.cookies,
             timeout=30,
         )
-        content = clean_html(response=response)
         return check_context_limit(content)
@@ -5,10 +5,16 @@ from conductor.reports.pydantic_templates import bulleted
 from conductor.reports.pydantic_templates import narrative
 from conductor.crews.models import TaskRun
 from conductor.models import NamedTask
-import requests
-from requests.models import Response
+from conductor.http import (
+    MAX_RESPONSE_BYTES,
+    TEXT_KINDS,
+    UnsupportedContent,
+    http_client,
+    oxylabs_proxy_url,
+)
+from httpx import Response
+from conductor.rag.extract import default_parse_executor
 from redis import Redis
-from bs4 import BeautifulSoup
 
 
 def write_report_prompt(
@@ -62,10 +68,19 @@ def send_request_with_cache(
         return cached_content.decode("utf-8")
     # if not in redis, send request
     else:
-        response = requests.request(
-            method=method, url=url, headers=headers, cookies=cookies, timeout=timeout
-        )
-        if response.ok:
+        try:
+            response = http_client.request(
+                method=method,
+                url=url,
+                headers=headers,
+                cookies=cookies,
+                timeout=timeout,
+                max_bytes=MAX_RESPONSE_BYTES,
+                accept=TEXT_KINDS,
+            )
+        except UnsupportedContent:
+            return f"Error: Unable to fetch page content for {url}."
+        if response.is_success:
             clean_content = clean_html(response)
             cache.set(url, clean_content, ex=60 * 5)
             return clean_content
@@ -86,12 +101,14 @@ def oxylabs_request(
     """
     Run Oxylabs request
     """
-    response = requests.request(
+    response = http_client.request(
         method=method,
-        proxies={
-            "http": f"http://{oxylabs_username}:{oxylabs_password}@{oxylabs_country}.oxylabs.io:{oxylabs_port}",
-            "https": f"https://{oxylabs_username}:{oxylabs_password}@{oxylabs_country}.oxylabs.io:{oxylabs_port}",
-        },
+        proxy=oxylabs_proxy_url(
+            username=oxylabs_username,
+            password=oxylabs_password,
+            country=oxylabs_country,
+            port=oxylabs_port,
+        ),
         headers=headers,
         cookies=cookies,
         **kwargs,
@@ -130,7 +147,7 @@ def send_request_proxy(
         print(e)
         try:
             print("Trying normal request ...")
-            page = requests.request(method=method, url=url, **kwargs)
+            page = http_client.request(method=method, url=url, **kwargs)
             return page
         except Exception as e:
             print("Normal request failed, returning error message.")
@@ -139,12 +156,8 @@ def send_request_proxy(
 
 
 def clean_html(response: Response) -> str:
-    parsed = BeautifulSoup(response.content, "html.parser", from_encoding="iso-8859-1")
-    text = parsed.get_text()
-    text = "\n".join([i for i in text.split("\n") if i.strip() != ""])
-    text = " ".join([i for i in text.split(" ") if i.strip() != ""])
-    # remove all the special characters using regex
-    # text = re.sub(r"[^a-zA-Z0-9\s]", "", text)
+    # main content without navigation and footers, bytes are decoded with the page's charset
+    text = default_parse_executor().extract(response.content).text
     return f"Link: {response.url} \n Content: {text}"
 
 
@@ -173,7 +186,7 @@ def send_request_proxy_with_cache(
             timeout=timeout,
             **kwargs,
         )
-        if isinstance(content, Response) and content.ok:
+        if isinstance(content, Response) and content.is_success:
             clean_content = clean_html(content)
             cache.set(url, clean_content)
             return clean_content
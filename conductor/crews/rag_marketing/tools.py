@@ -7,21 +7,24 @@ from crewai_tools.tools import ScrapeWebsiteTool
 from crewai_tools.tools.base_tool import BaseTool
 from pydantic.v1 import BaseModel, Field
 from typing import Optional, Any, Type
+from concurrent.futures import ThreadPoolExecutor
 from conductor.crews.marketing.tools import (
     ScrapeWebsiteToolSchema,
     SerpSearchToolSchema,
 )
-from conductor.rag.ingest import url_to_db
+from conductor.rag.ingest import ingest_url
+from conductor.rag.engine import run_ingest_engine
 from conductor.rag.client import ElasticsearchRetrieverClient
+from conductor.rag.ranking import bm25_scores, reciprocal_rank_fusion
+from conductor.rag.urls import normalize_url
 from elasticsearch import Elasticsearch
-from conductor.rag.embeddings import BedrockEmbeddings
+from conductor.rag.embeddings import cached_bedrock_embeddings
 from conductor.rag.utils import (
     get_page_content_with_source_url,
     get_content_and_source_from_response,
 )
-from serpapi import GoogleSearch
+from conductor.serp import serp_search
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
 class FixedVectorSearchToolSchema(BaseModel):
@@ -61,31 +64,36 @@ def ingest(
     cookies: dict = None,
 ):
     print(f"Ingesting data for {url} ...")
-    existing_document = client.find_document_by_url(url=url)
-    if existing_document["hits"]["total"]["value"] > 0:
+    if client.document_exists(url=url):
         return "Document already exists in the vector database"
     else:
-        webpage = url_to_db(
+        result = ingest_url(
             url=url, client=client, headers=headers, cookies=cookies, timeout=10
         )
-        return f"New documents added: {', '.join(webpage)}"
+        return result.to_message()
 
 
 # parallelized ingest function
 def parallel_ingest(urls, client, headers=None, cookies=None):
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = {
-            executor.submit(ingest, client, url, headers, cookies): url for url in urls
-        }
-        results = []
-        for future in as_completed(futures):
-            url = futures[future]
-            try:
-                result = future.result()
-                results.append(result)
-            except Exception:
-                results.append(f"Error processing: {url}")
-    return results
+    # check the whole batch in one round trip and only fetch each new page once
+    existing = client.exists_many(urls)
+    new_urls, seen = [], set()
+    for url in urls:
+        if not existing[url] and normalize_url(url) not in seen:
+            seen.add(normalize_url(url))
+            new_urls.append(url)
+    results = run_ingest_engine(
+        urls=new_urls,
+        client=client,
+        headers=headers,
+        cookies=cookies,
+        skip_existing=False,
+    )
+    messages = {result.url: result.to_message() for result in results}
+    return [
+        messages.get(url, "Document already exists in the vector database")
+        for url in urls
+    ]
 
 
 class ScrapeWebsiteIngestTool(ScrapeWebsiteTool):
@@ -110,13 +118,20 @@ class ScrapeWebsiteIngestTool(ScrapeWebsiteTool):
         index_name: str,
         website_url: Optional[str] = None,
         cookies: Optional[dict] = None,
+        run_id: Optional[str] = None,
+        routing: bool = False,
+        write_behind: bool = False,
         **kwargs,
     ):
         super().__init__(**kwargs)
         self._vector_database = ElasticsearchRetrieverClient(
             elasticsearch=elasticsearch,
-            embeddings=BedrockEmbeddings(),
+            embeddings=cached_bedrock_embeddings(),
             index_name=index_name,
+            run_id=run_id,
+            routing=routing,
+            deduplicate=True,
+            write_behind=write_behind,
         )
         if website_url is not None:
             self.website_url = website_url
@@ -140,6 +155,12 @@ class ScrapeWebsiteIngestTool(ScrapeWebsiteTool):
             cookies=self.cookies,
         )
 
+    def close(self) -> None:
+        """
+        Write buffered documents and release the write-behind buffer
+        """
+        self._vector_database.close()
+
 
 class ScrapeWebsiteWithContentIngestTool(ScrapeWebsiteTool):
     name: str = "Get website content to add to the vector database"
@@ -163,13 +184,20 @@ class ScrapeWebsiteWithContentIngestTool(ScrapeWebsiteTool):
         index_name: str,
         website_url: Optional[str] = None,
         cookies: Optional[dict] = None,
+        run_id: Optional[str] = None,
+        routing: bool = False,
+        write_behind: bool = False,
         **kwargs,
     ):
         super().__init__(**kwargs)
         self._vector_database = ElasticsearchRetrieverClient(
             elasticsearch=elasticsearch,
-            embeddings=BedrockEmbeddings(),
+            embeddings=cached_bedrock_embeddings(),
             index_name=index_name,
+            run_id=run_id,
+            routing=routing,
+            deduplicate=True,
+            write_behind=write_behind,
         )
         if website_url is not None:
             self.website_url = website_url
@@ -202,6 +230,12 @@ class ScrapeWebsiteWithContentIngestTool(ScrapeWebsiteTool):
             except Exception as e:
                 print(e)
 
+    def close(self) -> None:
+        """
+        Write buffered documents and release the write-behind buffer
+        """
+        self._vector_database.close()
+
 
 class VectorSearchTool(BaseTool):
     """
@@ -220,13 +254,17 @@ class VectorSearchTool(BaseTool):
         elasticsearch: Elasticsearch,
         index_name: str,
         search_query: Optional[str] = None,
+        run_id: Optional[str] = None,
+        routing: bool = False,
         **kwargs,
     ) -> None:
         super().__init__(**kwargs)
         self._vector_database = ElasticsearchRetrieverClient(
             elasticsearch=elasticsearch,
-            embeddings=BedrockEmbeddings(),
+            embeddings=cached_bedrock_embeddings(),
             index_name=index_name,
+            run_id=run_id,
+            routing=routing,
         )
         if search_query is not None:
             self.search_query = search_query
@@ -239,9 +277,7 @@ class VectorSearchTool(BaseTool):
         **kwargs: Any,
     ) -> Any:
         search_query = kwargs.get("search_query", self.search_query)
-        documents = self._vector_database.store.similarity_search(
-            query=search_query, k=5
-        )
+        documents = self._vector_database.similarity_search(query=search_query, k=5)
         return "\n".join(
             [get_page_content_with_source_url(document) for document in documents]
         )
@@ -264,13 +300,19 @@ class VectorSearchMetaTool(BaseTool):
         elasticsearch: Elasticsearch,
         index_name: str,
         url: Optional[str] = None,
+        run_id: Optional[str] = None,
+        routing: bool = False,
         **kwargs,
     ) -> None:
         super().__init__(**kwargs)
         self._vector_database = ElasticsearchRetrieverClient(
             elasticsearch=elasticsearch,
-            embeddings=BedrockEmbeddings(),
+            embeddings=cached_bedrock_embeddings(),
             index_name=index_name,
+            run_id=run_id,
+            routing=routing,
+            # resolves near-duplicate aliases to their canonical webpage
+            deduplicate=True,
         )
         if url is not None:
             self.url = url
@@ -293,6 +335,11 @@ class SerpSearchEngineIngestTool(BaseTool):
     description: str = "A tool that can be used to ingest search engine query results into a vector database."
     args_schema: Type[BaseModel] = SerpSearchToolSchema
     search_query: Optional[str] = None
+    # number of unique urls ingested from the merged search results
+    max_results: int = 10
+    # minimum BM25 score of a result's title and snippet against the query, None keeps
+    # every result
+    min_relevance: Optional[float] = None
     headers: Optional[dict] = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36",
         "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9",
@@ -308,13 +355,20 @@ class SerpSearchEngineIngestTool(BaseTool):
         elasticsearch: Elasticsearch,
         index_name: str,
         search_query: Optional[str] = None,
+        run_id: Optional[str] = None,
+        routing: bool = False,
+        write_behind: bool = False,
         **kwargs,
     ) -> None:
         super().__init__(**kwargs)
         self._vector_database = ElasticsearchRetrieverClient(
             elasticsearch=elasticsearch,
-            embeddings=BedrockEmbeddings(),
+            embeddings=cached_bedrock_embeddings(),
             index_name=index_name,
+            run_id=run_id,
+            routing=routing,
+            deduplicate=True,
+            write_behind=write_behind,
         )
         if search_query is not None:
             self.search_query = search_query
@@ -332,48 +386,87 @@ class SerpSearchEngineIngestTool(BaseTool):
         except Exception:
             return f"Error ingesting {url}"
 
-    def _parallel_ingest_page_content(self, search_results: list[dict]) -> list[str]:
-        urls = []
-        for search_engine_result in search_results:
-            if "organic_results" in search_engine_result:
-                for result in search_engine_result["organic_results"]:
-                    urls.append(result["link"])
+    def _rank_urls(
+        self, search_results: list[dict], search_query: str = None
+    ) -> list[str]:
+        """
+        Merge the organic results of every engine by normalized URL and keep the most relevant ones
+        """
+        rankings = [
+            search_engine_result.get("organic_results", [])
+            for search_engine_result in search_results
+        ]
+        ranked = [
+            result
+            for result, _ in reciprocal_rank_fusion(
+                rankings, key=lambda result: normalize_url(result["link"])
+            )
+        ]
+        # score titles and snippets before fetching anything, ties keep the combined rank
+        # so results that share no term with the query stay in their fused order
+        if search_query:
+            scores = bm25_scores(
+                search_query,
+                [
+                    f"{result.get('title', '')} {result.get('snippet', '')}"
+                    for result in ranked
+                ],
+            )
+            ranked = [
+                result
+                for result, score in sorted(
+                    zip(ranked, scores), key=lambda pair: pair[1], reverse=True
+                )
+                if self.min_relevance is None or score > self.min_relevance
+            ]
+        return [result["link"] for result in ranked[: self.max_results]]
+
+    def _parallel_ingest_page_content(
+        self, search_results: list[dict], search_query: str = None
+    ) -> list[str]:
+        urls = self._rank_urls(search_results, search_query=search_query)
         results = parallel_ingest(urls, self._vector_database, headers=self.headers)
         return "\n".join(results)
 
-    def _ingest_search_results(self, search_results: list[dict]) -> str:
+    def _ingest_search_results(
+        self, search_results: list[dict], search_query: str = None
+    ) -> str:
         all_results = []
-        for search_engine_result in search_results:
-            if "organic_results" in search_engine_result:
-                for result in search_engine_result["organic_results"]:
-                    ingested_document = self._ingest_page_content(result["link"])
-                    all_results.append(ingested_document)
+        for url in self._rank_urls(search_results, search_query=search_query):
+            ingested_document = self._ingest_page_content(url)
+            all_results.append(ingested_document)
         return "\n".join(all_results)
 
     def _run(self, **kwargs: Any) -> Any:
         if os.getenv("SERPAPI_API_KEY") is None:
             raise ValueError("SERPAPI_API_KEY is not set in environment variables")
         search_query = kwargs.get("search_query")
-        # run google search
-        search = GoogleSearch(
+        searches = [
+            # google search
             {
                 "q": search_query,
                 "hl": "en",
                 "gl": "us",
                 "api_key": os.getenv("SERPAPI_API_KEY"),
-            }
-        )
-        google_results_dict = search.get_dict()
-        # run bing search
-        search = GoogleSearch(
+            },
+            # bing search
             {
                 "engine": "bing",
                 "q": search_query,
                 "cc": "US",
                 "api_key": os.getenv("SERPAPI_API_KEY"),
-            }
-        )
-        bing_results_dict = search.get_dict()
-        all_results = [google_results_dict, bing_results_dict]
+            },
+        ]
+        # query both engines at the same time
+        with ThreadPoolExecutor(max_workers=len(searches)) as executor:
+            all_results = list(executor.map(serp_search, searches))
         # ingest search results
-        return self._parallel_ingest_page_content(all_results)
+        return self._parallel_ingest_page_content(
+            all_results, search_query=search_query
+        )
+
+    def close(self) -> None:
+        """
+        Write buffered documents and release the write-behind buffer
+        """
+        self._vector_database.close()
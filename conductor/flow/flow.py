@@ -10,7 +10,7 @@ The first thing I will need is an crewai agent factory
 """
 from crewai.flow.flow import Flow, listen, start
 from crewai.crew import CrewOutput
-from typing import Union
+from typing import Optional, Union
 from elasticsearch import Elasticsearch
 from pydantic import BaseModel, InstanceOf
 from crewai import LLM
@@ -20,6 +20,7 @@ from conductor.builder.agent import ResearchTeamTemplate
 from conductor.flow import models, specify, runner, retriever, builders, research, team
 from conductor.flow.utils import build_organization_determination_crew
 from conductor.crews.rag_marketing import tools
+from conductor.rag.indices import check_mapping_version, mapping_version
 from langchain_core.embeddings import Embeddings
 
 
@@ -49,6 +50,8 @@ class ResearchFlow(Flow[ResearchFlowState]):
         elasticsearch: Elasticsearch,
         index_name: str,
         llm: LLM,
+        run_id: Optional[str] = None,
+        routing: bool = False,
         **kwargs,
     ) -> None:
         super().__init__(**kwargs)
@@ -58,6 +61,8 @@ class ResearchFlow(Flow[ResearchFlowState]):
             elasticsearch=elasticsearch,
             index_name=index_name,
             llm=llm,
+            run_id=run_id,
+            routing=routing,
         )
         self.research_team = research_team
 
@@ -143,6 +148,7 @@ def run_search_flow(flow: InstanceOf[SearchFlow]) -> list[runner.SearchTeamAnswe
 class RunResult(BaseModel):
     research: list[CrewOutput]
     search: list[runner.SearchTeamAnswers]
+    run_id: Optional[str] = None
 
 
 def run_research_and_search(
@@ -152,6 +158,8 @@ def run_research_and_search(
     elasticsearch: Elasticsearch,
     index_name: str,
     embeddings: InstanceOf[Embeddings],
+    run_id: Optional[str] = None,
+    routing: bool = False,
 ) -> RunResult:
     """
     Executes the research and search flow for a given website URL.
@@ -161,18 +169,29 @@ def run_research_and_search(
         research_team (ResearchTeamTemplate): The template for building the research team.
         elasticsearch (Elasticsearch): The Elasticsearch client instance.
         index_name (str): The name of the Elasticsearch index.
+        run_id (str, optional): Identifier stamped on the ingested documents and used to filter retrieval, pass a subject id to share documents between runs. Defaults to None, which reads and writes the whole index.
+        routing (bool, optional): Route the run's documents to a single shard. Defaults to False.
     Returns:
         RunResult: An object containing the results of the research and search flows.
     """
+    # run scoped tools swallow errors, so an index that can't filter on run ids fails here
+    if run_id is not None and elasticsearch.indices.exists(index=index_name):
+        check_mapping_version(
+            index_name, mapping_version(elasticsearch, index_name), run_scoped=True
+        )
     # research
+    # the research team's writes are buffered and flushed once research is done
+    ingest_tool = tools.SerpSearchEngineIngestTool(
+        elasticsearch=elasticsearch,
+        index_name=index_name,
+        run_id=run_id,
+        routing=routing,
+        write_behind=True,
+    )
     built_research_team = builders.build_team_from_template(
         team_template=research_team,
         llm=research_llm,
-        tools=[
-            tools.SerpSearchEngineIngestTool(
-                elasticsearch=elasticsearch, index_name=index_name
-            )
-        ],
+        tools=[ingest_tool],
         agent_factory=research.ResearchAgentFactory,
         task_factory=research.ResearchQuestionAgentSearchTaskFactory,
         team_factory=team.ResearchTeamFactory,
@@ -183,16 +202,26 @@ def run_research_and_search(
         elasticsearch=elasticsearch,
         index_name=index_name,
         llm=research_llm,
+        run_id=run_id,
+        routing=routing,
     )
-    research_results = run_flow(flow=research_flow)
+    try:
+        research_results = run_flow(flow=research_flow)
+    finally:
+        # search reads with its own client, so it only sees flushed documents
+        ingest_tool.close()
     # search
     search_team = builders.build_search_team_from_template(team=research_team)
     search_flow = SearchFlow(
         search_team=search_team,
         organization_determination=research_flow.state.organization_determination,
         elastic_retriever=retriever.ElasticRMClient(
-            elasticsearch=elasticsearch, index_name=index_name, embeddings=embeddings
+            elasticsearch=elasticsearch,
+            index_name=index_name,
+            embeddings=embeddings,
+            run_id=run_id,
+            routing=routing,
         ),
     )
     answers = run_search_flow(flow=search_flow)
-    return RunResult(research=research_results, search=answers)
+    return RunResult(research=research_results, search=answers, run_id=run_id)
@@ -1,8 +1,13 @@
 """
 DSPy retriever module for Evrim for custom RAG pipeline
 """
-from conductor.rag.client import ElasticsearchRetrieverClient
-from elasticsearch import Elasticsearch
+from conductor.rag.client import (
+    AsyncElasticsearchRetrieverClient,
+    ElasticsearchRetrieverClient,
+    async_elasticsearch_client,
+)
+from conductor.rag.hybrid import HybridSearch
+from elasticsearch import AsyncElasticsearch, Elasticsearch
 from langchain_core.embeddings import Embeddings
 from langchain_core.documents import Document
 import dspy
@@ -18,14 +23,41 @@ class ElasticRMClient(dspy.Retrieve):
         index_name: str,
         cohere_api_key: str = None,
         k: int = 3,
+        async_elasticsearch: AsyncElasticsearch = None,
+        hybrid: HybridSearch = None,
+        run_id: str = None,
+        routing: bool = False,
     ) -> None:
         super().__init__(k=k)
+        # a run id keeps retrieval to the documents ingested for the run
         self.client = ElasticsearchRetrieverClient(
             elasticsearch=elasticsearch,
             embeddings=embeddings,
             index_name=index_name,
+            run_id=run_id,
+            routing=routing,
         )
         self.cohere_api_key = cohere_api_key
+        # hybrid retrieval finds exact terms itself, so it replaces the rerank round trip
+        self.hybrid = hybrid
+        # built with the sync client's settings, see async_elasticsearch_client
+        self._async_elasticsearch = async_elasticsearch
+        self._async_client: Optional[AsyncElasticsearchRetrieverClient] = None
+
+    @property
+    def async_client(self) -> AsyncElasticsearchRetrieverClient:
+        """
+        Async client sharing one connection pool between concurrent aforward calls, created on first use
+        """
+        if self._async_client is None:
+            self._async_client = AsyncElasticsearchRetrieverClient(
+                elasticsearch=self._async_elasticsearch or async_elasticsearch_client(),
+                embeddings=self.client.embeddings,
+                index_name=self.client.index_name,
+                run_id=self.client.run_id,
+                routing=self.client.routing is not None,
+            )
+        return self._async_client
 
     def _rerank(
         self,
@@ -57,6 +89,25 @@ class ElasticRMClient(dspy.Retrieve):
             reranked_documents.append(documents[result.index])
         return reranked_documents
 
+    async def _arerank(
+        self,
+        query: str,
+        documents: List[Document],
+        model: str = "rerank-english-v3.0",
+        top_n: int = 3,
+    ) -> List[Document]:
+        """
+        Rerank documents with the async Cohere client
+        """
+        co = cohere.AsyncClientV2(self.cohere_api_key)
+        reranked_indexes = await co.rerank(
+            query=query,
+            model=model,
+            documents=[document.page_content for document in documents],
+            top_n=top_n,
+        )
+        return [documents[result.index] for result in reranked_indexes.results]
+
     def _format_documents(self, documents: List[Document]) -> List[dict]:
         transformed_documents = []
         for document in documents:
@@ -73,9 +124,38 @@ class ElasticRMClient(dspy.Retrieve):
         return reranked_documents
 
     def forward(self, query: str, k: Optional[int] = 3, **kwargs) -> dspy.Prediction:
-        if self.cohere_api_key:
+        if self.hybrid:
+            documents = self.client.hybrid_search(
+                query=query, k=k, settings=self.hybrid
+            )
+        elif self.cohere_api_key:
             documents = self._rerank_documents(query, k=k)
         else:
             documents = self.client.similarity_search(query=query, k=k)
         transformed_documents = self._format_documents(documents)
         return dspy.Prediction(documents=transformed_documents)
+
+    async def aforward(
+        self, query: str, k: Optional[int] = 3, **kwargs
+    ) -> dspy.Prediction:
+        """
+        Retrieve on the event loop, so many concurrent retrievals don't each need a thread
+        """
+        if self.hybrid:
+            documents = await self.async_client.ahybrid_search(
+                query=query, k=k, settings=self.hybrid
+            )
+        elif self.cohere_api_key:
+            initial_documents = await self.async_client.asimilarity_search(
+                query=query, k=10
+            )
+            documents = await self._arerank(query=query, documents=initial_documents)
+        else:
+            documents = await self.async_client.asimilarity_search(query=query, k=k)
+        transformed_documents = self._format_documents(documents)
+        return dspy.Prediction(documents=transformed_documents)
+
+    async def aclose(self) -> None:
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
@@ -1,10 +1,16 @@
 from elasticsearch import Elasticsearch
 from crewai import LLM, Task, Agent, Crew
 from conductor.crews.rag_marketing import tools
+from typing import Optional
 
 
 def build_organization_determination_crew(
-    website_url: str, elasticsearch: Elasticsearch, index_name: str, llm: LLM
+    website_url: str,
+    elasticsearch: Elasticsearch,
+    index_name: str,
+    llm: LLM,
+    run_id: Optional[str] = None,
+    routing: bool = False,
 ):
     organization_determination_agent = Agent(
         role="Organization Determination Agent",
@@ -14,6 +20,8 @@ def build_organization_determination_crew(
             tools.ScrapeWebsiteWithContentIngestTool(
                 elasticsearch=elasticsearch,
                 index_name=index_name,
+                run_id=run_id,
+                routing=routing,
             )
         ],
         allow_delegation=False,
@@ -0,0 +1,248 @@
+"""
+Failure memory for scraping
+- Failed URLs are not retried until an exponentially growing window has passed
+- Error rate and p95 latency are tracked per domain over the most recent fetches
+- Domains that keep failing are short-circuited, with a probe let through after a cooldown
+- Slow domains are fetched last
+"""
+from conductor.http import UnsupportedContent
+from conductor.rag.urls import normalize_url
+from pydantic import BaseModel, Field
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Iterator, Optional
+from urllib.parse import urlparse
+import logging
+import math
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class FetchSkipped(Exception):
+    """
+    Raised instead of fetching a URL or domain that failed recently
+    """
+
+
+class FailureCache:
+    """
+    Remember failed URLs with an exponential retry window per URL
+    """
+
+    def __init__(
+        self,
+        base_delay: float = 60.0,
+        max_delay: float = 6 * 3600,
+        max_size: int = 10000,
+    ) -> None:
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_size = max_size
+        # normalized url -> (consecutive failures, retry at, reason)
+        self._entries: OrderedDict[str, tuple[int, float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record_failure(self, url: str, reason: str) -> float:
+        """
+        Record a failed fetch, returns the seconds until the URL is tried again
+        """
+        key = normalize_url(url)
+        with self._lock:
+            failures = self._entries.pop(key, (0, 0.0, ""))[0] + 1
+            delay = min(self.base_delay * 2 ** (failures - 1), self.max_delay)
+            self._entries[key] = (failures, time.monotonic() + delay, reason)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return delay
+
+    def record_success(self, url: str) -> None:
+        with self._lock:
+            self._entries.pop(normalize_url(url), None)
+
+    def retry_in(self, url: str) -> Optional[tuple[float, str]]:
+        """
+        Seconds until a failed URL may be fetched again and why it failed, None if it may be fetched now
+        """
+        with self._lock:
+            entry = self._entries.get(normalize_url(url))
+        if entry is None:
+            return None
+        remaining = entry[1] - time.monotonic()
+        return (remaining, entry[2]) if remaining > 0 else None
+
+
+class DomainHealth(BaseModel):
+    requests: int = Field(default=0, description="Number of recent fetches")
+    error_rate: float = Field(
+        default=0.0, description="Share of recent fetches that failed"
+    )
+    p95_seconds: float = Field(
+        default=0.0, description="95th percentile latency of recent fetches"
+    )
+    healthy: bool = Field(default=True, description="Whether the domain is fetched")
+    skipped: int = Field(default=0, description="Number of fetches short-circuited")
+
+
+class DomainHealthTracker:
+    """
+    Error rate and latency of the most recent fetches of each domain
+    """
+
+    def __init__(
+        self,
+        window: int = 50,
+        min_requests: int = 5,
+        max_error_rate: float = 0.8,
+        slow_seconds: float = 15.0,
+        cooldown: float = 600.0,
+    ) -> None:
+        self.window = window
+        self.min_requests = min_requests
+        self.max_error_rate = max_error_rate
+        self.slow_seconds = slow_seconds
+        self.cooldown = cooldown
+        # domain -> recent (seconds, ok) outcomes
+        self._outcomes: dict[str, deque[tuple[float, bool]]] = {}
+        self._last_attempt: dict[str, float] = {}
+        self._skipped: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _domain(url: str) -> str:
+        return urlparse(url).netloc.lower()
+
+    def record(self, url: str, seconds: float, ok: bool) -> None:
+        domain = self._domain(url)
+        with self._lock:
+            outcomes = self._outcomes.setdefault(domain, deque(maxlen=self.window))
+            outcomes.append((seconds, ok))
+            self._last_attempt[domain] = time.monotonic()
+
+    def _health(self, domain: str) -> DomainHealth:
+        outcomes = self._outcomes.get(domain)
+        if not outcomes:
+            return DomainHealth(skipped=self._skipped.get(domain, 0))
+        latencies = sorted(seconds for seconds, _ in outcomes)
+        error_rate = sum(1 for _, ok in outcomes if not ok) / len(outcomes)
+        return DomainHealth(
+            requests=len(outcomes),
+            error_rate=error_rate,
+            p95_seconds=latencies[math.ceil(0.95 * len(latencies)) - 1],
+            healthy=len(outcomes) < self.min_requests
+            or error_rate < self.max_error_rate,
+            skipped=self._skipped.get(domain, 0),
+        )
+
+    def health(self, url: str) -> DomainHealth:
+        with self._lock:
+            return self._health(self._domain(url))
+
+    def allow(self, url: str) -> bool:
+        """
+        Whether a URL's domain may be fetched, failing domains get one probe per cooldown
+        """
+        domain = self._domain(url)
+        with self._lock:
+            if self._health(domain).healthy:
+                return True
+            if time.monotonic() - self._last_attempt.get(domain, 0.0) >= self.cooldown:
+                # claim the probe so concurrent fetches keep skipping
+                self._last_attempt[domain] = time.monotonic()
+                return True
+            self._skipped[domain] = self._skipped.get(domain, 0) + 1
+            return False
+
+    def priority(self, url: str) -> tuple[bool, bool, float]:
+        """
+        Sort key that puts failing and slow domains last
+        """
+        health = self.health(url)
+        return (
+            not health.healthy,
+            health.p95_seconds >= self.slow_seconds,
+            health.error_rate,
+        )
+
+    def prioritize(self, urls: list[str]) -> list[str]:
+        return sorted(urls, key=self.priority)
+
+    def snapshot(self) -> dict[str, DomainHealth]:
+        with self._lock:
+            return {domain: self._health(domain) for domain in self._outcomes}
+
+
+class ScrapeGuard:
+    """
+    Skip URLs and domains that failed recently and learn from every fetch
+    """
+
+    def __init__(
+        self,
+        failures: FailureCache = None,
+        domains: DomainHealthTracker = None,
+    ) -> None:
+        self.failures = failures if failures else FailureCache()
+        self.domains = domains if domains else DomainHealthTracker()
+        self.counts = {
+            "fetched": 0,
+            "failed": 0,
+            "skipped_urls": 0,
+            "skipped_domains": 0,
+        }
+        self._lock = threading.Lock()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+    def check(self, url: str) -> None:
+        """
+        Raise FetchSkipped if the URL or its domain should not be fetched now
+        """
+        retry = self.failures.retry_in(url)
+        if retry is not None:
+            self._count("skipped_urls")
+            raise FetchSkipped(
+                f"{url} failed recently ({retry[1]}), retrying in {retry[0]:.0f} seconds"
+            )
+        if not self.domains.allow(url):
+            self._count("skipped_domains")
+            raise FetchSkipped(f"{urlparse(url).netloc} is failing, skipping {url}")
+
+    @contextmanager
+    def track(self, url: str) -> Iterator[None]:
+        """
+        Check a URL, then record the outcome and latency of the fetch in the block
+        """
+        self.check(url)
+        started = time.perf_counter()
+        try:
+            yield
+        except UnsupportedContent:
+            # the server answered fine, the resource just isn't a webpage
+            self.domains.record(url, time.perf_counter() - started, ok=True)
+            raise
+        except Exception as e:
+            self.domains.record(url, time.perf_counter() - started, ok=False)
+            delay = self.failures.record_failure(url, reason=str(e) or type(e).__name__)
+            self._count("failed")
+            logger.info(f"Fetching {url} failed, not retrying for {delay:.0f} seconds")
+            raise
+        self.domains.record(url, time.perf_counter() - started, ok=True)
+        self.failures.record_success(url)
+        self._count("fetched")
+
+    def snapshot(self) -> dict:
+        """
+        Counters and per-domain health for dashboards
+        """
+        with self._lock:
+            counts = dict(self.counts)
+        return {"counts": counts, "domains": self.domains.snapshot()}
+
+
+# shared so agents and ingests learn from each other's failures
+scrape_guard = ScrapeGuard()
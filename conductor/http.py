@@ -0,0 +1,540 @@
+"""
+Shared pooled HTTP client for scraping
+- Keep-alive connection pools with HTTP/2 and a connection limit per host
+- Retries with jittered exponential backoff and consistent timeouts
+- Requests can be routed through an HTTP proxy like Oxylabs or through the ZenRows API
+- Bytes, latency and status codes are recorded per host
+- Bodies can be streamed with a byte cap, sniffing the first bytes to reject unwanted content types
+"""
+from conductor.zen import zenrows_client
+from pydantic import BaseModel, Field
+from typing import BinaryIO, Optional
+from urllib.parse import urlparse
+import asyncio
+import logging
+import random
+import threading
+import time
+import httpx
+
+
+logger = logging.getLogger(__name__)
+
+
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+MAX_RESPONSE_BYTES = 5 * 1024 * 1024
+# content kinds that can be parsed as a webpage
+TEXT_KINDS = frozenset({"html", "text"})
+MAGIC_BYTES = [
+    (b"%PDF-", "pdf"),
+    (b"\x89PNG", "image"),
+    (b"\xff\xd8\xff", "image"),
+    (b"GIF8", "image"),
+    (b"PK\x03\x04", "archive"),
+    (b"\x1f\x8b", "archive"),
+]
+
+
+class ResponseTooLarge(Exception):
+    """
+    Raised when a download exceeds its byte limit
+    """
+
+    def __init__(self, url: str, max_bytes: int) -> None:
+        super().__init__(f"{url} is larger than {max_bytes} bytes")
+        self.url = url
+        self.max_bytes = max_bytes
+
+
+class UnsupportedContent(Exception):
+    """
+    Raised when a response is not a content kind the caller accepts
+    """
+
+    def __init__(self, url: str, kind: str) -> None:
+        super().__init__(f"{url} is {kind} content")
+        self.url = url
+        self.kind = kind
+
+
+def sniff_content(content_type: Optional[str], head: bytes) -> str:
+    """Detect the kind of a response from its first bytes and Content-Type
+
+    Args:
+        content_type (Optional[str]): Content-Type header
+        head (bytes): first bytes of the body
+
+    Returns:
+        str: one of html, text, pdf, image, archive or binary
+    """
+    # servers often send binary files with the wrong content type, trust the bytes first
+    for magic, kind in MAGIC_BYTES:
+        if head.startswith(magic):
+            return kind
+    if head[4:8] == b"ftyp" or (head.startswith(b"RIFF") and head[8:12] == b"WEBP"):
+        return "image"
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    if media_type in ("text/html", "application/xhtml+xml"):
+        return "html"
+    if media_type == "application/pdf":
+        return "pdf"
+    if media_type.startswith(("image/", "video/", "audio/")):
+        return "image" if media_type.startswith("image/") else "binary"
+    if head.lstrip()[:1] == b"<":
+        return "html"
+    if media_type.startswith("text/") or media_type.endswith(("xml", "json")):
+        return "text"
+    if media_type and media_type != "application/octet-stream":
+        return "binary"
+    # without a useful content type, decide by whether the bytes decode as text
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # a multibyte character may be cut off at the end of the head
+        if e.start < len(head) - 3:
+            return "binary"
+    return "text"
+
+
+def _capped_response(
+    response: httpx.Response, body: bytes, truncated: bool
+) -> httpx.Response:
+    # the body is already decoded, so drop the headers that describe the encoded body
+    headers = [
+        (name, value)
+        for name, value in response.headers.multi_items()
+        if name.lower() not in ("content-encoding", "content-length")
+    ]
+    return httpx.Response(
+        status_code=response.status_code,
+        headers=headers,
+        content=body,
+        request=response.request,
+        extensions=dict(response.extensions, truncated=truncated),
+    )
+
+
+class _BodyReader:
+    """
+    Collect a streamed body up to a byte cap, checking the kind on the first chunk
+    """
+
+    def __init__(
+        self,
+        url: str,
+        response: httpx.Response,
+        max_bytes: Optional[int],
+        accept: Optional[frozenset],
+    ) -> None:
+        self.url = url
+        self.response = response
+        self.max_bytes = max_bytes
+        # error pages are read as they are
+        self.accept = accept if response.is_success else None
+        self.chunks: list[bytes] = []
+        self.size = 0
+        self.truncated = False
+
+    def add(self, chunk: bytes) -> bool:
+        """
+        Add a chunk, returns False once the cap is reached
+        """
+        if not chunk:
+            return True
+        if not self.chunks and self.accept is not None:
+            kind = sniff_content(self.response.headers.get("content-type"), chunk)
+            if kind not in self.accept:
+                raise UnsupportedContent(self.url, kind)
+        if self.max_bytes is not None and self.size + len(chunk) > self.max_bytes:
+            chunk = chunk[: self.max_bytes - self.size]
+            self.truncated = True
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+        return not self.truncated
+
+    def result(self) -> httpx.Response:
+        if self.truncated:
+            logger.info(f"Truncated {self.url} at {self.max_bytes} bytes")
+        return _capped_response(self.response, b"".join(self.chunks), self.truncated)
+
+
+class HostStats(BaseModel):
+    requests: int = Field(default=0, description="Number of requests sent")
+    errors: int = Field(default=0, description="Number of requests without a response")
+    bytes: int = Field(default=0, description="Number of response body bytes received")
+    seconds: float = Field(default=0.0, description="Total request latency")
+    status_codes: dict[int, int] = Field(
+        default_factory=dict, description="Number of responses per status code"
+    )
+
+
+class HttpMetrics:
+    """
+    Request counters per host
+    """
+
+    def __init__(self) -> None:
+        self._hosts: dict[str, HostStats] = {}
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        host: str,
+        seconds: float,
+        response: Optional[httpx.Response] = None,
+        size: Optional[int] = None,
+    ) -> None:
+        with self._lock:
+            stats = self._hosts.setdefault(host, HostStats())
+            stats.requests += 1
+            stats.seconds += seconds
+            if response is None:
+                stats.errors += 1
+                return
+            # streamed responses pass the number of bytes read
+            stats.bytes += size if size is not None else len(response.content)
+            stats.status_codes[response.status_code] = (
+                stats.status_codes.get(response.status_code, 0) + 1
+            )
+
+    def snapshot(self) -> dict[str, HostStats]:
+        with self._lock:
+            return {
+                host: stats.model_copy(deep=True) for host, stats in self._hosts.items()
+            }
+
+
+def oxylabs_proxy_url(
+    username: str, password: str, country: str = "pr", port: int = 7777
+) -> str:
+    """
+    Proxy URL of the Oxylabs residential proxy
+    """
+    return f"http://{username}:{password}@{country}.oxylabs.io:{port}"
+
+
+def _cookie_header(headers: Optional[dict], cookies: Optional[dict]) -> Optional[dict]:
+    # per-request cookies are deprecated in httpx, send them as a header instead
+    if not cookies:
+        return headers
+    headers = dict(headers) if headers else {}
+    headers["Cookie"] = "; ".join(f"{name}={value}" for name, value in cookies.items())
+    return headers
+
+
+class HttpClient:
+    """
+    Pooled HTTP client shared by the scraping tools
+    """
+
+    def __init__(
+        self,
+        timeout: float = 10.0,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        per_host_limit: int = 8,
+        retries: int = 2,
+        backoff: float = 0.5,
+        http2: bool = True,
+        transport: httpx.BaseTransport = None,
+    ) -> None:
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        self.per_host_limit = per_host_limit
+        self.retries = retries
+        self.backoff = backoff
+        self.http2 = http2
+        self.transport = transport
+        self.metrics = HttpMetrics()
+        self._clients: dict[Optional[str], httpx.Client] = {}
+        self._host_semaphores: dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _client(self, proxy: Optional[str] = None) -> httpx.Client:
+        """
+        One pooled client per proxy, httpx binds proxies to clients
+        """
+        with self._lock:
+            if proxy not in self._clients:
+                self._clients[proxy] = httpx.Client(
+                    timeout=self.timeout,
+                    limits=self.limits,
+                    http2=self.http2,
+                    follow_redirects=True,
+                    proxy=proxy if self.transport is None else None,
+                    transport=self.transport,
+                )
+            return self._clients[proxy]
+
+    def async_client(self, **kwargs) -> httpx.AsyncClient:
+        """
+        Async client with the same settings, for use inside a single event loop
+        """
+        settings = dict(
+            timeout=self.timeout,
+            limits=self.limits,
+            http2=self.http2,
+            follow_redirects=True,
+            transport=self.transport,
+        )
+        settings.update(kwargs)
+        return httpx.AsyncClient(**settings)
+
+    def _host_semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.BoundedSemaphore(
+                    self.per_host_limit
+                )
+            return self._host_semaphores[host]
+
+    @staticmethod
+    def _route(
+        url: str,
+        params: Optional[dict],
+        headers: Optional[dict],
+        cookies: Optional[dict],
+        zenrows: Optional[dict],
+    ) -> dict:
+        if zenrows is None:
+            return dict(
+                url=url, params=params, headers=_cookie_header(headers, cookies)
+            )
+        # zenrows fetches the page itself, the target URL is a parameter
+        return dict(
+            url=zenrows_client.api_url,
+            params=dict(url=url, apikey=zenrows_client.apikey, **zenrows),
+        )
+
+    def _delay(self, attempt: int) -> float:
+        return random.uniform(0, self.backoff * 2**attempt)
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        headers: dict = None,
+        cookies: dict = None,
+        params: dict = None,
+        timeout: float = None,
+        proxy: str = None,
+        zenrows: dict = None,
+        max_bytes: int = None,
+        accept: frozenset = None,
+        retries: int = None,
+        **kwargs,
+    ) -> httpx.Response:
+        """Send a request with pooling, per-host limits and retries
+
+        Args:
+            method (str): HTTP method
+            url (str): URL to request
+            headers (dict, optional): request headers. Defaults to None.
+            cookies (dict, optional): request cookies. Defaults to None.
+            params (dict, optional): query parameters. Defaults to None.
+            timeout (float, optional): timeout in seconds, defaults to the client timeout.
+            proxy (str, optional): HTTP proxy URL, e.g. from oxylabs_proxy_url. Defaults to None.
+            zenrows (dict, optional): route through ZenRows with these parameters. Defaults to None.
+            max_bytes (int, optional): stream the body and stop reading after this many bytes. Defaults to None.
+            accept (frozenset, optional): content kinds from sniff_content to read, e.g. TEXT_KINDS. Defaults to None.
+            retries (int, optional): retries of failed requests, defaults to the client retries.
+
+        Returns:
+            httpx.Response: the last response, extensions["truncated"] is set for streamed bodies
+
+        Raises:
+            UnsupportedContent: if a successful response is not an accepted kind
+        """
+        route = self._route(url, params, headers, cookies, zenrows)
+        # metrics are for the target site, the connection limit is for the host connected to
+        host = urlparse(url).netloc.lower()
+        connection_host = urlparse(route["url"]).netloc.lower()
+        client = self._client(proxy)
+        retries = retries if retries is not None else self.retries
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                with self._host_semaphore(connection_host):
+                    request = client.build_request(
+                        method,
+                        timeout=timeout if timeout is not None else self.timeout,
+                        **route,
+                        **kwargs,
+                    )
+                    if max_bytes is None and accept is None:
+                        response = client.send(request)
+                    else:
+                        response = self._read(
+                            url, client.send(request, stream=True), max_bytes, accept
+                        )
+            except httpx.TransportError:
+                self.metrics.record(host, time.perf_counter() - started)
+                if attempt >= retries:
+                    raise
+            else:
+                self.metrics.record(host, time.perf_counter() - started, response)
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= retries:
+                    return response
+            attempt += 1
+            time.sleep(self._delay(attempt))
+
+    @staticmethod
+    def _read(
+        url: str,
+        response: httpx.Response,
+        max_bytes: Optional[int],
+        accept: Optional[frozenset],
+    ) -> httpx.Response:
+        reader = _BodyReader(url, response, max_bytes, accept)
+        try:
+            for chunk in response.iter_bytes():
+                if not reader.add(chunk):
+                    break
+        finally:
+            # closing early drops the rest of the body without downloading it
+            response.close()
+        return reader.result()
+
+    @staticmethod
+    async def _aread(
+        url: str,
+        response: httpx.Response,
+        max_bytes: Optional[int],
+        accept: Optional[frozenset],
+    ) -> httpx.Response:
+        reader = _BodyReader(url, response, max_bytes, accept)
+        try:
+            async for chunk in response.aiter_bytes():
+                if not reader.add(chunk):
+                    break
+        finally:
+            await response.aclose()
+        return reader.result()
+
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("GET", url, **kwargs)
+
+    def download(
+        self,
+        url: str,
+        file: BinaryIO,
+        headers: dict = None,
+        cookies: dict = None,
+        timeout: float = None,
+        max_bytes: int = None,
+        accept: frozenset = None,
+    ) -> httpx.Response:
+        """Stream a response body into a file without holding it in memory
+
+        Args:
+            url (str): URL to download
+            file (BinaryIO): file to write the body to
+            headers (dict, optional): request headers. Defaults to None.
+            cookies (dict, optional): request cookies. Defaults to None.
+            timeout (float, optional): timeout in seconds, defaults to the client timeout.
+            max_bytes (int, optional): fail once the body is larger than this. Defaults to None.
+            accept (frozenset, optional): content kinds from sniff_content to download. Defaults to None.
+
+        Returns:
+            httpx.Response: the response, its body is in the file
+
+        Raises:
+            ResponseTooLarge: if the body is larger than max_bytes
+            UnsupportedContent: if a successful response is not an accepted kind
+        """
+        route = self._route(url, None, headers, cookies, None)
+        host = urlparse(url).netloc.lower()
+        started = time.perf_counter()
+        size = 0
+        try:
+            with self._host_semaphore(host), self._client().stream(
+                "GET",
+                timeout=timeout if timeout is not None else self.timeout,
+                **route,
+            ) as response:
+                if not response.is_success:
+                    self.metrics.record(
+                        host, time.perf_counter() - started, response, size
+                    )
+                    return response
+                # don't start a download that is known to be too large
+                length = response.headers.get("content-length", "")
+                if (
+                    max_bytes is not None
+                    and length.isdigit()
+                    and int(length) > max_bytes
+                ):
+                    raise ResponseTooLarge(url, max_bytes)
+                for chunk in response.iter_bytes():
+                    if size == 0 and accept is not None:
+                        kind = sniff_content(
+                            response.headers.get("content-type"), chunk
+                        )
+                        if kind not in accept:
+                            raise UnsupportedContent(url, kind)
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise ResponseTooLarge(url, max_bytes)
+                    file.write(chunk)
+        except httpx.TransportError:
+            self.metrics.record(host, time.perf_counter() - started)
+            raise
+        self.metrics.record(host, time.perf_counter() - started, response, size)
+        return response
+
+    async def arequest(
+        self,
+        client: httpx.AsyncClient,
+        method: str,
+        url: str,
+        headers: dict = None,
+        cookies: dict = None,
+        params: dict = None,
+        timeout: float = None,
+        zenrows: dict = None,
+        max_bytes: int = None,
+        accept: frozenset = None,
+        retries: int = None,
+        **kwargs,
+    ) -> httpx.Response:
+        """
+        Send a request with an async client from async_client, with the same retries, metrics and body limits
+        """
+        route = self._route(url, params, headers, cookies, zenrows)
+        # metrics are for the target site, not the ZenRows API
+        host = urlparse(url).netloc.lower()
+        retries = retries if retries is not None else self.retries
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                request = client.build_request(
+                    method,
+                    timeout=timeout if timeout is not None else self.timeout,
+                    **route,
+                    **kwargs,
+                )
+                if max_bytes is None and accept is None:
+                    response = await client.send(request)
+                else:
+                    response = await self._aread(
+                        url, await client.send(request, stream=True), max_bytes, accept
+                    )
+            except httpx.TransportError:
+                self.metrics.record(host, time.perf_counter() - started)
+                if attempt >= retries:
+                    raise
+            else:
+                self.metrics.record(host, time.perf_counter() - started, response)
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= retries:
+                    return response
+            attempt += 1
+            await asyncio.sleep(self._delay(attempt))
+
+
+# shared by every tool so connections are reused across calls
+http_client = HttpClient()
@@ -0,0 +1,211 @@
+"""
+Content-addressed storage for raw webpage content
+- Blobs are keyed by the SHA-256 of the uncompressed content
+- Blobs are zstd compressed when zstandard is installed, zlib otherwise
+- Stores can be a local directory or any S3-compatible bucket
+"""
+from abc import ABC, abstractmethod
+from typing import Optional
+import hashlib
+import logging
+import os
+import tempfile
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - depends on the environment
+    zstandard = None
+
+
+logger = logging.getLogger(__name__)
+
+
+# file extension for each codec so blobs stay readable if the codec changes
+ZSTD_EXTENSION = ".zst"
+ZLIB_EXTENSION = ".zz"
+
+
+def content_hash(content: bytes) -> str:
+    """
+    SHA-256 hex digest used as the blob key
+    """
+    return hashlib.sha256(content).hexdigest()
+
+
+def compress(content: bytes) -> tuple[bytes, str]:
+    """
+    Compress content with the best available codec, returning the blob and its extension
+    """
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=3).compress(content), ZSTD_EXTENSION
+    return zlib.compress(content, level=6), ZLIB_EXTENSION
+
+
+def decompress(blob: bytes, extension: str) -> bytes:
+    if extension == ZSTD_EXTENSION:
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd compressed blobs")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(blob)
+    return zlib.decompress(blob)
+
+
+class RawContentStore(ABC):
+    """
+    Store raw content outside of Elasticsearch
+    """
+
+    @abstractmethod
+    def put(self, content: bytes) -> str:
+        """
+        Store content and return its hash, skipping the write if it already exists
+        """
+
+    @abstractmethod
+    def get(self, content_hash: str) -> bytes:
+        """
+        Get the uncompressed content for a hash, raising KeyError if missing
+        """
+
+    @abstractmethod
+    def exists(self, content_hash: str) -> bool:
+        """
+        Check if content has been stored
+        """
+
+
+class LocalBlobStore(RawContentStore):
+    """
+    Store compressed blobs in a local directory
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, content_hash: str, extension: str) -> str:
+        # fan out into sub directories to keep directory listings small
+        return os.path.join(
+            self.directory,
+            content_hash[:2],
+            content_hash[2:4],
+            content_hash + extension,
+        )
+
+    def _find(self, content_hash: str) -> Optional[str]:
+        for extension in (ZSTD_EXTENSION, ZLIB_EXTENSION):
+            path = self._path(content_hash, extension)
+            if os.path.exists(path):
+                return path
+
+    def put(self, content: bytes) -> str:
+        key = content_hash(content)
+        if self._find(key):
+            return key
+        blob, extension = compress(content)
+        path = self._path(key, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temp file then rename so readers never see partial blobs
+        file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(file_descriptor, "wb") as f:
+                f.write(blob)
+            os.replace(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        return key
+
+    def get(self, content_hash: str) -> bytes:
+        path = self._find(content_hash)
+        if not path:
+            raise KeyError(content_hash)
+        with open(path, "rb") as f:
+            return decompress(f.read(), os.path.splitext(path)[1])
+
+    def exists(self, content_hash: str) -> bool:
+        return self._find(content_hash) is not None
+
+
+class S3BlobStore(RawContentStore):
+    """
+    Store compressed blobs in an S3-compatible bucket
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: str = None,
+        client=None,
+    ) -> None:
+        if client is None:
+            import boto3
+
+            client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+
+    def _key(self, content_hash: str, extension: str) -> str:
+        key = content_hash + extension
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def _find(self, content_hash: str) -> Optional[str]:
+        for extension in (ZSTD_EXTENSION, ZLIB_EXTENSION):
+            key = self._key(content_hash, extension)
+            try:
+                self.client.head_object(Bucket=self.bucket, Key=key)
+                return key
+            except self.client.exceptions.ClientError as e:
+                if e.response["Error"]["Code"] not in ("404", "NoSuchKey", "NotFound"):
+                    raise
+
+    def put(self, content: bytes) -> str:
+        key = content_hash(content)
+        if self._find(key):
+            return key
+        blob, extension = compress(content)
+        self.client.put_object(
+            Bucket=self.bucket, Key=self._key(key, extension), Body=blob
+        )
+        return key
+
+    def get(self, content_hash: str) -> bytes:
+        key = self._find(content_hash)
+        if not key:
+            raise KeyError(content_hash)
+        response = self.client.get_object(Bucket=self.bucket, Key=key)
+        return decompress(response["Body"].read(), os.path.splitext(key)[1])
+
+    def exists(self, content_hash: str) -> bool:
+        return self._find(content_hash) is not None
+
+
+def raw_content_store_from_url(url: str, endpoint_url: str = None) -> RawContentStore:
+    """Create a raw content store from a location
+
+    Args:
+        url (str): s3://bucket/prefix for S3-compatible storage, otherwise a local directory
+        endpoint_url (str, optional): Endpoint for S3-compatible services. Defaults to None.
+
+    Returns:
+        RawContentStore: The raw content store
+    """
+    if url.startswith("s3://"):
+        bucket, _, prefix = url[len("s3://") :].partition("/")
+        return S3BlobStore(bucket=bucket, prefix=prefix, endpoint_url=endpoint_url)
+    return LocalBlobStore(directory=os.path.expanduser(url))
+
+
+def default_raw_content_store() -> RawContentStore:
+    """
+    Raw content store configured by RAW_CONTENT_STORE_URL, defaulting to a local cache directory
+    """
+    return raw_content_store_from_url(
+        url=os.getenv(
+            "RAW_CONTENT_STORE_URL",
+            os.path.join("~", ".cache", "conductor", "raw"),
+        ),
+        endpoint_url=os.getenv("RAW_CONTENT_STORE_ENDPOINT_URL"),
+    )
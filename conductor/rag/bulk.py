@@ -0,0 +1,291 @@
+"""
+Write-behind bulk indexing for Elasticsearch vector stores
+- Documents from concurrent ingests are buffered and get their ids up front
+- A background thread embeds and writes the buffer through the bulk API by size or time
+- Writes skip refreshes, readers call flush() as a barrier to see recent writes
+"""
+from elasticsearch import Elasticsearch
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_elasticsearch import ElasticsearchStore
+from conductor.rag.urls import normalize_url
+from typing import Optional
+import atexit
+import logging
+import threading
+import time
+import uuid
+
+
+logger = logging.getLogger(__name__)
+
+
+class _BufferedDocument:
+    __slots__ = ("id", "document", "embedding")
+
+    def __init__(
+        self, id: str, document: Document, embedding: Optional[list[float]]
+    ) -> None:
+        self.id = id
+        self.document = document
+        self.embedding = embedding
+
+
+def _document_url(document: Document) -> Optional[str]:
+    url = document.metadata.get("url")
+    return normalize_url(url) if url else None
+
+
+class BulkIndexer:
+    """
+    Buffer documents and write them to Elasticsearch in bulk from a background thread
+    """
+
+    def __init__(
+        self,
+        elasticsearch: Elasticsearch,
+        store: ElasticsearchStore,
+        embeddings: Embeddings,
+        index_name: str,
+        max_documents: int = 500,
+        flush_interval: float = 1.0,
+        routing: str = None,
+    ) -> None:
+        self.elasticsearch = elasticsearch
+        self.store = store
+        self.embeddings = embeddings
+        self.index_name = index_name
+        self.max_documents = max_documents
+        self.flush_interval = flush_interval
+        # every document of the buffer is routed to the same shard
+        self.routing = routing
+        self._buffer: list[_BufferedDocument] = []
+        self._buffered_at: Optional[float] = None
+        # urls buffered or written since the last refresh, searches can't see them yet
+        self._pending_urls: dict[str, int] = {}
+        self._unrefreshed_urls: set[str] = set()
+        self._writing = 0
+        self._flush_requested = False
+        self._closed = False
+        self._errors: list[Exception] = []
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def _start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name=f"bulk-indexer-{self.index_name}", daemon=True
+            )
+            self._thread.start()
+
+    def add(
+        self, documents: list[Document], embeddings: list[list[float]] = None
+    ) -> list[str]:
+        """Buffer documents to be written in the background
+
+        Args:
+            documents (list[Document]): documents to index
+            embeddings (list[list[float]], optional): precomputed document embeddings. Defaults to None.
+
+        Returns:
+            list[str]: document ids, generated for documents without one
+        """
+        if embeddings is None:
+            embeddings = [None] * len(documents)
+        buffered = [
+            _BufferedDocument(
+                id=document.id or str(uuid.uuid4()),
+                document=document,
+                embedding=embedding,
+            )
+            for document, embedding in zip(documents, embeddings)
+        ]
+        with self._condition:
+            if self._closed:
+                raise ValueError("Bulk indexer is closed")
+            self._start()
+            self._buffer.extend(buffered)
+            if self._buffered_at is None:
+                self._buffered_at = time.monotonic()
+            for item in buffered:
+                url = _document_url(item.document)
+                if url:
+                    self._pending_urls[url] = self._pending_urls.get(url, 0) + 1
+            self._condition.notify_all()
+        return [item.id for item in buffered]
+
+    def is_pending(self, url: str) -> bool:
+        """
+        Check if a URL has documents that searches can't see yet
+        """
+        with self._condition:
+            url = normalize_url(url)
+            return url in self._pending_urls or url in self._unrefreshed_urls
+
+    def _ready(self) -> bool:
+        if not self._buffer:
+            return False
+        return (
+            self._closed
+            or self._flush_requested
+            or len(self._buffer) >= self.max_documents
+            or time.monotonic() - self._buffered_at >= self.flush_interval
+        )
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._ready():
+                    if self._closed:
+                        return
+                    timeout = (
+                        self.flush_interval - (time.monotonic() - self._buffered_at)
+                        if self._buffered_at is not None
+                        else None
+                    )
+                    self._condition.wait(timeout=timeout)
+                batch = self._buffer[: self.max_documents]
+                del self._buffer[: self.max_documents]
+                self._buffered_at = time.monotonic() if self._buffer else None
+                self._writing += 1
+            written = False
+            try:
+                self._write(batch)
+                written = True
+            except Exception as e:
+                logger.exception(f"Bulk write of {len(batch)} documents failed")
+                with self._condition:
+                    self._errors.append(e)
+            finally:
+                with self._condition:
+                    self._writing -= 1
+                    for item in batch:
+                        url = _document_url(item.document)
+                        if not url:
+                            continue
+                        self._pending_urls[url] -= 1
+                        if not self._pending_urls[url]:
+                            del self._pending_urls[url]
+                        # urls of a failed write are no longer pending so they can be retried
+                        if written:
+                            self._unrefreshed_urls.add(url)
+                    self._condition.notify_all()
+
+    def _write(self, batch: list[_BufferedDocument]) -> None:
+        missing = [item for item in batch if item.embedding is None]
+        if missing:
+            vectors = self.embeddings.embed_documents(
+                [item.document.page_content for item in missing]
+            )
+            for item, vector in zip(missing, vectors):
+                item.embedding = vector
+        self.store.add_embeddings(
+            text_embeddings=[
+                (item.document.page_content, item.embedding) for item in batch
+            ],
+            metadatas=[item.document.metadata for item in batch],
+            ids=[item.id for item in batch],
+            refresh_indices=False,
+            **({"bulk_kwargs": {"routing": self.routing}} if self.routing else {}),
+        )
+        logger.info(f"Bulk indexed {len(batch)} documents into {self.index_name}")
+
+    def flush(self, refresh: bool = True) -> None:
+        """Wait for buffered documents to be written and make them visible to searches
+
+        Args:
+            refresh (bool, optional): refresh the index after writing. Defaults to True.
+
+        Raises:
+            Exception: the first error raised by a background write since the last flush
+        """
+        with self._condition:
+            if not self._buffer and not self._writing and not self._unrefreshed_urls:
+                return self._raise_errors()
+            self._flush_requested = True
+            self._condition.notify_all()
+            while self._buffer or self._writing:
+                self._condition.wait()
+            self._flush_requested = False
+            refreshed_urls = set(self._unrefreshed_urls)
+        if refresh and refreshed_urls:
+            self.elasticsearch.indices.refresh(index=self.index_name)
+            with self._condition:
+                self._unrefreshed_urls -= refreshed_urls
+        with self._condition:
+            self._raise_errors()
+
+    def _raise_errors(self) -> None:
+        if self._errors:
+            error, self._errors = self._errors[0], []
+            raise error
+
+    def close(self) -> None:
+        """
+        Write the remaining documents and stop the background thread
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+
+_indexers: dict[tuple, BulkIndexer] = {}
+# number of clients holding each indexer, the last one to release it closes it
+_references: dict[tuple, int] = {}
+_indexers_lock = threading.Lock()
+
+
+def shared_bulk_indexer(
+    elasticsearch: Elasticsearch,
+    store: ElasticsearchStore,
+    embeddings: Embeddings,
+    index_name: str,
+    run_id: str = None,
+    routing: str = None,
+    **kwargs,
+) -> BulkIndexer:
+    """
+    Get the process-wide bulk indexer for an index and run so every client shares one buffer and read barrier, release it with release_bulk_indexer
+    """
+    # the store writes through the client and embeddings to the index, so clients with
+    # the same ones share a buffer, runs get their own so pending urls and routing don't mix
+    key = (id(elasticsearch), id(embeddings), index_name, run_id, routing)
+    with _indexers_lock:
+        if key not in _indexers:
+            _indexers[key] = BulkIndexer(
+                elasticsearch=elasticsearch,
+                store=store,
+                embeddings=embeddings,
+                index_name=index_name,
+                routing=routing,
+                **kwargs,
+            )
+            _references[key] = 0
+        # registered indexers keep their client alive, so its id can't be reused
+        _references[key] += 1
+        return _indexers[key]
+
+
+def release_bulk_indexer(indexer: BulkIndexer) -> None:
+    """
+    Release an indexer of shared_bulk_indexer, the last client writes the remaining documents and stops its thread
+    """
+    with _indexers_lock:
+        key = next((key for key, value in _indexers.items() if value is indexer), None)
+        if key is None:
+            return None
+        _references[key] -= 1
+        if _references[key]:
+            return None
+        del _indexers[key], _references[key]
+    indexer.close()
+
+
+@atexit.register
+def _close_indexers() -> None:
+    with _indexers_lock:
+        indexers = list(_indexers.values())
+    for indexer in indexers:
+        indexer.close()
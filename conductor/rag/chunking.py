@@ -0,0 +1,133 @@
+"""
+Split extracted text into overlapping, sentence-aware chunks for embedding
+- Chunks are exact spans of the source text so pages can be reassembled
+- Chunk size is bounded by a token budget rather than a character count
+"""
+from pydantic import BaseModel, Field
+from typing import Callable, Iterable, Iterator
+import re
+
+
+# sentence ends followed by whitespace, or sentence ends glued to the next sentence
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|(?<=[a-z0-9][.!?])(?=[A-Z])|\n+")
+TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+class TextChunk(BaseModel):
+    index: int = Field(..., description="Position of the chunk in the text")
+    start: int = Field(..., description="Start offset of the chunk in the text")
+    end: int = Field(..., description="End offset of the chunk in the text")
+    text: str = Field(..., description="Text of the chunk")
+
+
+def count_tokens(text: str) -> int:
+    """
+    Approximate token count using words and punctuation
+    """
+    return len(TOKEN.findall(text))
+
+
+def split_sentences(text: str) -> Iterator[tuple[int, int]]:
+    """
+    Yield (start, end) spans of the sentences in the text
+    """
+    start = 0
+    for boundary in SENTENCE_BOUNDARY.finditer(text):
+        if boundary.start() > start:
+            yield start, boundary.start()
+        start = boundary.end()
+    if start < len(text):
+        yield start, len(text)
+
+
+def _split_long_sentence(
+    text: str, start: int, end: int, max_tokens: int
+) -> Iterator[tuple[int, int]]:
+    """
+    Hard split a sentence that does not fit in a chunk on token boundaries
+    """
+    tokens = list(TOKEN.finditer(text, start, end))
+    for idx in range(0, len(tokens), max_tokens):
+        window = tokens[idx : idx + max_tokens]
+        yield window[0].start(), window[-1].end()
+
+
+def chunk_text(
+    text: str,
+    max_tokens: int = 256,
+    overlap_tokens: int = 32,
+    token_counter: Callable[[str], int] = count_tokens,
+) -> Iterator[TextChunk]:
+    """Stream overlapping chunks of whole sentences
+
+    Args:
+        text (str): text to chunk
+        max_tokens (int, optional): token budget for a chunk. Defaults to 256.
+        overlap_tokens (int, optional): tokens repeated from the previous chunk. Defaults to 32.
+        token_counter (Callable[[str], int], optional): token counting function. Defaults to count_tokens.
+
+    Yields:
+        TextChunk: chunks in order
+    """
+    if overlap_tokens >= max_tokens:
+        raise ValueError("overlap_tokens must be smaller than max_tokens")
+    index = 0
+    # sentences in the current window as (start, end, tokens)
+    window: list[tuple[int, int, int]] = []
+    window_tokens = 0
+    for sentence_start, sentence_end in split_sentences(text):
+        tokens = token_counter(text[sentence_start:sentence_end])
+        if tokens > max_tokens:
+            spans = _split_long_sentence(text, sentence_start, sentence_end, max_tokens)
+            sentences = [
+                (start, end, token_counter(text[start:end])) for start, end in spans
+            ]
+        else:
+            sentences = [(sentence_start, sentence_end, tokens)]
+        for start, end, tokens in sentences:
+            if window and window_tokens + tokens > max_tokens:
+                yield TextChunk(
+                    index=index,
+                    start=window[0][0],
+                    end=window[-1][1],
+                    text=text[window[0][0] : window[-1][1]],
+                )
+                index += 1
+                # carry the trailing sentences that fit in the overlap
+                overlap: list[tuple[int, int, int]] = []
+                overlap_total = 0
+                for sentence in reversed(window):
+                    if overlap_total + sentence[2] > overlap_tokens:
+                        break
+                    overlap.insert(0, sentence)
+                    overlap_total += sentence[2]
+                # never let the overlap push the next sentence over the budget
+                while overlap and overlap_total + tokens > max_tokens:
+                    overlap_total -= overlap.pop(0)[2]
+                window, window_tokens = overlap, overlap_total
+            window.append((start, end, tokens))
+            window_tokens += tokens
+    if window:
+        yield TextChunk(
+            index=index,
+            start=window[0][0],
+            end=window[-1][1],
+            text=text[window[0][0] : window[-1][1]],
+        )
+
+
+def merge_chunks(chunks: Iterable[TextChunk]) -> str:
+    """
+    Reassemble text from chunks, dropping the overlap between neighbours
+    """
+    text = ""
+    end = None
+    for chunk in sorted(chunks, key=lambda chunk: chunk.index):
+        if end is None:
+            text = chunk.text
+        elif chunk.start >= end:
+            text += " " + chunk.text
+        else:
+            text += chunk.text[end - chunk.start :]
+        end = max(chunk.end, end) if end is not None else chunk.end
+    return text
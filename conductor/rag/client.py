@@ -5,11 +5,46 @@ Ingestion logic for RAG data
 - Vectorize data
 - Store data
 """
-from elasticsearch import Elasticsearch
+from elasticsearch import AsyncElasticsearch, Elasticsearch, helpers
 from langchain_core.embeddings import Embeddings
-from langchain_elasticsearch import ElasticsearchStore
+from langchain_elasticsearch import AsyncElasticsearchStore, ElasticsearchStore
 from langchain_core.documents import Document
 from conductor.rag.models import WebPage, SourcedImageDescription
+from conductor.rag.blobs import RawContentStore, default_raw_content_store
+from conductor.rag.bulk import release_bulk_indexer, shared_bulk_indexer
+from conductor.rag.chunking import chunk_text
+from conductor.rag.dedup import (
+    FingerprintIndex,
+    canonical_urls_from_response,
+    fingerprint_document_id,
+    fingerprint_index_name,
+    simhash,
+)
+from conductor.rag.hybrid import (
+    HybridSearch,
+    document_from_hit,
+    fuse_hybrid_responses,
+    hybrid_search_bodies,
+)
+from conductor.rag.indices import (
+    SEARCH_SOURCE,
+    VECTOR_FIELD,
+    IndexSettings,
+    aensure_index,
+    ensure_index,
+    mapping_version,
+)
+from conductor.rag.urls import normalize_url, webpage_document_id
+from conductor.rag.utils import CONTENT_SOURCE_FIELDS
+from datetime import datetime
+from typing import Optional
+import os
+import uuid
+import warnings
+
+
+# largest number of hits a single read returns
+MAX_SEARCH_SIZE = 500
 
 
 class ElasticsearchRetrieverClient:
@@ -22,61 +57,323 @@ class ElasticsearchRetrieverClient:
         elasticsearch: Elasticsearch,
         embeddings: Embeddings,
         index_name: str,
+        raw_store: RawContentStore = None,
+        chunk_size: int = 256,
+        chunk_overlap: int = 32,
+        deduplicate: bool = False,
+        write_behind: bool = False,
+        bulk_size: int = 500,
+        flush_interval: float = 1.0,
+        index_settings: IndexSettings = None,
+        run_id: str = None,
+        routing: bool = False,
     ) -> None:
         self.elasticsearch = elasticsearch
         self.embeddings = embeddings
+        # documents are stamped with the run and reads only see the run's documents
+        self.run_id = run_id
+        # route a run's documents to one shard so its searches only touch that shard
+        self.routing = run_id if run_id and routing else None
+        # token budget and overlap for each webpage chunk
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        # raw html lives outside of elasticsearch, documents only keep its hash
+        self.raw_store = raw_store if raw_store else default_raw_content_store()
         self.store = ElasticsearchStore(
             index_name=index_name,
             es_connection=elasticsearch,
             embedding=embeddings,
         )
         self.index_name = index_name
+        # the index is created with an explicit mapping before the first write
+        self.index_settings = index_settings if index_settings else IndexSettings()
+        self._index_ready = False
+        self._random_ids: Optional[bool] = None
+        # fingerprints of indexed webpages to skip near-duplicates
+        self.fingerprints = (
+            FingerprintIndex(
+                elasticsearch=elasticsearch, index_name=index_name, run_id=run_id
+            )
+            if deduplicate
+            else None
+        )
+        # write-behind clients of the same index share a buffer, reads flush it first
+        self.write_behind = write_behind
+        self.indexer = (
+            shared_bulk_indexer(
+                elasticsearch=elasticsearch,
+                store=self.store,
+                embeddings=embeddings,
+                index_name=index_name,
+                run_id=run_id,
+                routing=self.routing,
+                max_documents=bulk_size,
+                flush_interval=flush_interval,
+            )
+            if write_behind
+            else None
+        )
+
+    def _stamp(self, metadata: dict) -> dict:
+        if self.run_id:
+            metadata["run_id"] = self.run_id
+        if "url" in metadata:
+            metadata["normalized_url"] = normalize_url(metadata["url"])
+        return metadata
+
+    def run_filter(self) -> list[dict]:
+        """
+        Filter clauses that keep reads to the documents of the client's run
+        """
+        return run_filter(self.run_id)
 
     def create_image_document(self, image: SourcedImageDescription) -> Document:
         return Document(
             page_content=image.image_description.combine_description_metadata(),
-            metadata={
-                "url": image.source,
-                "created_at": image.created_at,
-                "path": image.path,
-                "image_metadata": image.image_description.metadata,
-                "description": image.image_description.description,
-            },
+            metadata=self._stamp(
+                {
+                    "url": image.source,
+                    "created_at": image.created_at,
+                    "path": image.path,
+                    "image_metadata": image.image_description.metadata,
+                    "description": image.image_description.description,
+                }
+            ),
         )
 
+    def create_webpage_documents(self, webpage: WebPage) -> list[Document]:
+        """
+        Split a webpage into chunk documents that point back to the webpage URL
+        """
+        raw = webpage.raw.encode("utf-8")
+        raw_hash = self.raw_store.put(raw)
+        documents = [
+            Document(
+                # chunks of the same page always get the same ids so re-ingests overwrite them
+                id=webpage_document_id(webpage.url, chunk.index, run_id=self.run_id),
+                page_content=chunk.text,
+                metadata=self._stamp(
+                    {
+                        "url": webpage.url,
+                        "created_at": webpage.created_at,
+                        "raw_hash": raw_hash,
+                        "raw_length": len(raw),
+                        "chunk_index": chunk.index,
+                        "chunk_start": chunk.start,
+                        "chunk_end": chunk.end,
+                    }
+                ),
+            )
+            for chunk in chunk_text(
+                webpage.content,
+                max_tokens=self.chunk_size,
+                overlap_tokens=self.chunk_overlap,
+            )
+        ]
+        for document in documents:
+            document.metadata["chunk_count"] = len(documents)
+        return documents
+
     def create_webpage_document(self, webpage: WebPage) -> Document:
         """
-        Ingest webpage document into Elasticsearch
+        Deprecated, webpages are split into chunks, use create_webpage_documents
         """
+        warnings.warn(
+            "create_webpage_document is deprecated, use create_webpage_documents",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        documents = self.create_webpage_documents(webpage)
+        if documents:
+            return documents[0]
         return Document(
             page_content=webpage.content,
-            metadata={
-                "url": webpage.url,
-                "created_at": webpage.created_at,
-                "raw": webpage.raw,
-            },
+            metadata=self._stamp(
+                {"url": webpage.url, "created_at": webpage.created_at}
+            ),
+        )
+
+    def create_pdf_page_documents(
+        self,
+        url: str,
+        page_number: int,
+        text: str,
+        created_at: datetime,
+        first_chunk_index: int = 0,
+        offset: int = 0,
+    ) -> list[Document]:
+        """
+        Split a PDF page into chunk documents, chunk indexes and character offsets
+        continue across pages so the pages merge back into one text
+        """
+        return [
+            Document(
+                id=webpage_document_id(
+                    url, first_chunk_index + chunk.index, run_id=self.run_id
+                ),
+                page_content=chunk.text,
+                metadata=self._stamp(
+                    {
+                        "url": url,
+                        "created_at": created_at,
+                        "content_type": "pdf",
+                        "page": page_number,
+                        "chunk_index": first_chunk_index + chunk.index,
+                        "chunk_start": offset + chunk.start,
+                        "chunk_end": offset + chunk.end,
+                    }
+                ),
+            )
+            for chunk in chunk_text(
+                text, max_tokens=self.chunk_size, overlap_tokens=self.chunk_overlap
+            )
+        ]
+
+    def get_raw_content(self, raw_hash: str) -> str:
+        """
+        Get the raw content of a webpage document from the raw content store
+        """
+        return self.raw_store.get(raw_hash).decode("utf-8")
+
+    def find_duplicate_webpage(self, webpage: WebPage) -> Optional[str]:
+        """
+        Find the canonical URL of an indexed near-duplicate and record the webpage as its alias
+        """
+        if self.fingerprints is None or not webpage.content.strip():
+            return None
+        canonical_url = self.fingerprints.find_near_duplicate(simhash(webpage.content))
+        if canonical_url and canonical_url != webpage.url:
+            self.fingerprints.add_alias(
+                canonical_url=canonical_url, alias_url=webpage.url
+            )
+            return canonical_url
+
+    def register_webpage_fingerprint(self, webpage: WebPage) -> None:
+        """
+        Record the fingerprint of a webpage once it has been indexed
+        """
+        if self.fingerprints is None or not webpage.content.strip():
+            return None
+        self.fingerprints.add(url=webpage.url, fingerprint=simhash(webpage.content))
+
+    def ensure_index(self, dims: int = None) -> None:
+        """
+        Create the index with the managed mapping unless it exists
+        """
+        if self._index_ready:
+            return
+        dims = dims or self.index_settings.dims
+        if dims is None:
+            dims = len(self.embeddings.embed_query("dimensions"))
+        ensure_index(
+            self.elasticsearch,
+            self.index_name,
+            dims,
+            self.index_settings,
+            run_scoped=self.run_id is not None,
         )
+        self._index_ready = True
+
+    def _add_documents(
+        self, documents: list[Document], embeddings: list[list[float]] = None
+    ) -> list[str]:
+        self.ensure_index(dims=len(embeddings[0]) if embeddings else None)
+        if self.indexer is not None:
+            return self.indexer.add(documents=documents, embeddings=embeddings)
+        ids = [document.id or str(uuid.uuid4()) for document in documents]
+        bulk_kwargs = {"routing": self.routing} if self.routing else None
+        if embeddings is None:
+            return self.store.add_documents(
+                documents=documents, ids=ids, bulk_kwargs=bulk_kwargs
+            )
+        return self.store.add_embeddings(
+            text_embeddings=[
+                (document.page_content, embedding)
+                for document, embedding in zip(documents, embeddings)
+            ],
+            metadatas=[document.metadata for document in documents],
+            ids=ids,
+            bulk_kwargs=bulk_kwargs,
+        )
+
+    def flush(self) -> None:
+        """
+        Write buffered documents and refresh the index so searches see them
+        """
+        if self.indexer is not None:
+            self.indexer.flush()
+
+    def close(self) -> None:
+        """
+        Write buffered documents and release the write-behind buffer
+        """
+        if self.indexer is not None:
+            release_bulk_indexer(self.indexer)
+            self.indexer = None
+
+    def update_chunk_count(self, document_ids: list[str], chunk_count: int) -> None:
+        """
+        Record the chunk count of a document that was indexed in parts, like a PDF
+        indexed page by page
+        """
+        self.flush()
+        routing = {"_routing": self.routing} if self.routing else {}
+        helpers.bulk(
+            self.elasticsearch,
+            (
+                {
+                    "_op_type": "update",
+                    "_index": self.index_name,
+                    "_id": document_id,
+                    "doc": {"metadata": {"chunk_count": chunk_count}},
+                    **routing,
+                }
+                for document_id in document_ids
+            ),
+        )
+
+    def insert_documents(self, documents: list[Document]) -> list[str]:
+        """
+        Embed and insert documents into Elasticsearch
+        """
+        if not documents:
+            return []
+        return self._add_documents(documents=documents)
 
     def create_insert_webpage_document(self, webpage: WebPage) -> list[str]:
         """
         Insert webpage document into Elasticsearch
         """
-        document = self.create_webpage_document(webpage)
-        return self.store.add_documents(documents=[document])
+        documents = self.create_webpage_documents(webpage)
+        return self._add_documents(documents=documents)
 
     def create_insert_webpage_documents(self, webpages: list[WebPage]) -> None:
         """
         Insert multiple webpage documents into Elasticsearch
         """
-        documents = [self.create_webpage_document(webpage) for webpage in webpages]
-        return self.store.add_documents(documents=documents)
+        documents = [
+            document
+            for webpage in webpages
+            for document in self.create_webpage_documents(webpage)
+        ]
+        return self._add_documents(documents=documents)
+
+    def insert_embedded_documents(
+        self, documents: list[Document], embeddings: list[list[float]]
+    ) -> list[str]:
+        """
+        Insert documents that have already been embedded into Elasticsearch
+        """
+        if not documents:
+            return []
+        return self._add_documents(documents=documents, embeddings=embeddings)
 
     def create_insert_image_document(self, image: SourcedImageDescription) -> list[str]:
         """
         Insert image document into Elasticsearch
         """
         document = self.create_image_document(image)
-        return self.store.add_documents(documents=[document])
+        return self._add_documents(documents=[document])
 
     def create_insert_image_documents(
         self, images: list[SourcedImageDescription]
@@ -85,32 +382,491 @@ class ElasticsearchRetrieverClient:
         Insert multiple image documents into Elasticsearch
         """
         documents = [self.create_image_document(image) for image in images]
-        return self.store.add_documents(documents=documents)
+        return self._add_documents(documents=documents)
 
     def delete_document(self, document_id: str) -> None:
         """
         Delete document from Elasticsearch
         """
-        return self.store.delete(ids=[document_id])
+        return self.delete_documents([document_id])
 
     def delete_documents(self, document_ids: list[str]) -> None:
         """
         Delete multiple documents from Elasticsearch
         """
+        self.flush()
+        if self.routing:
+            # langchain's bulk deletes can't be routed to the run's shard
+            self.elasticsearch.delete_by_query(
+                index=self.index_name,
+                query={"ids": {"values": document_ids}},
+                routing=self.routing,
+                refresh=True,
+            )
+            return None
         return self.store.delete(ids=document_ids)
 
-    def similarity_search(self, query: str, **kwargs) -> list[Document]:
+    def similarity_search(
+        self,
+        query: str,
+        k: int = 4,
+        filter: list[dict] = None,
+        num_candidates: int = 50,
+        **kwargs,
+    ) -> list[Document]:
         """
-        Search Elasticsearch for similar documents
+        Search Elasticsearch for similar documents, only the client's run when it has one
         """
-        return self.store.similarity_search(query=query, **kwargs)
+        self.flush()
+        if kwargs:
+            # other options, e.g. custom_query or doc_builder, are the store's
+            return self.store.similarity_search(
+                query=query,
+                k=k,
+                fetch_k=num_candidates,
+                filter=self.run_filter() + (filter or []),
+                **kwargs,
+            )
+        response = self.elasticsearch.search(
+            index=self.index_name,
+            **knn_search_body(
+                self.embeddings.embed_query(query),
+                k=k,
+                filter=self.run_filter() + (filter or []),
+                num_candidates=num_candidates,
+            ),
+            routing=self.routing,
+        )
+        return [document_from_hit(hit) for hit in response["hits"]["hits"]]
+
+    def hybrid_search_with_score(
+        self, query: str, k: int = 4, settings: HybridSearch = None
+    ) -> list[tuple[Document, float]]:
+        """Search with BM25 and kNN in one request and fuse the rankings with RRF
 
-    def find_document_by_url(self, url: str) -> dict:
+        Args:
+            query (str): search query
+            k (int, optional): number of documents to return. Defaults to 4.
+            settings (HybridSearch, optional): weights and candidate counts. Defaults to HybridSearch().
+
+        Returns:
+            list[tuple[Document, float]]: documents with their fused score, best first
         """
-        Find document by URL
+        settings = settings if settings else HybridSearch()
+        self.flush()
+        responses = self.elasticsearch.msearch(
+            index=self.index_name,
+            searches=hybrid_search_bodies(
+                query,
+                self.embeddings.embed_query(query),
+                settings,
+                filter=self.run_filter(),
+                routing=self.routing,
+            ),
+        )
+        return fuse_hybrid_responses(responses, k=k, settings=settings)
+
+    def hybrid_search(
+        self, query: str, k: int = 4, settings: HybridSearch = None
+    ) -> list[Document]:
         """
-        # elasticsearch query looking at metadata field url for exact match
+        Search with BM25 and kNN in one request and fuse the rankings with RRF
+        """
+        return [
+            document
+            for document, _ in self.hybrid_search_with_score(query, k, settings)
+        ]
+
+    def document_exists(self, url: str) -> bool:
+        """
+        Check if a URL is indexed or is an alias of an indexed near-duplicate
+        """
+        return self.exists_many([url])[url]
+
+    def exists_many(self, urls: list[str]) -> dict[str, bool]:
+        """Check which URLs are indexed or are aliases of indexed near-duplicates
+
+        Args:
+            urls (list[str]): URLs to check
+
+        Returns:
+            dict[str, bool]: whether each URL exists
+        """
+        existing = {
+            url: self.indexer is not None and self.indexer.is_pending(url)
+            for url in urls
+        }
+        # the first chunk of an indexed webpage always has the same id
+        unknown = [url for url, found in existing.items() if not found]
+        if unknown:
+            response = self.elasticsearch.options(ignore_status=404).mget(
+                index=self.index_name,
+                ids=[webpage_document_id(url, run_id=self.run_id) for url in unknown],
+                source=False,
+                routing=self.routing,
+            )
+            for url, document in zip(unknown, response.get("docs", [])):
+                existing[url] = document.get("found", False)
+        unknown = [url for url, found in existing.items() if not found]
+        if unknown and self._has_random_ids():
+            existing.update(self._exists_by_query(unknown))
+        unknown = [url for url, found in existing.items() if not found]
+        if unknown and self.fingerprints is not None:
+            canonical_urls = self.fingerprints.canonical_urls(unknown)
+            for url in unknown:
+                existing[url] = canonical_urls.get(url) is not None
+        return existing
+
+    def _has_random_ids(self) -> bool:
+        """
+        Whether the index may hold webpages written before document ids were derived from URLs
+        """
+        # runs always write deterministic ids, managed indices were created after the switch
+        if self.run_id:
+            return False
+        if self._random_ids is None:
+            try:
+                self._random_ids = (
+                    mapping_version(self.elasticsearch, self.index_name) == 0
+                )
+            except Exception:
+                # nothing indexed yet
+                self._random_ids = False
+        return self._random_ids
+
+    def _exists_by_query(self, urls: list[str]) -> dict[str, bool]:
+        searches = []
+        for url in urls:
+            searches.extend([{}, url_exists_body(url)])
+        responses = self.elasticsearch.msearch(index=self.index_name, searches=searches)
+        return {
+            url: "error" not in response and response["hits"]["total"]["value"] > 0
+            for url, response in zip(urls, responses["responses"])
+        }
+
+    def find_document_by_url(self, url: str, size: int = 500) -> dict:
+        """
+        Find document by URL, or by its canonical URL when it is a near-duplicate alias
+        """
+        self.flush()
+        response = self._search_by_url(url=url, size=size)
+        if response["hits"]["hits"] or self.fingerprints is None:
+            return response
+        canonical_url = self.fingerprints.canonical_url(url)
+        if canonical_url is None or canonical_url == url:
+            return response
+        return self._search_by_url(url=canonical_url, size=size)
+
+    def _search_by_url(self, url: str, size: int) -> dict:
         return self.elasticsearch.search(
             index=self.index_name,
-            body={"query": {"term": {"metadata.url.keyword": {"value": url}}}},
+            **url_search_body(url=url, size=size, filter=self.run_filter()),
+            routing=self.routing,
+        )
+
+
+def run_filter(run_id: Optional[str]) -> list[dict]:
+    return [{"term": {"metadata.run_id": run_id}}] if run_id else []
+
+
+def url_query(url: str, filter: list[dict] = None) -> dict:
+    # elasticsearch query matching the metadata url of any variant of the URL, documents
+    # written before normalized urls were stored only match their exact url
+    normalized_url = normalize_url(url)
+    return {
+        "bool": {
+            "filter": [
+                {
+                    "bool": {
+                        "should": [
+                            {"term": {"metadata.normalized_url": normalized_url}},
+                            # indices with langchain's dynamic mapping
+                            {
+                                "term": {
+                                    "metadata.normalized_url.keyword": normalized_url
+                                }
+                            },
+                            {"term": {"metadata.url.keyword": url}},
+                        ],
+                        "minimum_should_match": 1,
+                    }
+                }
+            ]
+            + (filter or [])
+        }
+    }
+
+
+def url_search_body(
+    url: str,
+    size: int,
+    filter: list[dict] = None,
+    source: list[str] = CONTENT_SOURCE_FIELDS,
+) -> dict:
+    # returning the chunks of the webpage in order with only the fields that are read
+    return dict(
+        query=url_query(url, filter),
+        sort=[{"metadata.chunk_index": {"order": "asc", "unmapped_type": "long"}}],
+        size=min(size, MAX_SEARCH_SIZE),
+        source=source,
+    )
+
+
+def url_exists_body(url: str, filter: list[dict] = None) -> dict:
+    """
+    msearch body that stops at the first matching chunk, for existence checks
+    """
+    return {
+        "query": url_query(url, filter),
+        "size": 0,
+        "terminate_after": 1,
+        "track_total_hits": True,
+    }
+
+
+def knn_search_body(
+    query_vector: list[float],
+    k: int,
+    filter: list[dict] = None,
+    num_candidates: int = 50,
+) -> dict:
+    """
+    Approximate kNN search, filters are applied while searching the graph so k hits still come back
+    """
+    return dict(
+        knn={
+            "field": VECTOR_FIELD,
+            "query_vector": query_vector,
+            "k": k,
+            "num_candidates": max(num_candidates, k),
+            "filter": filter or [],
+        },
+        size=min(k, MAX_SEARCH_SIZE),
+        source=SEARCH_SOURCE,
+    )
+
+
+def async_elasticsearch_client(
+    hosts: list[str] = None,
+    api_key: str = None,
+    basic_auth: tuple[str, str] = None,
+    connections_per_node: int = 100,
+) -> AsyncElasticsearch:
+    """Create an async client from the settings the sync client was created with
+
+    Args:
+        hosts (list[str], optional): Elasticsearch URLs. Defaults to ELASTICSEARCH_URL.
+        api_key (str, optional): API key. Defaults to ELASTICSEARCH_API_KEY.
+        basic_auth (tuple[str, str], optional): username and password. Defaults to ELASTICSEARCH_USERNAME and ELASTICSEARCH_PASSWORD.
+        connections_per_node (int, optional): size of the connection pool of each node. Defaults to 100.
+
+    Returns:
+        AsyncElasticsearch: async client, share it between retrievals that run on the same event loop
+    """
+    api_key = api_key if api_key else os.getenv("ELASTICSEARCH_API_KEY")
+    if basic_auth is None and not api_key and os.getenv("ELASTICSEARCH_USERNAME"):
+        basic_auth = (
+            os.getenv("ELASTICSEARCH_USERNAME"),
+            os.getenv("ELASTICSEARCH_PASSWORD", ""),
+        )
+    return AsyncElasticsearch(
+        hosts=hosts if hosts else [os.getenv("ELASTICSEARCH_URL")],
+        api_key=api_key,
+        basic_auth=basic_auth,
+        connections_per_node=connections_per_node,
+    )
+
+
+class AsyncElasticsearchRetrieverClient:
+    """
+    Search and write documents in Elasticsearch from an event loop
+    """
+
+    def __init__(
+        self,
+        elasticsearch: AsyncElasticsearch,
+        embeddings: Embeddings,
+        index_name: str,
+        index_settings: IndexSettings = None,
+        run_id: str = None,
+        routing: bool = False,
+    ) -> None:
+        self.elasticsearch = elasticsearch
+        self.embeddings = embeddings
+        self.index_name = index_name
+        # same run scoping as ElasticsearchRetrieverClient
+        self.run_id = run_id
+        self.routing = run_id if run_id and routing else None
+        self.index_settings = index_settings if index_settings else IndexSettings()
+        self._index_ready = False
+        self.store = AsyncElasticsearchStore(
+            index_name=index_name,
+            es_connection=elasticsearch,
+            embedding=embeddings,
+        )
+
+    async def asimilarity_search(
+        self,
+        query: str,
+        k: int = 4,
+        filter: list[dict] = None,
+        num_candidates: int = 50,
+    ) -> list[Document]:
+        """
+        Search Elasticsearch for similar documents, only the client's run when it has one
+        """
+        response = await self.elasticsearch.search(
+            index=self.index_name,
+            **knn_search_body(
+                await self.embeddings.aembed_query(query),
+                k=k,
+                filter=run_filter(self.run_id) + (filter or []),
+                num_candidates=num_candidates,
+            ),
+            routing=self.routing,
+        )
+        return [document_from_hit(hit) for hit in response["hits"]["hits"]]
+
+    async def ahybrid_search(
+        self, query: str, k: int = 4, settings: HybridSearch = None
+    ) -> list[Document]:
+        """
+        Search with BM25 and kNN in one request and fuse the rankings with RRF
+        """
+        settings = settings if settings else HybridSearch()
+        responses = await self.elasticsearch.msearch(
+            index=self.index_name,
+            searches=hybrid_search_bodies(
+                query,
+                await self.embeddings.aembed_query(query),
+                settings,
+                filter=run_filter(self.run_id),
+                routing=self.routing,
+            ),
+        )
+        return [
+            document
+            for document, _ in fuse_hybrid_responses(responses, k=k, settings=settings)
+        ]
+
+    async def afind_document_by_url(self, url: str, size: int = 500) -> dict:
+        """
+        Find document by URL, or by its canonical URL when it is a near-duplicate alias
+        """
+        response = await self._asearch_by_url(url=url, size=size)
+        if response["hits"]["hits"]:
+            return response
+        canonical_url = await self._acanonical_url(url)
+        if canonical_url is None or canonical_url == url:
+            return response
+        return await self._asearch_by_url(url=canonical_url, size=size)
+
+    async def _asearch_by_url(self, url: str, size: int) -> dict:
+        return await self.elasticsearch.search(
+            index=self.index_name,
+            **url_search_body(url=url, size=size, filter=run_filter(self.run_id)),
+            routing=self.routing,
+        )
+
+    async def _acanonical_url(self, url: str) -> Optional[str]:
+        # same side index FingerprintIndex writes, missing when deduplication is off
+        response = await self.elasticsearch.options(ignore_status=404).mget(
+            index=fingerprint_index_name(self.index_name),
+            ids=[fingerprint_document_id(url, run_id=self.run_id)],
+            source=["url", "canonical_url"],
+        )
+        return canonical_urls_from_response([url], response)[url]
+
+    async def aexists_many(self, urls: list[str]) -> dict[str, bool]:
+        """
+        Check which URLs have an indexed first chunk
+        """
+        if not urls:
+            return {}
+        response = await self.elasticsearch.options(ignore_status=404).mget(
+            index=self.index_name,
+            ids=[webpage_document_id(url, run_id=self.run_id) for url in urls],
+            source=False,
+            routing=self.routing,
         )
+        found = [document.get("found", False) for document in response.get("docs", [])]
+        return dict(zip(urls, found))
+
+    async def adocument_exists(self, url: str) -> bool:
+        return (await self.aexists_many([url]))[url]
+
+    async def aadd_documents(
+        self,
+        documents: list[Document],
+        embeddings: list[list[float]] = None,
+        refresh: bool = True,
+    ) -> list[str]:
+        """Embed and insert documents into Elasticsearch
+
+        Args:
+            documents (list[Document]): documents to insert
+            embeddings (list[list[float]], optional): vectors of the documents. Defaults to embedding them.
+            refresh (bool, optional): refresh the index so searches see the documents. Defaults to True.
+
+        Returns:
+            list[str]: ids of the documents
+        """
+        if not documents:
+            return []
+        ids = [document.id or str(uuid.uuid4()) for document in documents]
+        for document in documents:
+            if self.run_id:
+                document.metadata.setdefault("run_id", self.run_id)
+            if "url" in document.metadata:
+                document.metadata.setdefault(
+                    "normalized_url", normalize_url(document.metadata["url"])
+                )
+        if embeddings is None:
+            embeddings = await self.embeddings.aembed_documents(
+                [document.page_content for document in documents]
+            )
+        if not self._index_ready:
+            await aensure_index(
+                self.elasticsearch,
+                self.index_name,
+                len(embeddings[0]),
+                self.index_settings,
+                run_scoped=self.run_id is not None,
+            )
+            self._index_ready = True
+        return await self.store.aadd_embeddings(
+            text_embeddings=[
+                (document.page_content, embedding)
+                for document, embedding in zip(documents, embeddings)
+            ],
+            metadatas=[document.metadata for document in documents],
+            ids=ids,
+            refresh_indices=refresh,
+            bulk_kwargs={"routing": self.routing} if self.routing else None,
+        )
+
+    async def adelete_document(self, document_id: str) -> None:
+        """
+        Delete document from Elasticsearch
+        """
+        return await self.adelete_documents([document_id])
+
+    async def adelete_documents(self, document_ids: list[str]) -> None:
+        """
+        Delete multiple documents from Elasticsearch
+        """
+        if self.routing:
+            await self.elasticsearch.delete_by_query(
+                index=self.index_name,
+                query={"ids": {"values": document_ids}},
+                routing=self.routing,
+                refresh=True,
+            )
+            return None
+        return await self.store.adelete(ids=document_ids)
+
+    async def aclose(self) -> None:
+        """
+        Close the connection pool
+        """
+        await self.elasticsearch.close()
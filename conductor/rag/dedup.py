@@ -0,0 +1,232 @@
+"""
+Near-duplicate detection for webpages with SimHash fingerprints
+- Fingerprints are 64-bit SimHashes over word shingles
+- Each Elasticsearch index has a side index of fingerprints
+- Lookups use four 16-bit blocks so any fingerprint within 3 bits shares a block
+"""
+from elasticsearch import Elasticsearch
+from conductor.rag.urls import url_hash
+from typing import Optional
+import hashlib
+import logging
+import re
+
+
+logger = logging.getLogger(__name__)
+
+
+FINGERPRINT_BITS = 64
+FINGERPRINT_BLOCKS = 4
+WORD = re.compile(r"\w+")
+FINGERPRINT_MAPPING = {
+    "properties": {
+        "url": {"type": "keyword"},
+        "fingerprint": {"type": "keyword"},
+        "blocks": {"type": "keyword"},
+        "canonical_url": {"type": "keyword"},
+        "aliases": {"type": "keyword"},
+        "run_id": {"type": "keyword"},
+    }
+}
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big"
+    )
+
+
+def simhash(text: str, shingle_size: int = 3) -> int:
+    """Compute a 64-bit SimHash of the word shingles in a text
+
+    Args:
+        text (str): text to fingerprint
+        shingle_size (int, optional): number of words in a shingle. Defaults to 3.
+
+    Returns:
+        int: fingerprint
+    """
+    words = WORD.findall(text.lower())
+    shingles = [
+        " ".join(words[idx : idx + shingle_size])
+        for idx in range(max(1, len(words) - shingle_size + 1))
+    ]
+    weights = [0] * FINGERPRINT_BITS
+    for shingle in shingles:
+        shingle_hash = _hash(shingle)
+        for bit in range(FINGERPRINT_BITS):
+            weights[bit] += 1 if shingle_hash >> bit & 1 else -1
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(first: int, second: int) -> int:
+    return bin(first ^ second).count("1")
+
+
+def fingerprint_blocks(fingerprint: int) -> list[str]:
+    """
+    Split a fingerprint into blocks tagged with their position
+    """
+    block_bits = FINGERPRINT_BITS // FINGERPRINT_BLOCKS
+    mask = (1 << block_bits) - 1
+    return [
+        f"{idx}:{(fingerprint >> (idx * block_bits)) & mask:04x}"
+        for idx in range(FINGERPRINT_BLOCKS)
+    ]
+
+
+def fingerprint_index_name(index_name: str) -> str:
+    return f"{index_name}-fingerprints"
+
+
+def fingerprint_document_id(url: str, run_id: str = None) -> str:
+    return f"{run_id}-{url_hash(url)}" if run_id else url_hash(url)
+
+
+def canonical_urls_from_response(
+    urls: list[str], response: dict
+) -> dict[str, Optional[str]]:
+    """
+    Read the canonical URLs out of an mget of fingerprint documents
+    """
+    canonical_urls = {url: None for url in urls}
+    for url, document in zip(urls, response.get("docs", [])):
+        if document.get("found"):
+            source = document["_source"]
+            canonical_urls[url] = source.get("canonical_url", source["url"])
+    return canonical_urls
+
+
+class FingerprintIndex:
+    """
+    Persistent fingerprints for the webpages in an Elasticsearch index
+    """
+
+    def __init__(
+        self,
+        elasticsearch: Elasticsearch,
+        index_name: str,
+        max_distance: int = 3,
+        run_id: str = None,
+    ) -> None:
+        if max_distance >= FINGERPRINT_BLOCKS:
+            raise ValueError(
+                f"max_distance must be smaller than {FINGERPRINT_BLOCKS} for block lookups"
+            )
+        self.elasticsearch = elasticsearch
+        self.index_name = fingerprint_index_name(index_name)
+        self.max_distance = max_distance
+        # near-duplicates are only detected within a run
+        self.run_id = run_id
+        self._index_created = False
+
+    def _document_id(self, url: str) -> str:
+        return fingerprint_document_id(url, run_id=self.run_id)
+
+    def _run_filter(self) -> list[dict]:
+        if self.run_id:
+            return [{"term": {"run_id": self.run_id}}]
+        return [{"bool": {"must_not": {"exists": {"field": "run_id"}}}}]
+
+    def _create_index(self) -> None:
+        if self._index_created:
+            return
+        if not self.elasticsearch.indices.exists(index=self.index_name):
+            self.elasticsearch.options(ignore_status=400).indices.create(
+                index=self.index_name, mappings=FINGERPRINT_MAPPING
+            )
+        self._index_created = True
+
+    def find_near_duplicate(self, fingerprint: int) -> Optional[str]:
+        """
+        Find the canonical URL of the closest fingerprint within max_distance bits
+        """
+        self._create_index()
+        response = self.elasticsearch.search(
+            index=self.index_name,
+            query={
+                "bool": {
+                    "filter": [
+                        {"terms": {"blocks": fingerprint_blocks(fingerprint)}},
+                        {"bool": {"must_not": {"exists": {"field": "canonical_url"}}}},
+                        *self._run_filter(),
+                    ]
+                }
+            },
+            source=["url", "fingerprint"],
+            size=50,
+        )
+        closest = None
+        for hit in response["hits"]["hits"]:
+            distance = hamming_distance(
+                fingerprint, int(hit["_source"]["fingerprint"], 16)
+            )
+            if distance <= self.max_distance and (
+                closest is None or distance < closest[0]
+            ):
+                closest = (distance, hit["_source"]["url"])
+        return closest[1] if closest else None
+
+    def canonical_url(self, url: str) -> Optional[str]:
+        """
+        Get the canonical URL recorded for a URL, if it has a fingerprint
+        """
+        return self.canonical_urls([url])[url]
+
+    def canonical_urls(self, urls: list[str]) -> dict[str, Optional[str]]:
+        """
+        Get the canonical URLs recorded for many URLs in one request
+        """
+        self._create_index()
+        response = self.elasticsearch.options(ignore_status=404).mget(
+            index=self.index_name,
+            ids=[self._document_id(url) for url in urls],
+            source=["url", "canonical_url"],
+        )
+        return canonical_urls_from_response(urls, response)
+
+    def add(self, url: str, fingerprint: int) -> None:
+        """
+        Record the fingerprint of an indexed webpage
+        """
+        self._create_index()
+        self.elasticsearch.index(
+            index=self.index_name,
+            id=self._document_id(url),
+            document={
+                "url": url,
+                "fingerprint": f"{fingerprint:016x}",
+                "blocks": fingerprint_blocks(fingerprint),
+                "aliases": [],
+                "run_id": self.run_id,
+            },
+            # make the fingerprint visible to concurrent ingests right away
+            refresh=True,
+        )
+
+    def add_alias(self, canonical_url: str, alias_url: str) -> None:
+        """
+        Record a near-duplicate URL as an alias of the canonical webpage
+        """
+        self._create_index()
+        self.elasticsearch.index(
+            index=self.index_name,
+            id=self._document_id(alias_url),
+            document={
+                "url": alias_url,
+                "canonical_url": canonical_url,
+                "run_id": self.run_id,
+            },
+        )
+        self.elasticsearch.options(ignore_status=404).update(
+            index=self.index_name,
+            id=self._document_id(canonical_url),
+            script={
+                "source": "if (!ctx._source.aliases.contains(params.alias)) { ctx._source.aliases.add(params.alias) }",
+                "params": {"alias": alias_url},
+            },
+        )
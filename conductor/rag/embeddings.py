@@ -1,7 +1,419 @@
 """
 Setup Bedrock embeddings for RAG model.
+- Embeddings are cached by model id and text hash
+- The cache has an in-process LRU in front of Redis or a local sqlite file
+- Bulk embeddings run in parallel batches that back off when throttled
 """
 from langchain_aws import BedrockEmbeddings
+from langchain_core.embeddings import Embeddings
+from pydantic import BaseModel, Field
+from redis import Redis
+from abc import ABC, abstractmethod
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, Optional
+import hashlib
+import logging
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
 
 
 bedrock_embeddings = BedrockEmbeddings()
+
+
+def pack_vector(vector: list[float]) -> bytes:
+    """
+    Pack a vector as float32 bytes
+    """
+    return array("f", vector).tobytes()
+
+
+def unpack_vector(data: bytes) -> list[float]:
+    vector = array("f")
+    vector.frombytes(data)
+    return vector.tolist()
+
+
+class EmbeddingStore(ABC):
+    """
+    Persistent storage for packed embedding vectors
+    """
+
+    @abstractmethod
+    def get_many(self, keys: list[str]) -> dict[str, bytes]:
+        """
+        Get the stored vectors for the keys that exist
+        """
+
+    @abstractmethod
+    def set_many(self, vectors: dict[str, bytes]) -> None:
+        """
+        Store vectors by key
+        """
+
+
+class SqliteEmbeddingStore(EmbeddingStore):
+    """
+    Store embeddings in a local sqlite file
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = os.path.expanduser(path)
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite connections can't be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._local.connection = connection
+        return connection
+
+    def get_many(self, keys: list[str]) -> dict[str, bytes]:
+        vectors = {}
+        connection = self._connection()
+        # stay below sqlite's limit on query parameters
+        for idx in range(0, len(keys), 500):
+            batch = keys[idx : idx + 500]
+            rows = connection.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                batch,
+            )
+            vectors.update(dict(rows))
+        return vectors
+
+    def set_many(self, vectors: dict[str, bytes]) -> None:
+        connection = self._connection()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                vectors.items(),
+            )
+
+
+class RedisEmbeddingStore(EmbeddingStore):
+    """
+    Store embeddings in Redis
+    """
+
+    def __init__(
+        self, redis: Redis, prefix: str = "embedding:", ttl: int = None
+    ) -> None:
+        self.redis = redis
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get_many(self, keys: list[str]) -> dict[str, bytes]:
+        if not keys:
+            return {}
+        values = self.redis.mget([self.prefix + key for key in keys])
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    def set_many(self, vectors: dict[str, bytes]) -> None:
+        pipeline = self.redis.pipeline(transaction=False)
+        for key, vector in vectors.items():
+            pipeline.set(self.prefix + key, vector, ex=self.ttl)
+        pipeline.execute()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wrap an Embeddings instance with an in-process LRU and a persistent store
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        store: Optional[EmbeddingStore] = None,
+        model_id: str = None,
+        max_size: int = 10000,
+    ) -> None:
+        self.embeddings = embeddings
+        self.store = store
+        self.model_id = (
+            model_id
+            or getattr(embeddings, "model_id", None)
+            or type(embeddings).__name__
+        )
+        self.max_size = max_size
+        self._lru: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, kind: str, text: str) -> str:
+        # queries and documents are embedded differently by some models
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{self.model_id}:{kind}:{text_hash}"
+
+    def _lru_get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+            return vector
+
+    def _lru_set(self, vectors: dict[str, bytes]) -> None:
+        with self._lock:
+            for key, vector in vectors.items():
+                self._lru[key] = vector
+                self._lru.move_to_end(key)
+            while len(self._lru) > self.max_size:
+                self._lru.popitem(last=False)
+
+    def _embed(self, kind: str, texts: list[str]) -> list[list[float]]:
+        keys = [self._key(kind, text) for text in texts]
+        found: dict[str, bytes] = {}
+        for key in keys:
+            vector = self._lru_get(key)
+            if vector is not None:
+                found[key] = vector
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if missing and self.store is not None:
+            stored = self.store.get_many(missing)
+            self._lru_set(stored)
+            found.update(stored)
+        # embed each missing text once, even if it is repeated
+        missing_texts = {
+            key: text for key, text in zip(keys, texts) if key not in found
+        }
+        with self._lock:
+            self.hits += len(keys) - len(missing_texts)
+            self.misses += len(missing_texts)
+        if missing_texts:
+            if kind == "query":
+                computed = [
+                    self.embeddings.embed_query(text) for text in missing_texts.values()
+                ]
+            else:
+                computed = self.embeddings.embed_documents(list(missing_texts.values()))
+            new_vectors = {
+                key: pack_vector(vector)
+                for key, vector in zip(missing_texts.keys(), computed)
+            }
+            self._lru_set(new_vectors)
+            if self.store is not None:
+                self.store.set_many(new_vectors)
+            found.update(new_vectors)
+        return [unpack_vector(found[key]) for key in keys]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embed("document", texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed("query", [text])[0]
+
+
+THROTTLING_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+}
+
+
+def is_throttling_error(error: Exception) -> bool:
+    """
+    Check if an embedding error means the service is throttling requests
+    """
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        return response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
+    return getattr(error, "status_code", None) == 429
+
+
+class EmbeddingMetrics(BaseModel):
+    texts: int = Field(..., description="Number of texts embedded")
+    batches: int = Field(..., description="Number of batches sent")
+    throttles: int = Field(..., description="Number of throttled batches")
+    seconds: float = Field(..., description="Wall clock time of the call")
+    texts_per_second: float = Field(..., description="Embedding throughput")
+
+
+class _AdaptiveLimiter:
+    """
+    Concurrency limit that halves when throttled and grows by one on success
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.max_limit = limit
+        self.limit = limit
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def __enter__(self) -> "_AdaptiveLimiter":
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+        return self
+
+    def __exit__(self, *exc) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def decrease(self) -> None:
+        with self._condition:
+            self.limit = max(1, self.limit // 2)
+
+    def increase(self) -> None:
+        with self._condition:
+            self.limit = min(self.max_limit, self.limit + 1)
+            self._condition.notify_all()
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    Embed documents in concurrent batches, backing off when the service throttles
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        batch_size: int = 16,
+        max_in_flight: int = 8,
+        max_retries: int = 6,
+        backoff: float = 0.5,
+        metrics_callback: Callable[[EmbeddingMetrics], None] = None,
+    ) -> None:
+        self.embeddings = embeddings
+        self.model_id = (
+            getattr(embeddings, "model_id", None) or type(embeddings).__name__
+        )
+        self.max_batch_size = batch_size
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.metrics_callback = metrics_callback
+        self._limiter = _AdaptiveLimiter(limit=max_in_flight)
+        self._lock = threading.Lock()
+
+    def _on_throttle(self) -> None:
+        self._limiter.decrease()
+        with self._lock:
+            self.batch_size = max(1, self.batch_size // 2)
+
+    def _on_success(self) -> None:
+        self._limiter.increase()
+        with self._lock:
+            self.batch_size = min(self.max_batch_size, self.batch_size + 1)
+
+    def _embed_batch(self, texts: list[str]) -> tuple[list[list[float]], int]:
+        """
+        Embed a batch, retrying with jittered exponential backoff when throttled
+        """
+        throttles = 0
+        while True:
+            try:
+                with self._limiter:
+                    vectors = self.embeddings.embed_documents(texts)
+                self._on_success()
+                return vectors, throttles
+            except Exception as e:
+                if not is_throttling_error(e) or throttles >= self.max_retries:
+                    raise
+                throttles += 1
+                self._on_throttle()
+                delay = random.uniform(0, self.backoff * 2**throttles)
+                logger.info(f"Embedding throttled, retrying in {delay:.2f}s ...")
+                time.sleep(delay)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        started = time.perf_counter()
+        results: list[Optional[list[float]]] = [None] * len(texts)
+        cursor = 0
+        batches = 0
+        throttles = 0
+        cursor_lock = threading.Lock()
+
+        def next_batch() -> Optional[tuple[int, int]]:
+            nonlocal cursor, batches
+            with cursor_lock:
+                if cursor >= len(texts):
+                    return None
+                # spread small calls over every worker, batch sizes adapt to throttling
+                size = max(
+                    1, min(self.batch_size, math.ceil(len(texts) / self._limiter.limit))
+                )
+                start, cursor = cursor, min(len(texts), cursor + size)
+                batches += 1
+                return start, cursor
+
+        def worker() -> None:
+            nonlocal throttles
+            while (batch := next_batch()) is not None:
+                start, end = batch
+                vectors, batch_throttles = self._embed_batch(texts[start:end])
+                # write in place so the output order matches the input
+                results[start:end] = vectors
+                with cursor_lock:
+                    throttles += batch_throttles
+
+        workers = min(
+            self._limiter.max_limit, math.ceil(len(texts) / max(1, self.batch_size))
+        )
+        if workers <= 1:
+            worker()
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for future in [executor.submit(worker) for _ in range(workers)]:
+                    future.result()
+        seconds = time.perf_counter() - started
+        if self.metrics_callback:
+            self.metrics_callback(
+                EmbeddingMetrics(
+                    texts=len(texts),
+                    batches=batches,
+                    throttles=throttles,
+                    seconds=seconds,
+                    texts_per_second=len(texts) / seconds if seconds else 0.0,
+                )
+            )
+        return results
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embeddings.embed_query(text)
+
+
+def default_embedding_store() -> EmbeddingStore:
+    """
+    Embedding store configured by REDIS_EMBEDDINGS_CACHE_URL, defaulting to a local sqlite file
+    """
+    if os.getenv("REDIS_EMBEDDINGS_CACHE_URL"):
+        return RedisEmbeddingStore(
+            redis=Redis.from_url(os.getenv("REDIS_EMBEDDINGS_CACHE_URL"))
+        )
+    return SqliteEmbeddingStore(
+        path=os.getenv(
+            "EMBEDDINGS_CACHE_PATH",
+            os.path.join("~", ".cache", "conductor", "embeddings.sqlite"),
+        )
+    )
+
+
+@lru_cache(maxsize=1)
+def cached_bedrock_embeddings() -> CachedEmbeddings:
+    """
+    Process-wide cached Bedrock embeddings
+    """
+    return CachedEmbeddings(
+        embeddings=BatchedEmbeddings(embeddings=bedrock_embeddings),
+        store=default_embedding_store(),
+    )
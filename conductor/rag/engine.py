@@ -0,0 +1,413 @@
+"""
+Asynchronous ingest engine for webpages
+- Fetch, parse, embed and index run as separate stages
+- Each stage has its own concurrency limit
+- Bounded queues between stages apply backpressure to the URL stream
+- Fetches are capped per host so one domain can't take every connection
+- Known URL lists are fetched healthy domains first, failing and slow domains last
+- PDFs skip the parse and embed stages and are indexed page by page
+- Known URLs are skipped with one batched existence check per batch of URLs fed in
+- A stage that fails cancels the others
+"""
+from conductor.rag.client import ElasticsearchRetrieverClient
+from conductor.rag.ingest import parse_webpage
+from conductor.rag.models import WebPage, IngestResult
+from conductor.rag.singleflight import url_ingest_key, url_ingests
+from conductor.rag.fetch import default_fetcher
+from conductor.rag.pdf import ingest_pdf, is_pdf_url
+from conductor.http import UnsupportedContent
+from pydantic import BaseModel, Field
+from langchain_core.documents import Document
+from datetime import datetime
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    Optional,
+    Sequence,
+    Union,
+)
+from urllib.parse import urlparse
+import concurrent.futures
+import asyncio
+import logging
+import httpx
+
+
+logger = logging.getLogger(__name__)
+
+
+class IngestEngineConfig(BaseModel):
+    fetch_concurrency: int = Field(
+        default=16, description="Number of pages fetched at the same time"
+    )
+    parse_concurrency: int = Field(
+        default=4, description="Number of pages parsed at the same time"
+    )
+    embed_concurrency: int = Field(
+        default=8, description="Number of embedding requests in flight"
+    )
+    index_concurrency: int = Field(
+        default=2, description="Number of index requests in flight"
+    )
+    per_host_limit: int = Field(
+        default=2, description="Maximum number of open fetches for a single host"
+    )
+    queue_size: int = Field(
+        default=8, description="Maximum number of items waiting between two stages"
+    )
+    timeout: float = Field(default=10.0, description="Fetch timeout in seconds")
+    limit: Optional[int] = Field(
+        default=None, description="Maximum number of characters kept per page"
+    )
+
+
+class _IngestItem(BaseModel):
+    position: int
+    url: str
+    created_at: datetime = Field(default_factory=datetime.now)
+    response_text: Optional[str] = None
+    webpage: Optional[WebPage] = None
+    documents: list[Document] = Field(default_factory=list)
+    embeddings: list[list[float]] = Field(default_factory=list)
+    # set when this item does the ingest other callers of the same URL wait on
+    flight_key: Optional[tuple] = None
+
+
+# sentinel used to shut down a stage's workers
+_STOP = object()
+
+
+class IngestEngine:
+    """
+    Ingest a stream of URLs into Elasticsearch with bounded concurrency
+    """
+
+    def __init__(
+        self,
+        client: ElasticsearchRetrieverClient,
+        config: IngestEngineConfig = None,
+        headers: dict = None,
+        cookies: dict = None,
+    ) -> None:
+        self.client = client
+        self.config = config if config else IngestEngineConfig()
+        self.headers = headers
+        self.cookies = cookies
+        self._host_semaphores: dict[str, asyncio.Semaphore] = {}
+        self._results: dict[int, IngestResult] = {}
+        self._flights: dict[int, tuple] = {}
+        self._http: Optional[httpx.AsyncClient] = None
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(url).netloc.lower()
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.config.per_host_limit)
+        return self._host_semaphores[host]
+
+    def _record(self, item: _IngestItem, **kwargs) -> None:
+        result = IngestResult(url=item.url, **kwargs)
+        self._results[item.position] = result
+        if item.flight_key is not None:
+            self._flights.pop(item.position, None)
+            # errors are shared with waiting callers but not cached
+            url_ingests.resolve(item.flight_key, result, cache=result.error is None)
+            item.flight_key = None
+
+    async def _fetch(self, item: _IngestItem) -> Optional[_IngestItem]:
+        """
+        Fetch with the cheapest tier that returns usable content
+        """
+        # wait for a concurrent ingest of the same page instead of repeating it
+        key = url_ingest_key(
+            self.client.index_name, item.url, self.client.run_id, self.client.routing
+        )
+        future, owner = url_ingests.claim(key)
+        if not owner:
+            result = await asyncio.wrap_future(future)
+            self._results[item.position] = result.model_copy(update={"url": item.url})
+            return None
+        item.flight_key = key
+        self._flights[item.position] = key
+        if not is_pdf_url(item.url):
+            try:
+                async with self._host_semaphore(item.url):
+                    response = await default_fetcher.afetch(
+                        item.url, self._http, headers=self.headers, cookies=self.cookies
+                    )
+                item.response_text = response.text
+                return item
+            except UnsupportedContent as e:
+                # pdfs served from URLs without a .pdf extension
+                if e.kind != "pdf":
+                    raise
+        # pdfs are chunked and indexed page by page while they are extracted
+        async with self._host_semaphore(item.url):
+            result = await asyncio.to_thread(
+                ingest_pdf,
+                item.url,
+                self.client,
+                headers=self.headers,
+                cookies=self.cookies,
+            )
+        self._record(item, document_ids=result.document_ids)
+        return None
+
+    def _parse_document(self, item: _IngestItem) -> Optional[_IngestItem]:
+        item.webpage = parse_webpage(
+            url=item.url,
+            response_text=item.response_text,
+            created_at=item.created_at,
+            limit=self.config.limit,
+        )
+        item.response_text = None
+        # skip embedding and indexing for near-duplicates
+        canonical_url = self.client.find_duplicate_webpage(item.webpage)
+        if canonical_url:
+            self._record(item, duplicate_of=canonical_url)
+            return None
+        # creating the documents writes the raw content to the raw content store
+        item.documents = self.client.create_webpage_documents(item.webpage)
+        return item
+
+    async def _parse(self, item: _IngestItem) -> Optional[_IngestItem]:
+        return await asyncio.to_thread(self._parse_document, item)
+
+    async def _embed(self, item: _IngestItem) -> Optional[_IngestItem]:
+        item.embeddings = await self.client.embeddings.aembed_documents(
+            [document.page_content for document in item.documents]
+        )
+        return item
+
+    def _index_documents(self, item: _IngestItem) -> list[str]:
+        document_ids = self.client.insert_embedded_documents(
+            documents=item.documents, embeddings=item.embeddings
+        )
+        self.client.register_webpage_fingerprint(item.webpage)
+        return document_ids
+
+    async def _index(self, item: _IngestItem) -> Optional[_IngestItem]:
+        document_ids = await asyncio.to_thread(self._index_documents, item)
+        self._record(item, document_ids=document_ids)
+        return None
+
+    async def _worker(
+        self,
+        handler: Callable[[_IngestItem], Awaitable[Optional[_IngestItem]]],
+        inbox: asyncio.Queue,
+        outbox: Optional[asyncio.Queue],
+    ) -> None:
+        while True:
+            item = await inbox.get()
+            if item is _STOP:
+                return
+            try:
+                result = await handler(item)
+            except Exception as e:
+                logger.warning(f"Error ingesting {item.url}: {e}")
+                self._record(item, error=str(e))
+                continue
+            if result is not None and outbox is not None:
+                # blocks when the next stage is saturated
+                await outbox.put(result)
+
+    async def _stage(
+        self,
+        handler: Callable[[_IngestItem], Awaitable[Optional[_IngestItem]]],
+        concurrency: int,
+        inbox: asyncio.Queue,
+        outbox: Optional[asyncio.Queue],
+        downstream_concurrency: int,
+    ) -> None:
+        """
+        Run a stage until its inbox is drained, then stop the next stage
+        """
+        await _gather_or_cancel(
+            *[self._worker(handler, inbox, outbox) for _ in range(concurrency)]
+        )
+        if outbox is not None:
+            for _ in range(downstream_concurrency):
+                await outbox.put(_STOP)
+
+    async def _put_new(
+        self, items: list[_IngestItem], outbox: asyncio.Queue, skip_existing: bool
+    ) -> None:
+        """
+        Record the items whose URL is already indexed and queue the others
+        """
+        existing = {}
+        if skip_existing and items:
+            existing = await asyncio.to_thread(
+                self.client.exists_many, [item.url for item in items]
+            )
+        for item in items:
+            if existing.get(item.url):
+                self._record(item, exists=True)
+            else:
+                await outbox.put(item)
+
+    async def _feed(
+        self,
+        urls: Union[Iterable[str], AsyncIterable[str]],
+        outbox: asyncio.Queue,
+        skip_existing: bool,
+    ) -> None:
+        if isinstance(urls, Sequence) and not isinstance(urls, str):
+            # results keep the input position, only the fetch order changes
+            health = default_fetcher.guard.domains
+            positions = sorted(
+                range(len(urls)), key=lambda position: health.priority(urls[position])
+            )
+            await self._put_new(
+                [
+                    _IngestItem(position=position, url=urls[position])
+                    for position in positions
+                ],
+                outbox,
+                skip_existing,
+            )
+        else:
+            # streams are checked a queue's worth of URLs at a time
+            batch = []
+            position = 0
+            async for url in _aiterate(urls):
+                batch.append(_IngestItem(position=position, url=url))
+                position += 1
+                if len(batch) >= self.config.queue_size:
+                    await self._put_new(batch, outbox, skip_existing)
+                    batch = []
+            await self._put_new(batch, outbox, skip_existing)
+        for _ in range(self.config.fetch_concurrency):
+            await outbox.put(_STOP)
+
+    async def ingest(
+        self,
+        urls: Union[Iterable[str], AsyncIterable[str]],
+        skip_existing: bool = True,
+    ) -> list[IngestResult]:
+        """Ingest URLs as they arrive from an iterable or async iterable
+
+        Args:
+            urls (Union[Iterable[str], AsyncIterable[str]]): URLs to ingest
+            skip_existing (bool, optional): skip URLs that are already indexed, pass False for URLs the caller already checked. Defaults to True.
+
+        Returns:
+            list[IngestResult]: One result per URL in input order
+        """
+        self._results = {}
+        self._flights = {}
+        self._host_semaphores = {}
+        size = self.config.queue_size
+        fetch_queue = asyncio.Queue(maxsize=size)
+        parse_queue = asyncio.Queue(maxsize=size)
+        embed_queue = asyncio.Queue(maxsize=size)
+        index_queue = asyncio.Queue(maxsize=size)
+        async with default_fetcher.http.async_client(
+            timeout=self.config.timeout,
+            limits=httpx.Limits(
+                max_connections=self.config.fetch_concurrency * 2,
+                max_keepalive_connections=self.config.fetch_concurrency,
+            ),
+        ) as self._http:
+            try:
+                await _gather_or_cancel(
+                    self._feed(urls, fetch_queue, skip_existing),
+                    self._stage(
+                        self._fetch,
+                        self.config.fetch_concurrency,
+                        fetch_queue,
+                        parse_queue,
+                        self.config.parse_concurrency,
+                    ),
+                    self._stage(
+                        self._parse,
+                        self.config.parse_concurrency,
+                        parse_queue,
+                        embed_queue,
+                        self.config.embed_concurrency,
+                    ),
+                    self._stage(
+                        self._embed,
+                        self.config.embed_concurrency,
+                        embed_queue,
+                        index_queue,
+                        self.config.index_concurrency,
+                    ),
+                    self._stage(
+                        self._index, self.config.index_concurrency, index_queue, None, 0
+                    ),
+                )
+            finally:
+                # never leave callers of an unfinished ingest waiting
+                for key in self._flights.values():
+                    url_ingests.fail(key, RuntimeError("Ingest did not finish"))
+        self._http = None
+        return [self._results[position] for position in sorted(self._results)]
+
+
+async def _aiterate(
+    urls: Union[Iterable[str], AsyncIterable[str]],
+) -> AsyncIterator[str]:
+    if hasattr(urls, "__aiter__"):
+        async for url in urls:
+            yield url
+    else:
+        for url in urls:
+            yield url
+
+
+async def _gather_or_cancel(*coroutines: Awaitable[Any]) -> list[Any]:
+    """
+    Run coroutines concurrently and cancel the others as soon as one fails
+    """
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        # let cancelled tasks unwind before their queues and clients go away
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def run_coroutine(coroutine: Awaitable[Any]) -> Any:
+    """
+    Run a coroutine from synchronous code, even if the current thread has a running loop
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    # the current thread is already driving an event loop, so use a fresh one
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+def run_ingest_engine(
+    urls: Iterable[str],
+    client: ElasticsearchRetrieverClient,
+    config: IngestEngineConfig = None,
+    headers: dict = None,
+    cookies: dict = None,
+    skip_existing: bool = True,
+) -> list[IngestResult]:
+    """Ingest URLs with the async engine from synchronous code
+
+    Args:
+        urls (Iterable[str]): URLs to ingest
+        client (ElasticsearchRetrieverClient): Elasticsearch client
+        config (IngestEngineConfig, optional): Engine limits. Defaults to None.
+        headers (dict, optional): Headers for direct requests. Defaults to None.
+        cookies (dict, optional): Cookies for direct requests. Defaults to None.
+        skip_existing (bool, optional): Skip URLs that are already indexed. Defaults to True.
+
+    Returns:
+        list[IngestResult]: One result per URL in input order
+    """
+    engine = IngestEngine(
+        client=client, config=config, headers=headers, cookies=cookies
+    )
+    return run_coroutine(engine.ingest(urls, skip_existing=skip_existing))
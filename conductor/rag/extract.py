@@ -0,0 +1,338 @@
+"""
+Text extraction from HTML
+- Parses with lxml, which is much faster than BeautifulSoup's html.parser
+- Drops scripts, styles, navigation, headers, footers and other boilerplate
+- Detects the main content from article and main elements or the densest block of paragraphs
+- Keeps paragraph boundaries as blank lines so chunking can split on them
+- Large pages can be parsed in a pool of worker processes so parsing doesn't hold the GIL of the caller
+"""
+from pydantic import BaseModel, Field
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Optional, Union
+import asyncio
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import lxml.etree
+
+
+logger = logging.getLogger(__name__)
+
+
+# elements that never hold readable content
+REMOVED_TAGS = [
+    "script",
+    "style",
+    "noscript",
+    "template",
+    "svg",
+    "canvas",
+    "iframe",
+    "object",
+    "embed",
+    "form",
+    "button",
+    "select",
+    "input",
+]
+# elements that hold page chrome rather than content
+BOILERPLATE_TAGS = ["nav", "header", "footer", "aside", "menu", "dialog"]
+BOILERPLATE_ROLES = {
+    "navigation",
+    "banner",
+    "contentinfo",
+    "complementary",
+    "search",
+    "dialog",
+}
+BOILERPLATE_NAMES = re.compile(
+    r"(^|[\s_-])(nav|navbar|menu|footer|sidebar|breadcrumbs?|cookies?|consent|banner|share|social|related|comments?|advert|ads|promo|newsletter|subscribe|popup|modal)($|[\s_-])",
+    re.IGNORECASE,
+)
+BLOCK_TAGS = {
+    "p",
+    "div",
+    "section",
+    "article",
+    "main",
+    "h1",
+    "h2",
+    "h3",
+    "h4",
+    "h5",
+    "h6",
+    "li",
+    "ul",
+    "ol",
+    "dl",
+    "dt",
+    "dd",
+    "tr",
+    "table",
+    "blockquote",
+    "pre",
+    "figure",
+    "figcaption",
+    "address",
+}
+# share of the page text a block needs to count as the main content
+MIN_MAIN_CONTENT_SHARE = 0.3
+# private use characters that mark block and line boundaries while the text is joined
+PARAGRAPH = "\ue000"
+LINE = "\ue001"
+
+
+def parse_html(html: Union[str, bytes]) -> Optional[lxml.etree._Element]:
+    """
+    Parse an HTML document, returns None if there is nothing to parse
+    """
+    encoding = "utf-8"
+    if isinstance(html, bytes):
+        try:
+            html = html.decode("utf-8")
+        except UnicodeDecodeError:
+            # not utf-8, so let lxml decode with the document's own meta charset
+            encoding = None
+    if isinstance(html, str):
+        # lxml refuses str input with an encoding declaration, so hand it utf-8 bytes
+        html = html.encode("utf-8", errors="replace")
+    if not html.strip():
+        return None
+    # parsers can't be shared between threads, and the etree parser skips lxml.html's slow element lookup
+    parser = lxml.etree.HTMLParser(
+        encoding=encoding, remove_comments=True, remove_pis=True
+    )
+    try:
+        return lxml.etree.fromstring(html, parser=parser)
+    except (lxml.etree.ParserError, ValueError) as e:
+        logger.info(f"Could not parse HTML: {e}")
+        return None
+
+
+def _text_content(element: lxml.etree._Element) -> str:
+    return element.xpath("string()")
+
+
+def _text_length(element: lxml.etree._Element) -> int:
+    return int(element.xpath("string-length(normalize-space())"))
+
+
+def _drop(element: lxml.etree._Element) -> None:
+    """
+    Remove an element but keep the text that follows it
+    """
+    parent = element.getparent()
+    if element.tail:
+        previous = element.getprevious()
+        if previous is not None:
+            previous.tail = (previous.tail or "") + element.tail
+        else:
+            parent.text = (parent.text or "") + element.tail
+    parent.remove(element)
+
+
+def _is_boilerplate(element: lxml.etree._Element, total: int) -> bool:
+    if element.tag in BOILERPLATE_TAGS:
+        # the header of an article holds its title
+        return (
+            element.tag != "header"
+            or next(element.iterancestors("article", "main"), None) is None
+        )
+    if element.get("role", "").lower() in BOILERPLATE_ROLES:
+        return True
+    if element.get("aria-hidden") == "true" or element.get("hidden") is not None:
+        return True
+    names = f"{element.get('id', '')} {element.get('class', '')}"
+    if not names.strip() or BOILERPLATE_NAMES.search(names) is None:
+        return False
+    # wrappers like "page has-sidebar" hold most of the page and are kept
+    return _text_length(element) < 0.5 * total
+
+
+def _strip(root: lxml.etree._Element) -> None:
+    lxml.etree.strip_elements(root, *REMOVED_TAGS, with_tail=False)
+    body = root.find("body")
+    if body is None:
+        body = root
+    total = _text_length(body)
+    # collect first, removing while iterating skips siblings
+    boilerplate = [
+        element
+        for element in body.iterdescendants()
+        if isinstance(element.tag, str) and _is_boilerplate(element, total)
+    ]
+    for element in boilerplate:
+        # children of removed elements are already gone with them
+        if element.getparent() is not None:
+            _drop(element)
+
+
+def _main_content(root: lxml.etree._Element) -> lxml.etree._Element:
+    """
+    Pick the element holding the page's main content, falling back to the body
+    """
+    body = root.find("body")
+    if body is None:
+        body = root
+    total = _text_length(body)
+    if not total:
+        return body
+    # explicit markup for the main content wins
+    candidates = body.xpath(".//main | .//article | .//*[@role='main']")
+    if candidates:
+        best = max(candidates, key=_text_length)
+        if _text_length(best) >= MIN_MAIN_CONTENT_SHARE * total:
+            return best
+    # otherwise the block with the most paragraph text
+    scores: dict[lxml.etree._Element, int] = {}
+    for paragraph in body.iter("p"):
+        parent = paragraph.getparent()
+        if parent is not None:
+            scores[parent] = scores.get(parent, 0) + _text_length(paragraph)
+    if scores:
+        best = max(scores, key=scores.get)
+        if _text_length(best) >= MIN_MAIN_CONTENT_SHARE * total:
+            return best
+    return body
+
+
+def _text(element: lxml.etree._Element) -> str:
+    # mark block boundaries in the tails, then let libxml2 join the text
+    for block in element.iter(*BLOCK_TAGS):
+        block.tail = PARAGRAPH + (block.tail or "")
+    for line_break in element.iter("br"):
+        line_break.tail = LINE + (line_break.tail or "")
+    # newlines in the source are just whitespace, only the markers break lines
+    paragraphs = []
+    for paragraph in _text_content(element).split(PARAGRAPH):
+        lines = [" ".join(line.split()) for line in paragraph.split(LINE)]
+        paragraph = "\n".join(line for line in lines if line)
+        if paragraph:
+            paragraphs.append(paragraph)
+    return "\n\n".join(paragraphs)
+
+
+def extract_title(root: lxml.etree._Element) -> Optional[str]:
+    title = root.findtext(".//title")
+    return " ".join(title.split()) if title and title.strip() else None
+
+
+class ExtractedPage(BaseModel):
+    text: str = Field(
+        ..., description="Readable text with paragraphs separated by blank lines"
+    )
+    title: Optional[str] = Field(default=None, description="Title of the document")
+
+
+def extract_page(html: Union[str, bytes], main_content: bool = True) -> ExtractedPage:
+    """
+    Extract the text and title of an HTML document
+    """
+    root = parse_html(html)
+    if root is None:
+        return ExtractedPage(text="")
+    title = extract_title(root)
+    _strip(root)
+    if main_content:
+        return ExtractedPage(text=_text(_main_content(root)), title=title)
+    body = root.find("body")
+    return ExtractedPage(text=_text(body if body is not None else root), title=title)
+
+
+def extract_text(html: Union[str, bytes], main_content: bool = True) -> str:
+    """Extract readable text from an HTML document
+
+    Args:
+        html (Union[str, bytes]): HTML document, bytes are decoded with the document's charset
+        main_content (bool, optional): keep only the main content instead of the whole body. Defaults to True.
+
+    Returns:
+        str: text with paragraphs separated by blank lines
+    """
+    return extract_page(html, main_content).text
+
+
+def _warm_worker() -> None:
+    # load lxml and the parser once per worker instead of on the first page
+    extract_page("<html><body><p>warm</p></body></html>")
+
+
+class ParseExecutor:
+    """
+    Extract pages in the calling thread or, for large pages, in a pool of worker processes
+    """
+
+    def __init__(self, processes: int = 0, min_bytes: int = 256 * 1024) -> None:
+        self.processes = processes
+        self.min_bytes = min_bytes
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _offload(self, html: Union[str, bytes]) -> bool:
+        return self.processes > 0 and len(html) >= self.min_bytes
+
+    def pool(self) -> ProcessPoolExecutor:
+        """
+        Start the worker processes on first use and warm every one of them
+        """
+        with self._lock:
+            if self._pool is None:
+                # spawn, forking a process with running threads can deadlock
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_warm_worker,
+                )
+                for future in [
+                    self._pool.submit(_warm_worker) for _ in range(self.processes)
+                ]:
+                    future.result()
+            return self._pool
+
+    def extract(
+        self, html: Union[str, bytes], main_content: bool = True
+    ) -> ExtractedPage:
+        """Extract the text and title of an HTML document
+
+        Args:
+            html (Union[str, bytes]): HTML document
+            main_content (bool, optional): keep only the main content. Defaults to True.
+
+        Returns:
+            ExtractedPage: text and title
+        """
+        if not self._offload(html):
+            return extract_page(html, main_content)
+        return self.pool().submit(extract_page, html, main_content).result()
+
+    async def aextract(
+        self, html: Union[str, bytes], main_content: bool = True
+    ) -> ExtractedPage:
+        """
+        Extract a document without blocking the event loop
+        """
+        if not self._offload(html):
+            return await asyncio.to_thread(extract_page, html, main_content)
+        pool = await asyncio.to_thread(self.pool)
+        return await asyncio.wrap_future(pool.submit(extract_page, html, main_content))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+
+
+@lru_cache(maxsize=1)
+def default_parse_executor() -> ParseExecutor:
+    """
+    Process-wide parse executor, PARSE_PROCESSES worker processes parse pages of at least PARSE_MIN_BYTES bytes
+    """
+    # parsing in worker processes is opt-in
+    return ParseExecutor(
+        processes=int(os.getenv("PARSE_PROCESSES", 0)),
+        min_bytes=int(os.getenv("PARSE_MIN_BYTES", 256 * 1024)),
+    )
@@ -0,0 +1,307 @@
+"""
+Tiered webpage fetching
+- Try a plain pooled HTTP GET first, then ZenRows without JS, then ZenRows with JS rendering and premium proxy
+- Escalate only when a response is blocked, empty or mostly script
+- Remember the tier each domain needs so later fetches start there
+- Recently failed URLs and failing domains are skipped without a request
+- Bodies are streamed with a byte cap and non-text resources are rejected from their first bytes
+"""
+from conductor.health import ScrapeGuard, scrape_guard
+from conductor.http import MAX_RESPONSE_BYTES, TEXT_KINDS, HttpClient, http_client
+from conductor.zen import zenrows_client
+from pydantic import BaseModel, Field
+from enum import IntEnum
+from typing import Optional
+from urllib.parse import urlparse
+import logging
+import re
+import threading
+import time
+import httpx
+
+
+logger = logging.getLogger(__name__)
+
+
+class FetchTier(IntEnum):
+    DIRECT = 0
+    PROXY = 1
+    RENDER = 2
+
+
+# zenrows parameters for each proxied tier
+ZENROWS_PARAMS = {
+    FetchTier.PROXY: {},
+    FetchTier.RENDER: {"js_render": "true", "premium_proxy": "true"},
+}
+BLOCKED_STATUS_CODES = {401, 403, 407, 429, 503}
+BLOCKED_MARKERS = re.compile(
+    r"captcha|cf-challenge|just a moment\.\.\.|access denied|enable javascript|are you a robot",
+    re.IGNORECASE,
+)
+SCRIPT = re.compile(r"<(script|style|noscript)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+TAG = re.compile(r"<[^>]+>")
+
+
+class FetchResult(BaseModel):
+    url: str = Field(..., description="URL that was requested")
+    status_code: int = Field(..., description="Status code of the final response")
+    text: str = Field(..., description="Body of the final response")
+    tier: FetchTier = Field(..., description="Tier that produced the response")
+
+
+def escalation_reason(
+    status_code: int, text: str, min_text_length: int = 200
+) -> Optional[str]:
+    """Check if a response needs a more capable fetch tier
+
+    Args:
+        status_code (int): response status code
+        text (str): response body
+        min_text_length (int, optional): minimum length of visible text. Defaults to 200.
+
+    Returns:
+        Optional[str]: why the response is unusable, None if it is fine
+    """
+    if status_code in BLOCKED_STATUS_CODES:
+        return "blocked"
+    if not 200 <= status_code < 300:
+        return f"status {status_code}"
+    without_scripts = SCRIPT.sub(" ", text)
+    visible = " ".join(TAG.sub(" ", without_scripts).split())
+    if len(visible) < min_text_length:
+        # short pages with a challenge are blocked, the rest are rendered client side
+        if BLOCKED_MARKERS.search(text):
+            return "blocked"
+        if len(without_scripts) < len(text) / 2:
+            return "mostly script"
+        return "empty"
+    return None
+
+
+class FetchPolicy:
+    """
+    Learn the cheapest tier that works for each domain
+    """
+
+    def __init__(self, ttl: float = 24 * 3600) -> None:
+        self.ttl = ttl
+        self._tiers: dict[str, tuple[float, FetchTier]] = {}
+        self._lock = threading.Lock()
+        # number of fetches answered by each tier
+        self.counts = {tier: 0 for tier in FetchTier}
+
+    @staticmethod
+    def _domain(url: str) -> str:
+        return urlparse(url).netloc.lower()
+
+    def start_tier(self, url: str) -> FetchTier:
+        with self._lock:
+            learned = self._tiers.get(self._domain(url))
+            # retry cheaper tiers once in a while, sites change
+            if learned is None or time.monotonic() - learned[0] > self.ttl:
+                return FetchTier.DIRECT
+            return learned[1]
+
+    def record(self, url: str, tier: FetchTier) -> None:
+        with self._lock:
+            self._tiers[self._domain(url)] = (time.monotonic(), tier)
+            self.counts[tier] += 1
+
+    def tiers(self, url: str) -> list[FetchTier]:
+        """
+        Tiers to try for a URL in order
+        """
+        # without an api key zenrows can't help
+        if not zenrows_client.apikey:
+            return [FetchTier.DIRECT]
+        return [tier for tier in FetchTier if tier >= self.start_tier(url)]
+
+
+def _request(
+    tier: FetchTier,
+    url: str,
+    headers: dict = None,
+    cookies: dict = None,
+    max_bytes: int = None,
+    timeout: float = None,
+    escalates: bool = False,
+) -> dict:
+    limits = dict(max_bytes=max_bytes, accept=TEXT_KINDS, timeout=timeout)
+    # a blocked tier escalates right away instead of backing off on 429 and 503
+    if escalates:
+        limits["retries"] = 0
+    if tier == FetchTier.DIRECT:
+        return dict(url=url, headers=headers, cookies=cookies, **limits)
+    return dict(url=url, zenrows=ZENROWS_PARAMS[tier], **limits)
+
+
+class TieredFetcher:
+    """
+    Fetch webpages with the cheapest tier that returns usable content
+    """
+
+    def __init__(
+        self,
+        policy: FetchPolicy = None,
+        http: HttpClient = None,
+        min_text_length: int = 200,
+        guard: ScrapeGuard = None,
+        max_bytes: int = MAX_RESPONSE_BYTES,
+    ) -> None:
+        self.policy = policy if policy else FetchPolicy()
+        self.http = http if http else http_client
+        self.min_text_length = min_text_length
+        self.guard = guard if guard else scrape_guard
+        self.max_bytes = max_bytes
+
+    def _result(
+        self,
+        url: str,
+        tier: FetchTier,
+        response: Optional[httpx.Response],
+        error: Optional[Exception],
+        best: Optional[FetchResult],
+    ) -> tuple[Optional[FetchResult], Optional[FetchResult]]:
+        """
+        Check a tier's response, returns the final result if usable and the best result so far
+        """
+        if error is not None:
+            logger.info(f"Fetch tier {tier.name} failed for {url}: {error}")
+            return None, best
+        reason = escalation_reason(
+            response.status_code, response.text, self.min_text_length
+        )
+        result = FetchResult(
+            url=url, status_code=response.status_code, text=response.text, tier=tier
+        )
+        if reason is None:
+            self.policy.record(url, tier)
+            return result, best
+        logger.info(f"Fetch tier {tier.name} for {url} was {reason}, escalating ...")
+        # keep the best successful response in case every tier falls short
+        if response.is_success and (best is None or len(result.text) > len(best.text)):
+            best = result
+        return None, best
+
+    def _finish(
+        self, url: str, best: Optional[FetchResult], error: Optional[Exception]
+    ) -> FetchResult:
+        if best is not None:
+            self.policy.record(url, best.tier)
+            return best
+        if error is not None:
+            raise error
+        raise httpx.HTTPError(f"Could not fetch {url}")
+
+    def fetch(
+        self,
+        url: str,
+        headers: dict = None,
+        cookies: dict = None,
+        timeout: float = None,
+    ) -> FetchResult:
+        """Fetch a webpage, escalating tiers until the content is usable
+
+        Args:
+            url (str): URL to fetch
+            headers (dict, optional): headers for direct requests. Defaults to None.
+            cookies (dict, optional): cookies for direct requests. Defaults to None.
+            timeout (float, optional): timeout of each tier in seconds, defaults to the client timeout.
+
+        Returns:
+            FetchResult: the response of the first usable tier
+
+        Raises:
+            FetchSkipped: if the URL or its domain failed recently
+            UnsupportedContent: if the URL is not a webpage, e.g. a PDF or an image
+        """
+        with self.guard.track(url):
+            best, last_error = None, None
+            tiers = self.policy.tiers(url)
+            for tier in tiers:
+                response, error = None, None
+                try:
+                    response = self.http.get(
+                        **_request(
+                            tier,
+                            url,
+                            headers,
+                            cookies,
+                            self.max_bytes,
+                            timeout,
+                            escalates=tier != tiers[-1],
+                        )
+                    )
+                    if not response.is_success:
+                        last_error = httpx.HTTPStatusError(
+                            f"{response.status_code} for {url}",
+                            request=response.request,
+                            response=response,
+                        )
+                except httpx.HTTPError as e:
+                    error = last_error = e
+                result, best = self._result(url, tier, response, error, best)
+                if result is not None:
+                    return result
+            return self._finish(url, best, last_error)
+
+    async def afetch(
+        self,
+        url: str,
+        client: httpx.AsyncClient,
+        headers: dict = None,
+        cookies: dict = None,
+        timeout: float = None,
+    ) -> FetchResult:
+        """Fetch a webpage with an async client, escalating tiers until the content is usable
+
+        Args:
+            url (str): URL to fetch
+            client (httpx.AsyncClient): async client from HttpClient.async_client
+            headers (dict, optional): headers for direct requests. Defaults to None.
+            cookies (dict, optional): cookies for direct requests. Defaults to None.
+            timeout (float, optional): timeout of each tier in seconds, defaults to the client timeout.
+
+        Returns:
+            FetchResult: the response of the first usable tier
+
+        Raises:
+            FetchSkipped: if the URL or its domain failed recently
+            UnsupportedContent: if the URL is not a webpage, e.g. a PDF or an image
+        """
+        with self.guard.track(url):
+            best, last_error = None, None
+            tiers = self.policy.tiers(url)
+            for tier in tiers:
+                response, error = None, None
+                try:
+                    response = await self.http.arequest(
+                        client,
+                        "GET",
+                        **_request(
+                            tier,
+                            url,
+                            headers,
+                            cookies,
+                            self.max_bytes,
+                            timeout,
+                            escalates=tier != tiers[-1],
+                        ),
+                    )
+                    if not response.is_success:
+                        last_error = httpx.HTTPStatusError(
+                            f"{response.status_code} for {url}",
+                            request=response.request,
+                            response=response,
+                        )
+                except httpx.HTTPError as e:
+                    error = last_error = e
+                result, best = self._result(url, tier, response, error, best)
+                if result is not None:
+                    return result
+            return self._finish(url, best, last_error)
+
+
+# shared so every ingest learns from the others
+default_fetcher = TieredFetcher()
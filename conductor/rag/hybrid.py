@@ -0,0 +1,107 @@
+"""
+Hybrid lexical and vector retrieval
+- A BM25 match query and a kNN query are sent together in one msearch request
+- The two rankings are merged client-side with weighted reciprocal rank fusion
+- Exact terms like names, tickers and NAICS codes are found by the lexical side, paraphrases by the vector side
+"""
+from conductor.rag.indices import SEARCH_SOURCE, TEXT_FIELD, VECTOR_FIELD
+from conductor.rag.ranking import reciprocal_rank_fusion
+from langchain_core.documents import Document
+from pydantic import BaseModel, Field
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+class HybridSearch(BaseModel):
+    lexical_weight: float = Field(
+        default=1.0, description="Weight of the BM25 ranking in the fusion"
+    )
+    vector_weight: float = Field(
+        default=1.0, description="Weight of the kNN ranking in the fusion"
+    )
+    candidates: int = Field(
+        default=50, description="Number of hits fetched from each ranking before fusion"
+    )
+    num_candidates: int = Field(
+        default=100, description="Number of candidates kNN considers per shard"
+    )
+    rank_constant: int = Field(
+        default=60, description="Rank offset of reciprocal rank fusion"
+    )
+
+
+def hybrid_search_bodies(
+    query: str,
+    query_vector: list[float],
+    settings: HybridSearch,
+    filter: list[dict] = None,
+    routing: str = None,
+) -> list[dict]:
+    """
+    msearch headers and bodies for the lexical and the vector ranking, filters apply to both
+    """
+    lexical = {
+        "_source": SEARCH_SOURCE,
+        "query": {
+            "bool": {
+                "must": [{"match": {TEXT_FIELD: {"query": query}}}],
+                "filter": filter or [],
+            }
+        },
+        "size": settings.candidates,
+    }
+    vector = {
+        "_source": SEARCH_SOURCE,
+        "knn": {
+            "field": VECTOR_FIELD,
+            "query_vector": query_vector,
+            "k": settings.candidates,
+            "num_candidates": max(settings.num_candidates, settings.candidates),
+            # filtering inside knn keeps k hits instead of filtering them afterwards
+            "filter": filter or [],
+        },
+        "size": settings.candidates,
+    }
+    header = {"routing": routing} if routing else {}
+    return [header, lexical, header, vector]
+
+
+def _hits(response: dict) -> list[dict]:
+    # one failing search shouldn't lose the other ranking
+    if "error" in response:
+        logger.warning(f"Hybrid search ranking failed: {response['error']}")
+        return []
+    return response["hits"]["hits"]
+
+
+def document_from_hit(hit: dict) -> Document:
+    return Document(
+        id=hit["_id"],
+        page_content=hit["_source"][TEXT_FIELD],
+        metadata=hit["_source"].get("metadata", {}),
+    )
+
+
+def fuse_hybrid_responses(
+    responses: dict, k: int, settings: HybridSearch
+) -> list[tuple[Document, float]]:
+    """Merge the lexical and vector rankings of an msearch response
+
+    Args:
+        responses (dict): msearch response of hybrid_search_bodies
+        k (int): number of documents to return
+        settings (HybridSearch): weights and rank constant
+
+    Returns:
+        list[tuple[Document, float]]: documents with their fused score, best first
+    """
+    lexical, vector = (_hits(response) for response in responses["responses"])
+    fused = reciprocal_rank_fusion(
+        [lexical, vector],
+        k=settings.rank_constant,
+        weights=[settings.lexical_weight, settings.vector_weight],
+        key=lambda hit: hit["_id"],
+    )
+    return [(document_from_hit(hit), score) for hit, score in fused[:k]]
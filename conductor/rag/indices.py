@@ -0,0 +1,364 @@
+"""
+Index mappings for RAG documents
+- Indices are created with an explicit mapping instead of the one langchain auto-creates
+- Vectors are quantized HNSW (int8 by default, bbq for large dimensions) with tunable m and ef_construction
+- Vectors and raw HTML are left out of _source, only the URL gets a keyword subfield
+- The normalized URL is a keyword so variants of a webpage's URL find the same chunks
+- Indices are versioned behind an alias so they can be reindexed into a new mapping and swapped atomically
+"""
+from conductor.rag.blobs import RawContentStore
+from conductor.rag.urls import normalize_url
+from elasticsearch import AsyncElasticsearch, Elasticsearch, helpers
+from langchain_core.embeddings import Embeddings
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import Iterator, Literal, Optional
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+# bump when the mapping changes so outdated indices can be found and reindexed
+MAPPING_VERSION = 3
+# first mapping version that indexes metadata.run_id as a keyword for run filters
+RUN_ID_MAPPING_VERSION = 3
+VECTOR_FIELD = "vector"
+TEXT_FIELD = "text"
+# searches return the text and metadata, never vectors or inline raw html of older documents
+SEARCH_SOURCE = {"includes": [TEXT_FIELD, "metadata"], "excludes": ["metadata.raw"]}
+
+
+class IndexSettings(BaseModel):
+    dims: Optional[int] = Field(
+        default=None,
+        description="Vector dimensions, detected from the embeddings when None",
+    )
+    similarity: Literal[
+        "cosine", "dot_product", "l2_norm", "max_inner_product"
+    ] = Field(default="cosine", description="Vector similarity")
+    quantization: Literal["int8_hnsw", "int4_hnsw", "bbq_hnsw", "hnsw"] = Field(
+        default="int8_hnsw",
+        description="HNSW index type, bbq_hnsw needs Elasticsearch 8.18+ and at least 64 dimensions",
+    )
+    m: int = Field(default=16, description="Number of neighbors of each HNSW node")
+    ef_construction: int = Field(
+        default=100,
+        description="Number of candidates considered while building the HNSW graph",
+    )
+    shards: int = Field(default=1, description="Number of primary shards")
+    replicas: int = Field(default=1, description="Number of replicas of each shard")
+    refresh_interval: str = Field(
+        default="1s", description="How often writes become searchable"
+    )
+
+
+def index_mappings(dims: int, settings: IndexSettings) -> dict:
+    """
+    Mapping of the chunk, PDF page and image documents written by ElasticsearchRetrieverClient
+    """
+    return {
+        "_meta": {"mapping_version": MAPPING_VERSION},
+        # vectors are only read through the HNSW graph, raw html lives in the blob store
+        "_source": {"excludes": [VECTOR_FIELD, "metadata.raw"]},
+        "properties": {
+            TEXT_FIELD: {"type": "text"},
+            VECTOR_FIELD: {
+                "type": "dense_vector",
+                "dims": dims,
+                "index": True,
+                "similarity": settings.similarity,
+                "index_options": {
+                    "type": settings.quantization,
+                    "m": settings.m,
+                    "ef_construction": settings.ef_construction,
+                },
+            },
+            "metadata": {
+                "type": "object",
+                # unknown metadata is kept in _source without growing the mapping
+                "dynamic": False,
+                "properties": {
+                    # the keyword subfield serves exact URL lookups
+                    "url": {
+                        "type": "text",
+                        "fields": {
+                            "keyword": {"type": "keyword", "ignore_above": 2048}
+                        },
+                    },
+                    # lookups match any variant of a URL through its normalized form
+                    "normalized_url": {"type": "keyword", "ignore_above": 2048},
+                    "created_at": {"type": "date"},
+                    # run or subject the document was ingested for, retrieval filters on it
+                    "run_id": {"type": "keyword"},
+                    "content_type": {"type": "keyword"},
+                    "raw_hash": {"type": "keyword", "index": False},
+                    "raw_length": {"type": "long", "index": False},
+                    "chunk_index": {"type": "integer"},
+                    "chunk_start": {"type": "integer", "index": False},
+                    "chunk_end": {"type": "integer", "index": False},
+                    "chunk_count": {"type": "integer", "index": False},
+                    "page": {"type": "integer"},
+                    "path": {"type": "keyword", "index": False},
+                    "description": {"type": "text"},
+                    "image_metadata": {"type": "object", "enabled": False},
+                },
+            },
+        },
+    }
+
+
+def index_settings(settings: IndexSettings) -> dict:
+    return {
+        "number_of_shards": settings.shards,
+        "number_of_replicas": settings.replicas,
+        "refresh_interval": settings.refresh_interval,
+    }
+
+
+def versioned_index_name(alias: str) -> str:
+    return f"{alias}-{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+
+
+def create_index(
+    elasticsearch: Elasticsearch, index_name: str, dims: int, settings: IndexSettings
+) -> None:
+    elasticsearch.indices.create(
+        index=index_name,
+        mappings=index_mappings(dims, settings),
+        settings=index_settings(settings),
+    )
+
+
+def ensure_index(
+    elasticsearch: Elasticsearch,
+    alias: str,
+    dims: int,
+    settings: IndexSettings = None,
+    run_scoped: bool = False,
+) -> bool:
+    """Create a versioned index behind an alias unless the alias or an index of that name exists
+
+    Args:
+        elasticsearch (Elasticsearch): Elasticsearch client
+        alias (str): name clients read and write through
+        dims (int): vector dimensions
+        settings (IndexSettings, optional): mapping and index settings. Defaults to IndexSettings().
+        run_scoped (bool, optional): the caller filters on metadata.run_id. Defaults to False.
+
+    Returns:
+        bool: whether the index was created
+
+    Raises:
+        ValueError: if the caller is run scoped and the existing index can't filter on run ids
+    """
+    if elasticsearch.indices.exists(index=alias):
+        check_mapping_version(
+            alias, mapping_version(elasticsearch, alias), run_scoped=run_scoped
+        )
+        return False
+    settings = settings if settings else IndexSettings()
+    index_name = versioned_index_name(alias)
+    create_index(elasticsearch, index_name, dims, settings)
+    # concurrent clients may race to create the alias, the loser drops its index
+    try:
+        elasticsearch.indices.put_alias(index=index_name, name=alias)
+    except Exception:
+        elasticsearch.options(ignore_status=404).indices.delete(index=index_name)
+        if not elasticsearch.indices.exists(index=alias):
+            raise
+        return False
+    logger.info(f"Created index {index_name} for {alias}")
+    return True
+
+
+async def aensure_index(
+    elasticsearch: AsyncElasticsearch,
+    alias: str,
+    dims: int,
+    settings: IndexSettings = None,
+    run_scoped: bool = False,
+) -> bool:
+    """
+    Create a versioned index behind an alias from an event loop, see ensure_index
+    """
+    if await elasticsearch.indices.exists(index=alias):
+        mappings = await elasticsearch.indices.get_mapping(index=alias)
+        check_mapping_version(alias, _mapping_version(mappings), run_scoped=run_scoped)
+        return False
+    settings = settings if settings else IndexSettings()
+    index_name = versioned_index_name(alias)
+    await elasticsearch.indices.create(
+        index=index_name,
+        mappings=index_mappings(dims, settings),
+        settings=index_settings(settings),
+    )
+    try:
+        await elasticsearch.indices.put_alias(index=index_name, name=alias)
+    except Exception:
+        await elasticsearch.options(ignore_status=404).indices.delete(index=index_name)
+        if not await elasticsearch.indices.exists(index=alias):
+            raise
+        return False
+    logger.info(f"Created index {index_name} for {alias}")
+    return True
+
+
+def _mapping_version(mappings: dict) -> int:
+    return min(
+        index["mappings"].get("_meta", {}).get("mapping_version", 0)
+        for index in mappings.values()
+    )
+
+
+def mapping_version(elasticsearch: Elasticsearch, alias: str) -> int:
+    """
+    Mapping version of the indices behind an alias, 0 for indices not created by this module
+    """
+    return _mapping_version(elasticsearch.indices.get_mapping(index=alias))
+
+
+def check_mapping_version(alias: str, version: int, run_scoped: bool = False) -> None:
+    """
+    Warn about an outdated index, fail for run scoped callers if it can't filter on run ids
+    """
+    if version >= MAPPING_VERSION:
+        return None
+    # older mappings leave run_id unindexed or map it as text, so run filters match nothing
+    if run_scoped and version < RUN_ID_MAPPING_VERSION:
+        raise ValueError(
+            f"{alias} has mapping version {version} which doesn't index metadata.run_id "
+            "as a keyword, migrate it with conductor.rag.indices.reindex first"
+        )
+    logger.warning(
+        f"{alias} has mapping version {version} instead of {MAPPING_VERSION}, "
+        "migrate it with conductor.rag.indices.reindex"
+    )
+
+
+def needs_migration(elasticsearch: Elasticsearch, alias: str) -> bool:
+    return mapping_version(elasticsearch, alias) < MAPPING_VERSION
+
+
+def _migrate_source(source: dict, raw_store: Optional[RawContentStore]) -> dict:
+    metadata = dict(source.get("metadata", {}))
+    # older documents kept the raw html inline
+    raw = metadata.pop("raw", None)
+    if raw is not None and raw_store is not None and "raw_hash" not in metadata:
+        raw_bytes = raw.encode("utf-8")
+        metadata["raw_hash"] = raw_store.put(raw_bytes)
+        metadata["raw_length"] = len(raw_bytes)
+    if "url" in metadata and "normalized_url" not in metadata:
+        metadata["normalized_url"] = normalize_url(metadata["url"])
+    return {**source, "metadata": metadata}
+
+
+def _reindex_actions(
+    elasticsearch: Elasticsearch,
+    source_index: str,
+    target_index: str,
+    embeddings: Embeddings,
+    raw_store: Optional[RawContentStore],
+    batch_size: int,
+) -> Iterator[dict]:
+    batch = []
+
+    def flush() -> Iterator[dict]:
+        # vectors stored in _source are copied, only documents without one are embedded,
+        # like those of managed indices, which leave vectors out of _source
+        missing = [hit for hit in batch if VECTOR_FIELD not in hit["_source"]]
+        vectors = embeddings.embed_documents(
+            [hit["_source"][TEXT_FIELD] for hit in missing]
+        )
+        for hit, vector in zip(missing, vectors):
+            hit["_source"][VECTOR_FIELD] = vector
+        for hit in batch:
+            action = {
+                "_index": target_index,
+                "_id": hit["_id"],
+                "_source": _migrate_source(hit["_source"], raw_store),
+            }
+            # documents routed by run stay on their run's shard
+            if "_routing" in hit:
+                action["_routing"] = hit["_routing"]
+            yield action
+        batch.clear()
+
+    for hit in helpers.scan(elasticsearch, index=source_index, size=batch_size):
+        batch.append(hit)
+        if len(batch) >= batch_size:
+            yield from flush()
+    yield from flush()
+
+
+def reindex(
+    elasticsearch: Elasticsearch,
+    alias: str,
+    embeddings: Embeddings,
+    settings: IndexSettings = None,
+    raw_store: RawContentStore = None,
+    batch_size: int = 500,
+    delete_old: bool = False,
+) -> str:
+    """Copy an index into a new index with the current mapping and point the alias at it
+
+    Writes made while reindexing go to the old index and are not copied, so pause ingestion first.
+
+    Args:
+        elasticsearch (Elasticsearch): Elasticsearch client
+        alias (str): alias, or the name of a legacy index which is replaced by an alias of the same name
+        embeddings (Embeddings): embeddings for documents whose vector isn't in _source
+        settings (IndexSettings, optional): mapping and index settings. Defaults to IndexSettings().
+        raw_store (RawContentStore, optional): moves inline raw html of older documents to the blob store. Defaults to dropping it.
+        batch_size (int, optional): documents per scroll page and embedding batch. Defaults to 500.
+        delete_old (bool, optional): delete the old indices behind an alias. Legacy indices are always deleted, an alias can't share their name. Defaults to False.
+
+    Returns:
+        str: name of the new index
+    """
+    settings = settings if settings else IndexSettings()
+    dims = settings.dims or len(embeddings.embed_query("dimensions"))
+    old_indices = list(elasticsearch.indices.get_alias(index=alias).keys())
+    legacy = old_indices == [alias]
+    index_name = versioned_index_name(alias)
+    # no replicas or refreshes while bulk loading
+    create_index(
+        elasticsearch,
+        index_name,
+        dims,
+        settings.model_copy(update={"replicas": 0, "refresh_interval": "-1"}),
+    )
+    copied, errors = helpers.bulk(
+        elasticsearch,
+        _reindex_actions(
+            elasticsearch, alias, index_name, embeddings, raw_store, batch_size
+        ),
+        chunk_size=batch_size,
+        raise_on_error=False,
+    )
+    if errors:
+        elasticsearch.indices.delete(index=index_name)
+        raise RuntimeError(
+            f"Reindexing {alias} failed for {len(errors)} documents: {errors[:3]}"
+        )
+    elasticsearch.indices.put_settings(
+        index=index_name,
+        settings={
+            "number_of_replicas": settings.replicas,
+            "refresh_interval": settings.refresh_interval,
+        },
+    )
+    elasticsearch.indices.refresh(index=index_name)
+    if legacy:
+        # removing the legacy index and adding the alias happen in one atomic step
+        actions = [{"remove_index": {"index": alias}}]
+    else:
+        actions = [
+            {"remove": {"index": index, "alias": alias}} for index in old_indices
+        ]
+    actions.append({"add": {"index": index_name, "alias": alias}})
+    elasticsearch.indices.update_aliases(actions=actions)
+    if delete_old and not legacy:
+        elasticsearch.indices.delete(index=",".join(old_indices))
+    logger.info(f"Reindexed {copied} documents of {alias} into {index_name}")
+    return index_name
@@ -1,7 +1,7 @@
 """
 Ingest of raw data into Pydantic model
 """
-from conductor.rag.models import WebPage, SourcedImageDescription
+from conductor.rag.models import WebPage, SourcedImageDescription, IngestResult
 from conductor.reports.models import (
     Graph,
     RelationshipType,
@@ -10,13 +10,15 @@ from conductor.reports.models import (
 )
 from conductor.chains.tools import ImageProcessor
 from conductor.chains import relationships_to_image_query, run_create_caption_chain
-from bs4 import BeautifulSoup
 from datetime import datetime
 from conductor.rag.client import ElasticsearchRetrieverClient
-from conductor.zen import zenrows_client
+from conductor.rag.extract import default_parse_executor
+from conductor.rag.fetch import default_fetcher
+from conductor.rag.pdf import ingest_pdf, is_pdf_url
+from conductor.http import UnsupportedContent
+from conductor.rag.singleflight import url_ingest_key, url_ingests
 from conductor.llms import openai_gpt_4o
 from langchain_core.language_models.chat_models import BaseChatModel
-import requests
 import logging
 from tqdm import tqdm
 from typing import Union
@@ -26,62 +28,88 @@ logger = logging.getLogger(__name__)
 
 
 # text data from websites
-def ingest_webpage(url: str, limit: int = 50000, **kwargs) -> WebPage:
+def parse_webpage(
+    url: str, response_text: str, created_at: datetime = None, limit: int = None
+) -> WebPage:
     """
-    Ingest webpage from URL
+    Parse raw HTML from a fetched webpage into a WebPage
     """
-    response = None
+    # main content only, paragraphs are kept apart for chunking
+    text = default_parse_executor().extract(response_text).text[:limit]
+    return WebPage(
+        url=url,
+        created_at=created_at if created_at else datetime.now(),
+        content=text,
+        raw=response_text,
+    )
+
+
+def ingest_webpage(url: str, limit: int = None, **kwargs) -> WebPage:
+    """
+    Ingest webpage from URL with the cheapest fetch tier that returns usable content
+    """
+    # get a created at timestamp
+    created_at = datetime.now()
+    # pdfs have pages rather than a single page of content, see ingest_pdf
+    if is_pdf_url(url):
+        raise UnsupportedContent(url, "pdf")
+    # plain request first, zenrows and js rendering only when the page needs them
+    response = default_fetcher.fetch(
+        url,
+        headers=kwargs.get("headers"),
+        cookies=kwargs.get("cookies"),
+        timeout=kwargs.get("timeout"),
+    )
+    return parse_webpage(
+        url=url,
+        response_text=response.text,
+        created_at=created_at,
+        limit=limit,
+    )
+
+
+def ingest_url(
+    url: str, client: ElasticsearchRetrieverClient, **kwargs
+) -> IngestResult:
+    """
+    Ingest webpage from URL to Elasticsearch, skipping near-duplicates of indexed pages
+    """
+    # concurrent ingests of the same page in this process share one fetch and index
+    result = url_ingests.do(
+        url_ingest_key(client.index_name, url, client.run_id, client.routing),
+        lambda: _ingest_url(url, client, **kwargs),
+    )
+    return result.model_copy(update={"url": url})
+
+
+def _ingest_url(
+    url: str, client: ElasticsearchRetrieverClient, **kwargs
+) -> IngestResult:
+    # ingest webpage, pdfs are detected from the URL or the first bytes of the response
     try:
-        # get a created at timestamp
-        created_at = datetime.now()
-        # handle pdfs by passing for now
-        if not url.endswith("pdf"):
-            # use zenrows to get the text from the webpage
-            params = dict(
-                js_render="true",
-                premium_proxy="true",
-            )
-            zen_response = zenrows_client.get(url, params=params, timeout=10)
-            # process response and try with requests if not successful
-            if not zen_response.ok:
-                print(f"Zenrows Error: {zen_response.status_code}")
-                print(f"Zenrows Error: {zen_response.text}")
-                print("Sending request with requests instead ...")
-                normal_response = requests.get(url, **kwargs)
-                if not normal_response.ok:
-                    print(f"Requests Error: {zen_response.status_code}")
-                    print(f"Requests Error: {zen_response.text}")
-                    normal_response.raise_for_status()
-                else:
-                    response = normal_response
-            else:
-                response = zen_response
-            # process response if successful
-            if response:
-                # get text from response
-                response_text = response.text
-                # parse with BeautifulSoup
-                soup = BeautifulSoup(response_text, "html.parser")
-                # get text from soup
-                text = soup.get_text(strip=True)
-                # get the first limit characters
-                text = text[:limit]
-                # use the partition_text function
-                return WebPage(
-                    url=url, created_at=created_at, content=text, raw=response_text
-                )
-    except Exception as e:
-        raise e
+        webpage = ingest_webpage(url, **kwargs)
+    except UnsupportedContent as e:
+        if e.kind != "pdf":
+            raise
+        return ingest_pdf(
+            url, client, headers=kwargs.get("headers"), cookies=kwargs.get("cookies")
+        )
+    # skip embedding and indexing for near-duplicates
+    canonical_url = client.find_duplicate_webpage(webpage)
+    if canonical_url:
+        logger.info(f"{url} is a near-duplicate of {canonical_url}, skipping ...")
+        return IngestResult(url=url, duplicate_of=canonical_url)
+    # insert document
+    document_ids = client.create_insert_webpage_document(webpage)
+    client.register_webpage_fingerprint(webpage)
+    return IngestResult(url=url, document_ids=document_ids)
 
 
 def url_to_db(url: str, client: ElasticsearchRetrieverClient, **kwargs) -> list[str]:
     """
     Ingest webpage from URL to Elasticsearch
     """
-    # ingest webpage
-    webpage = ingest_webpage(url, **kwargs)
-    # insert document
-    return client.create_insert_webpage_document(webpage)
+    return ingest_url(url, client, **kwargs).document_ids
 
 
 # image data from urls
@@ -18,3 +18,28 @@ class SourcedImageDescription(BaseModel):
     )
     source: str = Field(..., description="The source url of the image")
     path: Optional[str] = Field(..., description="The path to the image")
+
+
+class IngestResult(BaseModel):
+    url: str = Field(..., description="The URL that was ingested")
+    document_ids: list[str] = Field(
+        default_factory=list, description="The ids of the documents added"
+    )
+    exists: bool = Field(
+        default=False, description="Whether the URL was already in the index"
+    )
+    duplicate_of: Optional[str] = Field(
+        default=None, description="The canonical URL if the page is a near-duplicate"
+    )
+    error: Optional[str] = Field(
+        default=None, description="The error raised while ingesting the URL"
+    )
+
+    def to_message(self) -> str:
+        if self.error:
+            return f"Error processing: {self.url}"
+        if self.exists:
+            return "Document already exists in the vector database"
+        if self.duplicate_of:
+            return f"Document is a near-duplicate of {self.duplicate_of} which already exists in the vector database"
+        return f"New documents added: {', '.join(self.document_ids)}"
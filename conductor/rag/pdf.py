@@ -0,0 +1,150 @@
+"""
+PDF ingestion
+- PDFs are streamed to a temporary spool file with a byte limit instead of being read into memory
+- Text is extracted page by page and each page is chunked and indexed as soon as it is extracted
+- A page limit keeps long filings from stalling a worker
+"""
+from conductor.health import scrape_guard
+from conductor.http import HttpClient, http_client
+from conductor.rag.client import ElasticsearchRetrieverClient
+from conductor.rag.models import IngestResult
+from pypdf import PdfReader
+from datetime import datetime
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO, Iterator
+from urllib.parse import urlparse
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+MAX_PDF_BYTES = 50 * 1024 * 1024
+MAX_PDF_PAGES = 100
+# spooled pdfs stay in memory up to this size, larger ones move to disk
+SPOOL_MEMORY_BYTES = 1024 * 1024
+PDF_KINDS = frozenset({"pdf"})
+# chunk offsets run on across pages with this gap, merge_chunks joins chunks that
+# don't overlap with a space so merged pages come out separated by one
+PAGE_SEPARATOR = " "
+
+
+def is_pdf_url(url: str) -> bool:
+    return urlparse(url).path.lower().endswith(".pdf")
+
+
+def spool_pdf(
+    url: str,
+    http: HttpClient = None,
+    headers: dict = None,
+    cookies: dict = None,
+    max_bytes: int = MAX_PDF_BYTES,
+    timeout: float = 30.0,
+) -> SpooledTemporaryFile:
+    """Download a PDF into a temporary spool file
+
+    Args:
+        url (str): URL of the PDF
+        http (HttpClient, optional): HTTP client. Defaults to the shared client.
+        headers (dict, optional): request headers. Defaults to None.
+        cookies (dict, optional): request cookies. Defaults to None.
+        max_bytes (int, optional): largest PDF to download. Defaults to MAX_PDF_BYTES.
+        timeout (float, optional): timeout in seconds. Defaults to 30.0.
+
+    Returns:
+        SpooledTemporaryFile: the PDF, positioned at the start
+
+    Raises:
+        ResponseTooLarge: if the PDF is larger than max_bytes
+        UnsupportedContent: if the response is not a PDF
+    """
+    http = http if http else http_client
+    file = SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+    try:
+        response = http.download(
+            url,
+            file,
+            headers=headers,
+            cookies=cookies,
+            timeout=timeout,
+            max_bytes=max_bytes,
+            accept=PDF_KINDS,
+        )
+        response.raise_for_status()
+    except Exception:
+        file.close()
+        raise
+    file.seek(0)
+    return file
+
+
+def iter_pdf_pages(
+    file: BinaryIO, max_pages: int = MAX_PDF_PAGES
+) -> Iterator[tuple[int, str]]:
+    """
+    Yield the page number, starting at 1, and the text of each page with text
+    """
+    reader = PdfReader(file)
+    page_count = len(reader.pages)
+    if page_count > max_pages:
+        logger.info(f"Only extracting the first {max_pages} of {page_count} pages")
+    for page_number in range(1, min(page_count, max_pages) + 1):
+        try:
+            text = reader.pages[page_number - 1].extract_text()
+        except Exception as e:
+            # one broken page shouldn't lose the rest of the document
+            logger.warning(f"Could not extract page {page_number}: {e}")
+            continue
+        if text and text.strip():
+            yield page_number, text
+
+
+def ingest_pdf(
+    url: str,
+    client: ElasticsearchRetrieverClient,
+    headers: dict = None,
+    cookies: dict = None,
+    max_bytes: int = MAX_PDF_BYTES,
+    max_pages: int = MAX_PDF_PAGES,
+    http: HttpClient = None,
+) -> IngestResult:
+    """Download a PDF and index it page by page
+
+    Args:
+        url (str): URL of the PDF
+        client (ElasticsearchRetrieverClient): Elasticsearch client
+        headers (dict, optional): request headers. Defaults to None.
+        cookies (dict, optional): request cookies. Defaults to None.
+        max_bytes (int, optional): largest PDF to download. Defaults to MAX_PDF_BYTES.
+        max_pages (int, optional): number of pages to index. Defaults to MAX_PDF_PAGES.
+        http (HttpClient, optional): HTTP client. Defaults to the shared client.
+
+    Returns:
+        IngestResult: ids of the documents of every indexed page
+    """
+    created_at = datetime.now()
+    with scrape_guard.track(url):
+        file = spool_pdf(
+            url, http=http, headers=headers, cookies=cookies, max_bytes=max_bytes
+        )
+    document_ids = []
+    with file:
+        chunk_index = 0
+        offset = 0
+        for page_number, text in iter_pdf_pages(file, max_pages=max_pages):
+            documents = client.create_pdf_page_documents(
+                url=url,
+                page_number=page_number,
+                text=text,
+                created_at=created_at,
+                first_chunk_index=chunk_index,
+                offset=offset,
+            )
+            chunk_index += len(documents)
+            offset += len(text) + len(PAGE_SEPARATOR)
+            document_ids.extend(client.insert_documents(documents))
+    # the number of chunks is only known once every page is indexed
+    if document_ids:
+        client.update_chunk_count(document_ids, len(document_ids))
+    logger.info(f"Indexed {len(document_ids)} chunks of {url}")
+    return IngestResult(url=url, document_ids=document_ids)
@@ -0,0 +1,97 @@
+"""
+Ranking helpers for results from several retrievers or search engines
+- Reciprocal rank fusion scores each item by the sum of 1 / (k + rank) over the rankings it appears in
+- Items are matched across rankings with a key, e.g. a normalized URL
+- BM25 scores short texts like search result snippets against a query
+"""
+from collections import Counter
+from typing import Callable, Hashable, Optional, TypeVar
+import math
+import re
+
+
+T = TypeVar("T")
+WORD = re.compile(r"\w+")
+
+
+def reciprocal_rank_fusion(
+    rankings: list[list[T]],
+    k: int = 60,
+    weights: Optional[list[float]] = None,
+    key: Callable[[T], Hashable] = lambda item: item,
+) -> list[tuple[T, float]]:
+    """Merge rankings with (weighted) reciprocal rank fusion
+
+    Args:
+        rankings (list[list[T]]): rankings, best first
+        k (int, optional): rank offset that dampens the weight of top ranks. Defaults to 60.
+        weights (Optional[list[float]], optional): weight of each ranking. Defaults to equal weights.
+        key (Callable[[T], Hashable], optional): identity of an item across rankings. Defaults to the item.
+
+    Returns:
+        list[tuple[T, float]]: unique items with their fused score, best first. The first occurrence of an item represents it.
+    """
+    if weights is None:
+        weights = [1.0] * len(rankings)
+    if len(weights) != len(rankings):
+        raise ValueError("weights must have one value per ranking")
+    scores: dict[Hashable, float] = {}
+    items: dict[Hashable, T] = {}
+    for ranking, weight in zip(rankings, weights):
+        seen = set()
+        for rank, item in enumerate(ranking, start=1):
+            item_key = key(item)
+            # only the best rank of an item counts within a ranking
+            if item_key in seen:
+                continue
+            seen.add(item_key)
+            items.setdefault(item_key, item)
+            scores[item_key] = scores.get(item_key, 0.0) + weight / (k + rank)
+    # sorted is stable, so ties keep the order items were first seen in
+    ordered = sorted(scores, key=lambda item_key: scores[item_key], reverse=True)
+    return [(items[item_key], scores[item_key]) for item_key in ordered]
+
+
+def tokenize(text: str) -> list[str]:
+    return WORD.findall(text.lower())
+
+
+def bm25_scores(
+    query: str, documents: list[str], k1: float = 1.5, b: float = 0.75
+) -> list[float]:
+    """Score documents against a query with Okapi BM25 over the documents themselves
+
+    Args:
+        query (str): query text
+        documents (list[str]): documents to score, e.g. search result titles and snippets
+        k1 (float, optional): term frequency saturation. Defaults to 1.5.
+        b (float, optional): document length normalization. Defaults to 0.75.
+
+    Returns:
+        list[float]: one score per document, 0 when no query term matches
+    """
+    tokenized = [tokenize(document) for document in documents]
+    if not tokenized:
+        return []
+    average_length = sum(len(tokens) for tokens in tokenized) / len(tokenized) or 1.0
+    document_frequencies = Counter(term for tokens in tokenized for term in set(tokens))
+    query_terms = set(tokenize(query))
+    scores = []
+    for tokens in tokenized:
+        frequencies = Counter(tokens)
+        score = 0.0
+        for term in query_terms & frequencies.keys():
+            # idf stays positive even for terms in every document
+            idf = math.log(
+                1
+                + (len(tokenized) - document_frequencies[term] + 0.5)
+                / (document_frequencies[term] + 0.5)
+            )
+            frequency = frequencies[term]
+            score += idf * (
+                frequency
+                * (k1 + 1)
+                / (frequency + k1 * (1 - b + b * len(tokens) / average_length))
+            )
+        scores.append(score)
+    return scores
@@ -0,0 +1,118 @@
+"""
+Process-wide single-flight registry
+- The first caller for a key does the work, concurrent callers wait on the same future
+- Results are cached for a while so later callers don't repeat the work
+- Failures are shared with the waiting callers but never cached
+"""
+from conductor.rag.urls import normalize_url
+from concurrent.futures import Future
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+import threading
+import time
+
+
+class SingleFlight:
+    """
+    Deduplicate concurrent work by key across threads and event loops
+    """
+
+    def __init__(self, ttl: float = 3600.0, max_size: int = 10000) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self._in_flight: dict[Hashable, Future] = {}
+        self._results: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared = 0
+        self.misses = 0
+
+    def claim(self, key: Hashable) -> tuple[Future, bool]:
+        """Get the future for a key and whether the caller has to do the work
+
+        Args:
+            key (Hashable): work key
+
+        Returns:
+            tuple[Future, bool]: future with the result, True if the caller owns the work and must resolve it
+        """
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None and time.monotonic() - cached[0] < self.ttl:
+                self.hits += 1
+                future = Future()
+                future.set_result(cached[1])
+                return future, False
+            self._results.pop(key, None)
+            if key in self._in_flight:
+                self.shared += 1
+                return self._in_flight[key], False
+            self.misses += 1
+            future = Future()
+            self._in_flight[key] = future
+            return future, True
+
+    def resolve(self, key: Hashable, result: Any, cache: bool = True) -> None:
+        """
+        Share the result of owned work with waiting callers and cache it
+        """
+        with self._lock:
+            future = self._in_flight.pop(key, None)
+            if cache:
+                self._results[key] = (time.monotonic(), result)
+                self._results.move_to_end(key)
+                while len(self._results) > self.max_size:
+                    self._results.popitem(last=False)
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    def fail(self, key: Hashable, error: BaseException) -> None:
+        """
+        Share the failure of owned work with waiting callers
+        """
+        with self._lock:
+            future = self._in_flight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_exception(error)
+
+    def do(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        """Run a function once for concurrent callers of the same key
+
+        Args:
+            key (Hashable): work key
+            function (Callable[[], Any]): work to run if nobody else is running it
+
+        Returns:
+            Any: result of the function
+        """
+        future, owner = self.claim(key)
+        if not owner:
+            return future.result()
+        try:
+            result = function()
+        except BaseException as e:
+            self.fail(key, e)
+            raise
+        self.resolve(key, result)
+        return result
+
+    def forget(self, key: Hashable) -> None:
+        """
+        Drop the cached result of a key
+        """
+        with self._lock:
+            self._results.pop(key, None)
+
+
+# webpage ingests in this process, keyed by index, run and normalized URL
+url_ingests = SingleFlight()
+
+
+def url_ingest_key(
+    index_name: str,
+    url: str,
+    run_id: Optional[str] = None,
+    routing: Optional[str] = None,
+) -> tuple:
+    # runs write their own copy of a page, so they never share an ingest
+    return (index_name, run_id, routing, normalize_url(url))
@@ -0,0 +1,80 @@
+"""
+URL normalization and deterministic document ids
+- URLs that only differ by scheme, trailing slash, tracking parameters or fragment are the same page
+- Document ids hash the normalized URL so writes of the same page overwrite each other
+"""
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import hashlib
+
+
+TRACKING_PARAMETERS = {
+    "_ga",
+    "_gl",
+    "dclid",
+    "fbclid",
+    "gclid",
+    "gclsrc",
+    "igshid",
+    "mc_cid",
+    "mc_eid",
+    "msclkid",
+    "ref_src",
+    "srsltid",
+    "yclid",
+}
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def _is_tracking_parameter(name: str) -> bool:
+    name = name.lower()
+    return name.startswith("utm_") or name in TRACKING_PARAMETERS
+
+
+def normalize_url(url: str) -> str:
+    """Normalize a URL so variants of the same page compare equal
+
+    Args:
+        url (str): URL to normalize
+
+    Returns:
+        str: https URL with a lowercase host, no default port, trailing slash, tracking parameters or fragment
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS:
+        return url.strip()
+    host = (parts.hostname or "").rstrip(".")
+    if parts.port and parts.port != DEFAULT_PORTS[scheme]:
+        host = f"{host}:{parts.port}"
+    path = parts.path.rstrip("/") or "/"
+    query = urlencode(
+        sorted(
+            (name, value)
+            for name, value in parse_qsl(parts.query, keep_blank_values=True)
+            if not _is_tracking_parameter(name)
+        )
+    )
+    return urlunsplit(("https", host, path, query, ""))
+
+
+def url_hash(url: str) -> str:
+    """
+    Hash the normalized form of a URL
+    """
+    return hashlib.sha256(normalize_url(url).encode("utf-8")).hexdigest()
+
+
+def webpage_document_id(url: str, chunk_index: int = 0, run_id: str = None) -> str:
+    """Deterministic Elasticsearch id of a webpage chunk
+
+    Args:
+        url (str): webpage URL
+        chunk_index (int, optional): index of the chunk in the webpage. Defaults to 0.
+        run_id (str, optional): run the chunk belongs to, runs keep their own copy of a page. Defaults to None.
+
+    Returns:
+        str: document id
+    """
+    if run_id:
+        return f"{run_id}-{url_hash(url)}-{chunk_index}"
+    return f"{url_hash(url)}-{chunk_index}"
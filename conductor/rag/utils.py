@@ -3,6 +3,17 @@ Utilities for RAG pipeline
 """
 from langchain_core.documents import Document
 from elastic_transport import ObjectApiResponse
+from conductor.rag.chunking import TextChunk, merge_chunks
+
+
+# the only fields get_content_and_source_from_response reads
+CONTENT_SOURCE_FIELDS = [
+    "text",
+    "metadata.url",
+    "metadata.chunk_index",
+    "metadata.chunk_start",
+    "metadata.chunk_end",
+]
 
 
 def get_page_content_with_source_url(document: Document) -> str:
@@ -16,7 +27,21 @@ def get_content_and_source_from_response(response: ObjectApiResponse) -> str:
     """
     Get content and source from response
     """
-    source_document = response["hits"]["hits"][0]["_source"]
-    text = source_document["text"]
+    hits = response["hits"]["hits"]
+    source_document = hits[0]["_source"]
     source_url = source_document["metadata"]["url"]
+    # webpages are stored as chunks, so put the page back together
+    if "chunk_index" in source_document["metadata"]:
+        text = merge_chunks(
+            TextChunk(
+                index=hit["_source"]["metadata"]["chunk_index"],
+                start=hit["_source"]["metadata"]["chunk_start"],
+                end=hit["_source"]["metadata"]["chunk_end"],
+                text=hit["_source"]["text"],
+            )
+            for hit in hits
+            if hit["_source"]["metadata"]["url"] == source_url
+        )
+    else:
+        text = source_document["text"]
     return f"Source Link: {source_url}\nContent: {text}"
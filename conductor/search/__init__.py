@@ -3,7 +3,7 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnablePassthrough
 from conductor.llms import claude_sonnet
 from langchain_elasticsearch import ElasticsearchRetriever
-from conductor.rag.embeddings import BedrockEmbeddings
+from conductor.rag.embeddings import cached_bedrock_embeddings
 from typing import Dict
 import os
 import logging
@@ -14,7 +14,7 @@ index_name = os.getenv("ELASTICSEARCH_INDEX")
 
 
 def vector_query(search_query: str) -> Dict:
-    vector = BedrockEmbeddings().embed_query(
+    vector = cached_bedrock_embeddings().embed_query(
         search_query
     )  # same embeddings as for indexing
     return {
@@ -0,0 +1,229 @@
+"""
+Cached SerpAPI searches
+- Responses are keyed by the engine and the normalized search parameters, never the API key
+- The cache lives in Redis or a local sqlite file, with a TTL per engine
+- Hit and miss counters show how many searches were answered from the cache
+"""
+from serpapi import GoogleSearch
+from redis import Redis
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Optional
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+# seconds a response stays fresh for each engine
+DEFAULT_TTLS = {
+    "google": 24 * 3600,
+    "bing": 24 * 3600,
+    "google_images": 7 * 24 * 3600,
+}
+DEFAULT_TTL = 24 * 3600
+# parameters that don't change the results
+IGNORED_PARAMETERS = {"api_key", "output", "async", "no_cache"}
+
+
+class SerpCacheStore(ABC):
+    """
+    Persistent storage for serialized search responses
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Get a stored response if it has not expired
+        """
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        """
+        Store a response for ttl seconds
+        """
+
+
+class SqliteSerpCacheStore(SerpCacheStore):
+    """
+    Store search responses in a local sqlite file
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = os.path.expanduser(path)
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite connections can't be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS searches (key TEXT PRIMARY KEY, response BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str) -> Optional[bytes]:
+        row = (
+            self._connection()
+            .execute(
+                "SELECT response FROM searches WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            )
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO searches (key, response, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl),
+            )
+
+
+class RedisSerpCacheStore(SerpCacheStore):
+    """
+    Store search responses in Redis
+    """
+
+    def __init__(self, redis: Redis, prefix: str = "serp:") -> None:
+        self.redis = redis
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.redis.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        self.redis.set(self.prefix + key, value, ex=ttl)
+
+
+def normalize_search_parameters(params: dict) -> dict:
+    """
+    Normalize SerpAPI parameters so near-identical searches share a cache key
+    """
+    normalized = {
+        name: " ".join(str(value).split())
+        for name, value in params.items()
+        if name not in IGNORED_PARAMETERS and value is not None
+    }
+    # queries keep their case, operators like OR and AND are case sensitive
+    normalized["engine"] = normalized.get("engine", "google").lower()
+    return normalized
+
+
+def search_cache_key(params: dict) -> str:
+    normalized = normalize_search_parameters(params)
+    digest = hashlib.sha256(
+        json.dumps(normalized, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    return f"{normalized['engine']}:{digest}"
+
+
+class SerpCache:
+    """
+    Answer repeated SerpAPI searches from a persistent cache
+    """
+
+    def __init__(
+        self,
+        store: SerpCacheStore,
+        ttls: dict[str, int] = None,
+        default_ttl: int = DEFAULT_TTL,
+    ) -> None:
+        self.store = store
+        self.ttls = ttls if ttls is not None else DEFAULT_TTLS
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def search(self, params: dict) -> dict:
+        """Run a SerpAPI search, answering from the cache when possible
+
+        Args:
+            params (dict): SerpAPI parameters including the api_key
+
+        Returns:
+            dict: search response
+        """
+        key = search_cache_key(params)
+        try:
+            cached = self.store.get(key)
+        except Exception as e:
+            logger.warning(f"SERP cache read failed: {e}")
+            cached = None
+        if cached is not None:
+            self._count(hit=True)
+            return json.loads(cached)
+        self._count(hit=False)
+        response = GoogleSearch(params).get_dict()
+        # never cache failed searches
+        if "error" not in response:
+            engine = normalize_search_parameters(params)["engine"]
+            try:
+                self.store.set(
+                    key,
+                    json.dumps(response).encode("utf-8"),
+                    ttl=self.ttls.get(engine, self.default_ttl),
+                )
+            except Exception as e:
+                logger.warning(f"SERP cache write failed: {e}")
+        return response
+
+
+def default_serp_cache_store() -> SerpCacheStore:
+    """
+    SERP cache store configured by REDIS_SERP_CACHE_URL, defaulting to a local sqlite file
+    """
+    if os.getenv("REDIS_SERP_CACHE_URL"):
+        return RedisSerpCacheStore(
+            redis=Redis.from_url(os.getenv("REDIS_SERP_CACHE_URL"))
+        )
+    return SqliteSerpCacheStore(
+        path=os.getenv(
+            "SERP_CACHE_PATH", os.path.join("~", ".cache", "conductor", "serp.sqlite")
+        )
+    )
+
+
+@lru_cache(maxsize=1)
+def default_serp_cache() -> SerpCache:
+    """
+    Process-wide SERP cache
+    """
+    return SerpCache(store=default_serp_cache_store())
+
+
+def serp_search(params: dict) -> dict:
+    """Run a SerpAPI search through the process-wide cache
+
+    Args:
+        params (dict): SerpAPI parameters including the api_key
+
+    Returns:
+        dict: search response
+    """
+    return default_serp_cache().search(params)
@@ -0,0 +1,73 @@
+"""
+Micro-benchmark of HTML text extraction against the previous BeautifulSoup code
+- Run with python -m tests.benchmark_extract [directory of .html files]
+- Without a directory a synthetic news page with navigation and footer is used
+"""
+from conductor.rag.extract import extract_text
+from bs4 import BeautifulSoup
+import glob
+import os
+import sys
+import time
+
+
+def synthetic_page(paragraphs: int = 60) -> str:
+    navigation = "".join(
+        f'<li><a href="/section/{i}">Section {i}</a></li>' for i in range(40)
+    )
+    body = "".join(
+        f"<p>Paragraph {i} of the article discusses <b>pricing</b>, <a href='/x'>markets</a> "
+        f"and the competitive landscape in some detail. {'Lorem ipsum dolor sit amet. ' * 8}</p>"
+        for i in range(paragraphs)
+    )
+    scripts = "".join(
+        f"<script>window.data{i} = {list(range(50))};</script>" for i in range(10)
+    )
+    return f"""<html><head><title>News</title><style>{'.a{color:red}' * 200}</style>{scripts}</head>
+    <body><header><nav><ul>{navigation}</ul></nav></header>
+    <main><article><h1>Headline</h1>{body}</article></main>
+    <aside>{navigation}</aside><footer>{navigation}</footer></body></html>"""
+
+
+def webpage_text(html: str) -> str:
+    # previous parse_webpage
+    return BeautifulSoup(html, "html.parser").get_text(strip=True)
+
+
+def clean_html_text(html: str) -> str:
+    # previous clean_html
+    text = BeautifulSoup(
+        html.encode("utf-8"), "html.parser", from_encoding="iso-8859-1"
+    ).get_text()
+    text = "\n".join([i for i in text.split("\n") if i.strip() != ""])
+    return " ".join([i for i in text.split(" ") if i.strip() != ""])
+
+
+def pages_per_second(extract, pages: list[str], seconds: float = 2.0) -> float:
+    count, started = 0, time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        for page in pages:
+            extract(page)
+        count += len(pages)
+    return count / (time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        pages = []
+        for path in glob.glob(os.path.join(sys.argv[1], "*.html")):
+            with open(path, encoding="utf-8", errors="replace") as f:
+                pages.append(f.read())
+    else:
+        pages = [synthetic_page()]
+    size = sum(len(page) for page in pages) / len(pages)
+    print(f"{len(pages)} pages, {size / 1024:.0f} KiB on average")
+    for name, extract in [
+        ("bs4 get_text (parse_webpage)", webpage_text),
+        ("bs4 split/join (clean_html)", clean_html_text),
+        ("lxml extract_text", extract_text),
+    ]:
+        text = extract(pages[0])
+        print(
+            f"{name:30} {pages_per_second(extract, pages):8.1f} pages/s {len(text):8} characters"
+        )
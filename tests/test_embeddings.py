@@ -1,4 +1,13 @@
-from conductor.rag.embeddings import BedrockEmbeddings
+from conductor.rag.embeddings import (
+    BatchedEmbeddings,
+    BedrockEmbeddings,
+    CachedEmbeddings,
+    EmbeddingMetrics,
+    SqliteEmbeddingStore,
+    pack_vector,
+    unpack_vector,
+)
+from langchain_core.embeddings import Embeddings
 
 
 def test_bedrock_embeddings():
@@ -6,3 +15,102 @@ def test_bedrock_embeddings():
     embeddings = bedrock_embeddings.embed_query("Hello, world!")
     assert isinstance(embeddings, list)
     assert len(embeddings) > 0
+
+
+class CountingEmbeddings(Embeddings):
+    model_id = "counting"
+
+    def __init__(self) -> None:
+        self.calls: list[str] = []
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.calls.extend(texts)
+        return [[float(len(text)), 0.5] for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        self.calls.append(text)
+        return [float(len(text)), 1.5]
+
+
+def test_pack_vector_round_trip():
+    assert unpack_vector(pack_vector([0.25, -1.0, 3.5])) == [0.25, -1.0, 3.5]
+
+
+def test_cached_embeddings_lru():
+    counting = CountingEmbeddings()
+    embeddings = CachedEmbeddings(embeddings=counting)
+    first = embeddings.embed_documents(["a", "bb", "a"])
+    second = embeddings.embed_documents(["bb", "ccc"])
+    assert first == [[1.0, 0.5], [2.0, 0.5], [1.0, 0.5]]
+    assert second == [[2.0, 0.5], [3.0, 0.5]]
+    assert counting.calls == ["a", "bb", "ccc"]
+    assert embeddings.hits == 2
+    assert embeddings.misses == 3
+
+
+def test_cached_embeddings_separates_queries_and_documents():
+    counting = CountingEmbeddings()
+    embeddings = CachedEmbeddings(embeddings=counting)
+    assert embeddings.embed_query("a") == [1.0, 1.5]
+    assert embeddings.embed_documents(["a"]) == [[1.0, 0.5]]
+    assert embeddings.embed_query("a") == [1.0, 1.5]
+    assert counting.calls == ["a", "a"]
+
+
+def test_cached_embeddings_sqlite_store(tmp_path):
+    store = SqliteEmbeddingStore(path=str(tmp_path / "embeddings.sqlite"))
+    CachedEmbeddings(embeddings=CountingEmbeddings(), store=store).embed_documents(
+        ["a", "bb"]
+    )
+    # a new process only has the persistent store
+    counting = CountingEmbeddings()
+    embeddings = CachedEmbeddings(embeddings=counting, store=store, max_size=1)
+    assert embeddings.embed_documents(["a", "bb"]) == [[1.0, 0.5], [2.0, 0.5]]
+    assert counting.calls == []
+
+
+class ThrottledError(Exception):
+    def __init__(self) -> None:
+        super().__init__("Too many requests")
+        self.response = {"Error": {"Code": "ThrottlingException"}}
+
+
+class ThrottledEmbeddings(CountingEmbeddings):
+    def __init__(self, throttles: int) -> None:
+        super().__init__()
+        self.throttles = throttles
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if self.throttles:
+            self.throttles -= 1
+            raise ThrottledError()
+        return super().embed_documents(texts)
+
+
+def test_batched_embeddings_preserves_order():
+    texts = ["x" * idx for idx in range(100)]
+    embeddings = BatchedEmbeddings(embeddings=CountingEmbeddings(), batch_size=7)
+    assert embeddings.embed_documents(texts) == [
+        [float(idx), 0.5] for idx in range(100)
+    ]
+    assert embeddings.model_id == "counting"
+
+
+def test_batched_embeddings_retries_throttling():
+    metrics: list[EmbeddingMetrics] = []
+    embeddings = BatchedEmbeddings(
+        embeddings=ThrottledEmbeddings(throttles=2),
+        batch_size=4,
+        max_in_flight=1,
+        backoff=0.001,
+        metrics_callback=metrics.append,
+    )
+    assert embeddings.embed_documents(["a", "bb", "ccc"]) == [
+        [1.0, 0.5],
+        [2.0, 0.5],
+        [3.0, 0.5],
+    ]
+    assert metrics[0].texts == 3
+    assert metrics[0].throttles == 2
+    # throttling shrinks the batches
+    assert embeddings.batch_size < 4
@@ -0,0 +1,89 @@
+"""
+Test the failure cache and domain health tracking
+"""
+from conductor.health import (
+    DomainHealthTracker,
+    FailureCache,
+    FetchSkipped,
+    ScrapeGuard,
+)
+import pytest
+
+
+def test_failure_cache_backs_off_exponentially() -> None:
+    failures = FailureCache(base_delay=10, max_delay=30)
+    assert failures.retry_in("https://example.com/a") is None
+    assert failures.record_failure("https://example.com/a", "timeout") == 10
+    assert failures.record_failure("https://example.com/a", "timeout") == 20
+    assert failures.record_failure("https://example.com/a", "timeout") == 30
+    # failures are shared by equivalent URLs
+    remaining, reason = failures.retry_in("http://example.com/a/?utm_source=x")
+    assert 0 < remaining <= 30
+    assert reason == "timeout"
+    failures.record_success("https://example.com/a")
+    assert failures.retry_in("https://example.com/a") is None
+
+
+def test_failure_cache_expires() -> None:
+    failures = FailureCache(base_delay=0)
+    failures.record_failure("https://example.com/a", "403")
+    assert failures.retry_in("https://example.com/a") is None
+
+
+def test_domain_health_short_circuits_failing_domains() -> None:
+    domains = DomainHealthTracker(min_requests=3, max_error_rate=0.5, cooldown=600)
+    for _ in range(3):
+        assert domains.allow("https://blocked.com/page")
+        domains.record("https://blocked.com/page", 1.0, ok=False)
+    domains.record("https://fine.com/page", 0.5, ok=True)
+    assert not domains.allow("https://blocked.com/other")
+    assert domains.allow("https://fine.com/other")
+    health = domains.snapshot()
+    assert health["blocked.com"].error_rate == 1.0
+    assert not health["blocked.com"].healthy
+    assert health["blocked.com"].skipped == 1
+    assert health["fine.com"].p95_seconds == 0.5
+
+
+def test_domain_health_probes_after_cooldown() -> None:
+    domains = DomainHealthTracker(min_requests=1, cooldown=0)
+    domains.record("https://blocked.com/page", 1.0, ok=False)
+    assert domains.allow("https://blocked.com/page")
+
+
+def test_domain_health_prioritizes_healthy_domains() -> None:
+    domains = DomainHealthTracker(min_requests=2, slow_seconds=5)
+    for _ in range(2):
+        domains.record("https://blocked.com/page", 1.0, ok=False)
+        domains.record("https://slow.com/page", 20.0, ok=True)
+        domains.record("https://fast.com/page", 0.2, ok=True)
+    urls = [
+        "https://blocked.com/a",
+        "https://slow.com/a",
+        "https://new.com/a",
+        "https://fast.com/a",
+    ]
+    assert domains.prioritize(urls) == [
+        "https://new.com/a",
+        "https://fast.com/a",
+        "https://slow.com/a",
+        "https://blocked.com/a",
+    ]
+
+
+def test_scrape_guard_skips_recent_failures() -> None:
+    guard = ScrapeGuard()
+    with pytest.raises(TimeoutError):
+        with guard.track("https://example.com/slow"):
+            raise TimeoutError("timed out")
+    with pytest.raises(FetchSkipped, match="timed out"):
+        with guard.track("https://example.com/slow"):
+            pass
+    with guard.track("https://example.com/fast"):
+        pass
+    assert guard.snapshot()["counts"] == {
+        "fetched": 1,
+        "failed": 1,
+        "skipped_urls": 1,
+        "skipped_domains": 0,
+    }
@@ -0,0 +1,102 @@
+"""
+Test the concurrent page fetching and result ranking of the SERP tools
+"""
+from conductor.crews.marketing.tools import SerpSearchTool
+from conductor.crews.rag_marketing.tools import (
+    ScrapeWebsiteWithContentIngestTool,
+    SerpSearchEngineIngestTool,
+    VectorSearchMetaTool,
+)
+from conductor.rag.models import WebPage
+from elasticsearch import Elasticsearch
+from datetime import datetime
+import os
+import time
+
+
+class SlowPagesSerpSearchTool(SerpSearchTool):
+    def _get_page_content(self, url: str) -> str:
+        if "slow" in url:
+            time.sleep(1)
+        if "broken" in url:
+            raise ValueError("unreachable")
+        return f"Content of {url}"
+
+
+RESULTS = {
+    "organic_results": [
+        {"link": f"https://{name}.com", "title": name, "snippet": f"About {name}"}
+        for name in ["first", "slow", "broken", "last"]
+    ]
+}
+
+
+def test_serp_search_tool_fetches_pages_concurrently() -> None:
+    tool = SlowPagesSerpSearchTool(deadline=0.3)
+    started = time.perf_counter()
+    contents = tool._get_page_contents(
+        [result["link"] for result in RESULTS["organic_results"]]
+    )
+    assert time.perf_counter() - started < 1
+    assert contents == [
+        "Content of https://first.com",
+        "Skipped: https://slow.com did not load within 0.3 seconds.",
+        "Error: Unable to fetch page content for https://broken.com.",
+        "Content of https://last.com",
+    ]
+
+
+def test_serp_search_tool_context_keeps_result_order() -> None:
+    context = SlowPagesSerpSearchTool(deadline=0.3)._build_search_context(RESULTS)
+    assert context.index("Title: first") < context.index("Title: slow")
+    assert context.index("Title: broken") < context.index("Title: last")
+
+
+def test_serp_search_engine_ingest_tool_ranks_by_relevance() -> None:
+    search_results = [
+        {
+            "organic_results": [
+                {"link": "https://a.com", "title": "Weather", "snippet": "Rain"},
+                {"link": "https://b.com", "title": "Acme pricing", "snippet": "Plans"},
+            ]
+        },
+        {"organic_results": [{"link": "https://c.com", "title": "Sports"}]},
+    ]
+    tool = SerpSearchEngineIngestTool.construct()
+    assert tool._rank_urls(search_results, "acme pricing") == [
+        "https://b.com",
+        "https://a.com",
+        "https://c.com",
+    ]
+    # results that share no term with the query are kept in their fused order
+    assert tool._rank_urls(search_results, "naics code") == [
+        "https://a.com",
+        "https://c.com",
+        "https://b.com",
+    ]
+    tool.min_relevance = 0.0
+    assert tool._rank_urls(search_results, "acme pricing") == ["https://b.com"]
+
+
+def test_ingest_tools_read_url_variants(elasticsearch_test_index) -> None:
+    """A webpage ingested under one URL variant is read back through another"""
+    elasticsearch = Elasticsearch(hosts=[os.getenv("ELASTICSEARCH_URL")])
+    ingest_tool = ScrapeWebsiteWithContentIngestTool(
+        elasticsearch=elasticsearch, index_name=elasticsearch_test_index
+    )
+    ingest_tool._vector_database.create_insert_webpage_document(
+        WebPage(
+            url="https://www.example.com/pricing?utm_source=newsletter",
+            created_at=datetime.now(),
+            content="Acme costs 10 dollars a month.",
+            raw="<p>Acme costs 10 dollars a month.</p>",
+        )
+    )
+    # already ingested, so the variant is read from the index without fetching it
+    content = ingest_tool._run(website_url="http://www.example.com/pricing/")
+    assert "Acme costs 10 dollars a month." in content
+    meta_tool = VectorSearchMetaTool(
+        elasticsearch=elasticsearch, index_name=elasticsearch_test_index
+    )
+    content = meta_tool._run(url="https://www.example.com/pricing#plans")
+    assert "Acme costs 10 dollars a month." in content
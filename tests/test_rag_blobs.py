@@ -0,0 +1,38 @@
+"""
+Test the raw content stores
+"""
+from conductor.rag.blobs import (
+    LocalBlobStore,
+    content_hash,
+    raw_content_store_from_url,
+)
+import pytest
+
+
+def test_local_blob_store_round_trip(tmp_path) -> None:
+    store = LocalBlobStore(directory=str(tmp_path))
+    content = b"<html><body>Hello, world!</body></html>" * 100
+    key = store.put(content)
+    assert key == content_hash(content)
+    assert store.exists(key)
+    assert store.get(key) == content
+
+
+def test_local_blob_store_is_content_addressed(tmp_path) -> None:
+    store = LocalBlobStore(directory=str(tmp_path))
+    first = store.put(b"same content")
+    second = store.put(b"same content")
+    assert first == second
+    assert len([path for path in tmp_path.rglob("*") if path.is_file()]) == 1
+
+
+def test_local_blob_store_missing(tmp_path) -> None:
+    store = LocalBlobStore(directory=str(tmp_path))
+    assert not store.exists(content_hash(b"missing"))
+    with pytest.raises(KeyError):
+        store.get(content_hash(b"missing"))
+
+
+def test_raw_content_store_from_url(tmp_path) -> None:
+    store = raw_content_store_from_url(str(tmp_path / "raw"))
+    assert isinstance(store, LocalBlobStore)
@@ -0,0 +1,145 @@
+"""
+Test the write-behind bulk indexer with in-memory stand-ins for Elasticsearch
+"""
+from conductor.rag.bulk import BulkIndexer, release_bulk_indexer, shared_bulk_indexer
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+import pytest
+import threading
+
+
+class FakeEmbeddings(Embeddings):
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [[float(len(text))] for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return [float(len(text))]
+
+
+class FakeStore:
+    def __init__(self, fail: bool = False) -> None:
+        self.fail = fail
+        self.writes: list[dict] = []
+
+    def add_embeddings(self, text_embeddings, metadatas, ids, refresh_indices):
+        if self.fail:
+            raise ValueError("bulk failed")
+        self.writes.append(
+            {
+                "text_embeddings": text_embeddings,
+                "ids": ids,
+                "refresh_indices": refresh_indices,
+            }
+        )
+        return ids
+
+
+class FakeIndices:
+    def __init__(self) -> None:
+        self.refreshed: list[str] = []
+
+    def refresh(self, index: str) -> None:
+        self.refreshed.append(index)
+
+
+class FakeElasticsearch:
+    def __init__(self) -> None:
+        self.indices = FakeIndices()
+
+
+def create_indexer(store: FakeStore, **kwargs) -> BulkIndexer:
+    return BulkIndexer(
+        elasticsearch=FakeElasticsearch(),
+        store=store,
+        embeddings=FakeEmbeddings(),
+        index_name="test",
+        **kwargs,
+    )
+
+
+def document(url: str, text: str = "text") -> Document:
+    return Document(page_content=text, metadata={"url": url})
+
+
+def test_bulk_indexer_batches_concurrent_writes() -> None:
+    store = FakeStore()
+    indexer = create_indexer(store, max_documents=100, flush_interval=60)
+    threads = [
+        threading.Thread(target=indexer.add, args=([document(f"https://a.com/{idx}")],))
+        for idx in range(20)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert indexer.is_pending("https://a.com/3")
+    assert store.writes == []
+    indexer.flush()
+    assert len(store.writes) == 1
+    assert len(store.writes[0]["ids"]) == 20
+    assert not store.writes[0]["refresh_indices"]
+    assert indexer.elasticsearch.indices.refreshed == ["test"]
+    assert not indexer.is_pending("https://a.com/3")
+    indexer.close()
+
+
+def test_bulk_indexer_flushes_by_size() -> None:
+    store = FakeStore()
+    indexer = create_indexer(store, max_documents=2, flush_interval=60)
+    ids = indexer.add([document("https://a.com", "a"), document("https://b.com", "bb")])
+    indexer.add([document("https://c.com", "ccc")], embeddings=[[9.0]])
+    indexer.close()
+    assert [write["ids"] for write in store.writes][0] == ids
+    assert store.writes[0]["text_embeddings"] == [("a", [1.0]), ("bb", [2.0])]
+    assert store.writes[1]["text_embeddings"] == [("ccc", [9.0])]
+    assert indexer.elasticsearch.indices.refreshed == []
+    indexer.flush()
+    indexer.flush()
+    # the second flush has nothing to refresh
+    assert indexer.elasticsearch.indices.refreshed == ["test"]
+
+
+def test_bulk_indexer_flush_raises_write_errors() -> None:
+    indexer = create_indexer(FakeStore(fail=True), flush_interval=0.01)
+    indexer.add([document("https://a.com")])
+    with pytest.raises(ValueError):
+        indexer.flush(refresh=False)
+    # the failed url can be ingested again
+    assert not indexer.is_pending("https://a.com")
+    indexer.close()
+
+
+def test_shared_bulk_indexer_released_by_last_client() -> None:
+    elasticsearch, store, embeddings = (
+        FakeElasticsearch(),
+        FakeStore(),
+        FakeEmbeddings(),
+    )
+    first = shared_bulk_indexer(elasticsearch, store, embeddings, "test", run_id="run")
+    second = shared_bulk_indexer(elasticsearch, store, embeddings, "test", run_id="run")
+    assert first is second
+    # other runs, routings and embeddings never share a buffer
+    assert shared_bulk_indexer(elasticsearch, store, embeddings, "test") is not first
+    assert (
+        shared_bulk_indexer(
+            elasticsearch, store, embeddings, "test", run_id="run", routing="run"
+        )
+        is not first
+    )
+    assert (
+        shared_bulk_indexer(
+            elasticsearch, store, FakeEmbeddings(), "test", run_id="run"
+        )
+        is not first
+    )
+    first.add([document("https://a.com")])
+    release_bulk_indexer(first)
+    assert store.writes == []
+    # the last client writes the remaining documents and stops the thread
+    release_bulk_indexer(second)
+    assert len(store.writes) == 1
+    assert not first._thread.is_alive()
+    assert (
+        shared_bulk_indexer(elasticsearch, store, embeddings, "test", run_id="run")
+        is not first
+    )
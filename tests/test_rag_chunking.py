@@ -0,0 +1,58 @@
+"""
+Test the text chunker
+"""
+from conductor.rag.chunking import (
+    chunk_text,
+    count_tokens,
+    merge_chunks,
+    split_sentences,
+)
+import pytest
+
+
+TEXT = " ".join(
+    f"Sentence number {idx} talks about the company and its customers."
+    for idx in range(50)
+)
+
+
+def test_split_sentences() -> None:
+    text = "First sentence. Second sentence!Third one?\nFourth"
+    sentences = [text[start:end] for start, end in split_sentences(text)]
+    assert sentences == ["First sentence.", "Second sentence!", "Third one?", "Fourth"]
+
+
+def test_chunk_text_respects_token_budget() -> None:
+    chunks = list(chunk_text(TEXT, max_tokens=40, overlap_tokens=10))
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk.text) <= 40 for chunk in chunks)
+    assert [chunk.index for chunk in chunks] == list(range(len(chunks)))
+    # chunks are exact spans of the text
+    assert all(TEXT[chunk.start : chunk.end] == chunk.text for chunk in chunks)
+
+
+def test_chunk_text_overlaps_sentences() -> None:
+    chunks = list(chunk_text(TEXT, max_tokens=40, overlap_tokens=15))
+    for previous, current in zip(chunks, chunks[1:]):
+        assert current.start < previous.end
+
+
+def test_chunk_text_splits_long_sentences() -> None:
+    text = " ".join(["word"] * 100)
+    chunks = list(chunk_text(text, max_tokens=30, overlap_tokens=0))
+    assert len(chunks) == 4
+    assert all(count_tokens(chunk.text) <= 30 for chunk in chunks)
+
+
+def test_chunk_text_invalid_overlap() -> None:
+    with pytest.raises(ValueError):
+        list(chunk_text(TEXT, max_tokens=10, overlap_tokens=10))
+
+
+def test_merge_chunks_restores_text() -> None:
+    chunks = list(chunk_text(TEXT, max_tokens=40, overlap_tokens=10))
+    assert merge_chunks(reversed(chunks)) == TEXT
+
+
+def test_chunk_text_empty() -> None:
+    assert list(chunk_text("")) == []
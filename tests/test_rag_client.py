@@ -1,9 +1,17 @@
 """
 Test the RAG client
 """
-from elasticsearch import Elasticsearch
+from elasticsearch import AsyncElasticsearch, Elasticsearch
 from tests.constants import BASEDIR, SERP_IMAGES, GRAPH_JSON
-from conductor.rag.client import ElasticsearchRetrieverClient
+from conductor.rag.client import (
+    MAX_SEARCH_SIZE,
+    AsyncElasticsearchRetrieverClient,
+    ElasticsearchRetrieverClient,
+    async_elasticsearch_client,
+    url_query,
+    url_search_body,
+)
+from conductor.rag.utils import CONTENT_SOURCE_FIELDS
 from conductor.rag.ingest import (
     url_to_db,
     image_from_url_to_db,
@@ -15,7 +23,10 @@ from conductor.reports.models import Graph, RelationshipType
 from conductor.llms import openai_gpt_4o
 from datetime import datetime
 from elastic_transport import ObjectApiResponse
+from unittest import mock
+import asyncio
 import os
+import pytest
 
 
 def test_elasticsearch_retriever_client_single_document(elasticsearch_test_index):
@@ -44,6 +55,253 @@ def test_elasticsearch_retriever_client_single_document(elasticsearch_test_index
     assert len(results) == 1
 
 
+def test_elasticsearch_retriever_client_run_scoping(elasticsearch_test_index):
+    """Runs only see the documents ingested for them"""
+    elasticsearch = Elasticsearch(
+        hosts=[os.getenv("ELASTICSEARCH_URL")],
+    )
+    embeddings = BedrockEmbeddings()
+    clients = {
+        run_id: ElasticsearchRetrieverClient(
+            elasticsearch=elasticsearch,
+            embeddings=embeddings,
+            index_name=elasticsearch_test_index,
+            run_id=run_id,
+            routing=True,
+        )
+        for run_id in ["runa", "runb"]
+    }
+    for run_id, client in clients.items():
+        client.create_insert_webpage_document(
+            WebPage(
+                url="https://www.example.com",
+                created_at=datetime.now(),
+                content=f"Hello from {run_id}!",
+                raw=f"Hello from {run_id}!",
+            )
+        )
+    for run_id, client in clients.items():
+        results = client.similarity_search(query="Hello", k=5)
+        assert [document.metadata["run_id"] for document in results] == [run_id]
+        assert client.document_exists("https://www.example.com")
+        found = client.find_document_by_url("https://www.example.com")
+        assert found["hits"]["total"]["value"] == 1
+        assert client.hybrid_search(query="Hello", k=5)[0].metadata["run_id"] == run_id
+
+
+def test_async_elasticsearch_retriever_client(elasticsearch_test_index):
+    """Test out the AsyncElasticsearchRetrieverClient with concurrent searches"""
+    client = AsyncElasticsearchRetrieverClient(
+        elasticsearch=AsyncElasticsearch(hosts=[os.getenv("ELASTICSEARCH_URL")]),
+        embeddings=BedrockEmbeddings(),
+        index_name=elasticsearch_test_index,
+    )
+    sample_document = WebPage(
+        url="https://www.example.com",
+        created_at=datetime.now(),
+        content="Hello, world!",
+        raw="Hello, world!",
+    )
+    documents = ElasticsearchRetrieverClient(
+        elasticsearch=Elasticsearch(hosts=[os.getenv("ELASTICSEARCH_URL")]),
+        embeddings=client.embeddings,
+        index_name=elasticsearch_test_index,
+    ).create_webpage_documents(sample_document)
+
+    async def run():
+        try:
+            await client.aadd_documents(documents)
+            assert await client.adocument_exists(sample_document.url)
+            results = await asyncio.gather(
+                *[client.asimilarity_search("Hello, world!", k=1) for _ in range(20)]
+            )
+            assert all(len(result) == 1 for result in results)
+            found = await client.afind_document_by_url(sample_document.url)
+            assert found["hits"]["total"]["value"] == len(documents)
+            await client.adelete_documents([document.id for document in documents])
+            assert not await client.adocument_exists(sample_document.url)
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
+
+
+def test_async_elasticsearch_client() -> None:
+    """The async client is built from explicit settings with a larger pool"""
+    async_elasticsearch = async_elasticsearch_client(
+        hosts=["http://localhost:9200"],
+        api_key="key",
+        connections_per_node=50,
+    )
+    nodes = async_elasticsearch.transport.node_pool.all()
+    assert [node.config.port for node in nodes] == [9200]
+    assert all(node.config.connections_per_node == 50 for node in nodes)
+    asyncio.run(async_elasticsearch.close())
+
+
+def test_async_elasticsearch_client_reads_credentials(monkeypatch) -> None:
+    """The lazily built async client authenticates like the deployment's sync client"""
+    monkeypatch.setenv("ELASTICSEARCH_URL", "http://localhost:9200")
+    monkeypatch.setenv("ELASTICSEARCH_API_KEY", "key")
+    async_elasticsearch = async_elasticsearch_client()
+    assert async_elasticsearch._headers["authorization"] == "ApiKey key"
+    asyncio.run(async_elasticsearch.close())
+    monkeypatch.delenv("ELASTICSEARCH_API_KEY")
+    monkeypatch.setenv("ELASTICSEARCH_USERNAME", "elastic")
+    monkeypatch.setenv("ELASTICSEARCH_PASSWORD", "secret")
+    async_elasticsearch = async_elasticsearch_client()
+    assert async_elasticsearch._headers["authorization"].startswith("Basic ")
+    asyncio.run(async_elasticsearch.close())
+
+
+def test_url_search_body_limits_reads() -> None:
+    body = url_search_body("https://www.example.com", size=10000)
+    assert body["size"] == MAX_SEARCH_SIZE
+    assert body["source"] == CONTENT_SOURCE_FIELDS
+
+
+def test_url_query_matches_url_variants() -> None:
+    """Lookups match the normalized URL and still match documents with only a raw URL"""
+    query = url_query("http://Example.com/pricing/?utm_source=news#plans")
+    terms = [clause["term"] for clause in query["bool"]["filter"][0]["bool"]["should"]]
+    assert {"metadata.normalized_url": "https://example.com/pricing"} in terms
+    assert {
+        "metadata.url.keyword": "http://Example.com/pricing/?utm_source=news#plans"
+    } in terms
+
+
+def test_reads_project_source() -> None:
+    """Searches never return vectors or raw html and existence checks stop at the first hit"""
+    elasticsearch = mock.MagicMock()
+    elasticsearch.search.return_value = {"hits": {"hits": []}}
+    elasticsearch.options.return_value.mget.return_value = {"docs": [{"found": False}]}
+    # an index created by langchain may hold webpages with random ids
+    elasticsearch.indices.get_mapping.return_value = {"legacy": {"mappings": {}}}
+    elasticsearch.msearch.return_value = {
+        "responses": [{"hits": {"total": {"value": 1}, "hits": []}}]
+    }
+    embeddings = mock.MagicMock()
+    embeddings.embed_query.return_value = [0.1]
+    client = ElasticsearchRetrieverClient(
+        elasticsearch=elasticsearch,
+        embeddings=embeddings,
+        index_name="legacy",
+        raw_store=mock.MagicMock(),
+    )
+    client.similarity_search("Hello, world!", k=3)
+    search = elasticsearch.search.call_args.kwargs
+    assert search["size"] == 3
+    assert "vector" not in search["source"]["includes"]
+    assert "metadata.raw" in search["source"]["excludes"]
+    assert client.document_exists("https://www.example.com")
+    exists_body = elasticsearch.msearch.call_args.kwargs["searches"][1]
+    assert exists_body["size"] == 0
+    assert exists_body["terminate_after"] == 1
+
+
+def _alias_elasticsearch(elasticsearch: mock.MagicMock) -> mock.MagicMock:
+    """Fake an index where only the canonical URL of a near-duplicate has chunks"""
+    elasticsearch.search.side_effect = [
+        {"hits": {"hits": []}},
+        {"hits": {"hits": [{"_source": {"page_content": "Hello, world!"}}]}},
+    ]
+    elasticsearch.options.return_value.mget.return_value = {
+        "docs": [
+            {
+                "found": True,
+                "_source": {
+                    "url": "https://www.example.com/alias",
+                    "canonical_url": "https://www.example.com",
+                },
+            }
+        ]
+    }
+    return elasticsearch
+
+
+def test_find_document_by_url_resolves_aliases() -> None:
+    elasticsearch = _alias_elasticsearch(mock.MagicMock())
+    client = ElasticsearchRetrieverClient(
+        elasticsearch=elasticsearch,
+        embeddings=mock.MagicMock(),
+        index_name="test",
+        raw_store=mock.MagicMock(),
+        deduplicate=True,
+    )
+    response = client.find_document_by_url("https://www.example.com/alias")
+    assert response["hits"]["hits"]
+    canonical_search = elasticsearch.search.call_args.kwargs
+    assert (
+        canonical_search["query"]
+        == url_search_body("https://www.example.com", size=500)["query"]
+    )
+
+
+def test_afind_document_by_url_resolves_aliases() -> None:
+    elasticsearch = _alias_elasticsearch(mock.MagicMock())
+    elasticsearch.search = mock.AsyncMock(side_effect=elasticsearch.search.side_effect)
+    elasticsearch.options.return_value.mget = mock.AsyncMock(
+        return_value=elasticsearch.options.return_value.mget.return_value
+    )
+    client = AsyncElasticsearchRetrieverClient(
+        elasticsearch=elasticsearch,
+        embeddings=mock.MagicMock(),
+        index_name="test",
+    )
+    response = asyncio.run(
+        client.afind_document_by_url("https://www.example.com/alias")
+    )
+    assert response["hits"]["hits"]
+    canonical_search = elasticsearch.search.call_args.kwargs
+    assert (
+        canonical_search["query"]
+        == url_search_body("https://www.example.com", size=500)["query"]
+    )
+    assert (
+        elasticsearch.options.return_value.mget.call_args.kwargs["index"]
+        == "test-fingerprints"
+    )
+
+
+def test_similarity_search_forwards_store_options() -> None:
+    client = ElasticsearchRetrieverClient(
+        elasticsearch=mock.MagicMock(),
+        embeddings=mock.MagicMock(),
+        index_name="test",
+        raw_store=mock.MagicMock(),
+        run_id="run",
+    )
+    client.store = mock.MagicMock()
+    doc_builder = mock.MagicMock()
+    client.similarity_search("Hello, world!", k=2, doc_builder=doc_builder)
+    assert client.store.similarity_search.call_args.kwargs == {
+        "query": "Hello, world!",
+        "k": 2,
+        "fetch_k": 50,
+        "filter": [{"term": {"metadata.run_id": "run"}}],
+        "doc_builder": doc_builder,
+    }
+
+
+def test_create_webpage_document_is_deprecated() -> None:
+    client = ElasticsearchRetrieverClient(
+        elasticsearch=mock.MagicMock(),
+        embeddings=mock.MagicMock(),
+        index_name="test",
+        raw_store=mock.MagicMock(),
+    )
+    webpage = WebPage(
+        url="https://www.example.com",
+        created_at=datetime.now(),
+        content="Hello, world!",
+        raw="<p>Hello, world!</p>",
+    )
+    with pytest.deprecated_call():
+        document = client.create_webpage_document(webpage)
+    assert document.page_content == "Hello, world!"
+    assert document.metadata["url"] == "https://www.example.com"
+
+
 def test_elasticsearch_retriever_client_multiple_documents(elasticsearch_test_index):
     """Test out the ElasticsearchRetrieverClient with multiple sample data"""
     elasticsearch = Elasticsearch(
@@ -57,21 +315,24 @@ def test_elasticsearch_retriever_client_multiple_documents(elasticsearch_test_in
     )
     sample_documents = [
         WebPage(
-            url="https://www.example.com",
-            created_at=datetime.now(),
-            content="Hello, world!",
-            raw="Hello, world!",
-        ),
-        WebPage(
-            url="https://www.example.com",
+            url=f"https://www.example.com/{idx}",
             created_at=datetime.now(),
             content="Hello, world!",
             raw="Hello, world!",
-        ),
-    ] * 10
+        )
+        for idx in range(20)
+    ]
     # create and assert writing working
     client.create_insert_webpage_documents(sample_documents)
     assert client.elasticsearch.count()["count"] == 20
+    # writing the same webpages again overwrites their documents
+    client.create_insert_webpage_documents(sample_documents)
+    client.elasticsearch.indices.refresh(index=elasticsearch_test_index)
+    assert client.elasticsearch.count()["count"] == 20
+    assert client.exists_many(["http://www.example.com/3/", "https://example.org"]) == {
+        "http://www.example.com/3/": True,
+        "https://example.org": False,
+    }
     # run similarity search and assert working
     results = client.store.similarity_search(query="Hello, world!", k=1)
     assert isinstance(results, list)
@@ -99,8 +360,9 @@ def test_url_to_db(elasticsearch_test_index):
     }
     url = "https://trssllc.com"
     document_ids = url_to_db(url, client, headers=headers)
-    assert len(document_ids) == 1
-    assert client.elasticsearch.count()["count"] == 2
+    # the webpage is split into chunk documents
+    assert len(document_ids) >= 1
+    assert client.elasticsearch.count()["count"] >= len(document_ids)
     # run similarity search and assert working
     results = client.store.similarity_search(
         query="Thomson Reuters Special Services", top_k=1
@@ -109,7 +371,7 @@ def test_url_to_db(elasticsearch_test_index):
     assert len(results) == 1
     # test if we can find the document using the find by metadata url function
     document = client.find_document_by_url(url)
-    assert document["hits"]["total"]["value"] == 1
+    assert document["hits"]["total"]["value"] == len(document_ids)
 
 
 def test_get_document_by_url(elasticsearch_test_index) -> None:
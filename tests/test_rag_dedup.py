@@ -0,0 +1,51 @@
+"""
+Test the near-duplicate fingerprints
+"""
+from conductor.rag.dedup import (
+    FingerprintIndex,
+    fingerprint_blocks,
+    hamming_distance,
+    simhash,
+)
+import pytest
+import random
+
+
+ARTICLE = " ".join(
+    f"Acme Corp announced quarterly result {idx} with revenue growth across its government and commercial segments."
+    for idx in range(40)
+)
+
+
+def test_simhash_near_duplicates() -> None:
+    syndicated = (
+        "Press release distributed by Newswire. " + ARTICLE + " Share this article."
+    )
+    assert hamming_distance(simhash(ARTICLE), simhash(syndicated)) <= 3
+
+
+def test_simhash_different_documents() -> None:
+    other = " ".join(
+        f"The museum opened exhibit {idx} featuring paintings from the nineteenth century."
+        for idx in range(40)
+    )
+    assert hamming_distance(simhash(ARTICLE), simhash(other)) > 10
+
+
+def test_simhash_ignores_case_and_punctuation() -> None:
+    assert simhash("Hello, World! How are you?") == simhash("hello world how are you")
+
+
+def test_fingerprint_blocks_share_a_block_within_distance() -> None:
+    fingerprint = simhash(ARTICLE)
+    generator = random.Random(0)
+    for _ in range(100):
+        flipped = fingerprint
+        for bit in generator.sample(range(64), 3):
+            flipped ^= 1 << bit
+        assert set(fingerprint_blocks(fingerprint)) & set(fingerprint_blocks(flipped))
+
+
+def test_fingerprint_index_max_distance() -> None:
+    with pytest.raises(ValueError):
+        FingerprintIndex(elasticsearch=None, index_name="test", max_distance=4)
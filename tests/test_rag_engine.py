@@ -0,0 +1,158 @@
+"""
+Test the async ingest engine with in-memory stand-ins for Elasticsearch and Bedrock
+"""
+from conductor.rag.engine import IngestEngine, IngestEngineConfig, run_ingest_engine
+from conductor.rag.models import IngestResult
+from langchain_core.documents import Document
+from unittest import mock
+import asyncio
+import httpx
+import pytest
+
+
+class FakeEmbeddings:
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        await asyncio.sleep(0)
+        return [[float(len(text))] for text in texts]
+
+
+class FakeClient:
+    def __init__(self, existing_urls: list[str] = None, run_id: str = None) -> None:
+        self.index_name = "rag"
+        self.run_id = run_id
+        self.routing = None
+        self.embeddings = FakeEmbeddings()
+        self.existing_urls = existing_urls if existing_urls else []
+        self.inserted: list[Document] = []
+        self.exists_checks: list[list[str]] = []
+
+    def exists_many(self, urls: list[str]) -> dict[str, bool]:
+        self.exists_checks.append(urls)
+        return {url: url in self.existing_urls for url in urls}
+
+    def find_duplicate_webpage(self, webpage):
+        return None
+
+    def register_webpage_fingerprint(self, webpage) -> None:
+        pass
+
+    def create_webpage_documents(self, webpage) -> list[Document]:
+        return [Document(page_content=webpage.content, metadata={"url": webpage.url})]
+
+    def insert_embedded_documents(self, documents, embeddings) -> list[str]:
+        self.inserted.extend(documents)
+        return [document.metadata["url"] for document in documents]
+
+
+class FakeFetchEngine(IngestEngine):
+    """
+    Serve canned HTML and track how many fetches run per host
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.open_fetches = 0
+        self.max_open_fetches = 0
+
+    async def _fetch(self, item):
+        if "broken" in item.url:
+            raise ValueError("unreachable")
+        async with self._host_semaphore(item.url):
+            self.open_fetches += 1
+            self.max_open_fetches = max(self.max_open_fetches, self.open_fetches)
+            await asyncio.sleep(0.01)
+            self.open_fetches -= 1
+        item.response_text = f"<html><body><p>{item.url}</p></body></html>"
+        return item
+
+
+def test_ingest_engine_preserves_input_order() -> None:
+    urls = [f"https://example.com/{idx}" for idx in range(20)]
+    client = FakeClient()
+    engine = FakeFetchEngine(client=client, config=IngestEngineConfig(queue_size=2))
+    results = asyncio.run(engine.ingest(urls))
+    assert [result.url for result in results] == urls
+    assert all(result.document_ids == [result.url] for result in results)
+    assert len(client.inserted) == 20
+
+
+def test_ingest_engine_per_host_limit() -> None:
+    urls = [f"https://example.com/{idx}" for idx in range(10)]
+    engine = FakeFetchEngine(
+        client=FakeClient(), config=IngestEngineConfig(per_host_limit=3)
+    )
+    asyncio.run(engine.ingest(urls))
+    assert engine.max_open_fetches <= 3
+
+
+def test_ingest_engine_records_existing_and_errors() -> None:
+    urls = ["https://example.com/a", "https://broken.example.com", "https://b.com"]
+    client = FakeClient(existing_urls=["https://b.com"])
+    engine = FakeFetchEngine(client=client)
+    results = asyncio.run(engine.ingest(urls))
+    assert results[0].document_ids == ["https://example.com/a"]
+    assert results[1].error == "unreachable"
+    assert results[2].exists
+    assert results[1].to_message() == "Error processing: https://broken.example.com"
+    # one batched existence check for the whole list
+    assert len(client.exists_checks) == 1
+
+
+def test_ingest_engine_async_iterable() -> None:
+    async def stream():
+        for idx in range(5):
+            yield f"https://example.com/{idx}"
+
+    engine = FakeFetchEngine(client=FakeClient())
+    results = asyncio.run(engine.ingest(stream()))
+    assert len(results) == 5
+    assert all(isinstance(result, IngestResult) for result in results)
+
+
+def test_ingest_engine_checks_streams_in_batches() -> None:
+    async def stream():
+        for idx in range(5):
+            yield f"https://example.com/{idx}"
+
+    client = FakeClient(existing_urls=["https://example.com/3"])
+    engine = FakeFetchEngine(client=client, config=IngestEngineConfig(queue_size=2))
+    results = asyncio.run(engine.ingest(stream()))
+    assert [result.exists for result in results] == [False, False, False, True, False]
+    assert [len(urls) for urls in client.exists_checks] == [2, 2, 1]
+    client.exists_checks = []
+    asyncio.run(engine.ingest(["https://example.com/3"], skip_existing=False))
+    assert client.exists_checks == []
+
+
+def test_ingest_engine_cancels_stages_on_failure() -> None:
+    async def broken_stream():
+        yield "https://example.com/0"
+        raise ValueError("stream failed")
+
+    async def run():
+        engine = FakeFetchEngine(client=FakeClient())
+        with pytest.raises(ValueError):
+            await engine.ingest(broken_stream())
+        # the stage workers were cancelled instead of waiting on their queues
+        assert asyncio.all_tasks() == {asyncio.current_task()}
+
+    asyncio.run(run())
+
+
+def test_run_ingest_engine_no_urls() -> None:
+    assert run_ingest_engine(urls=[], client=FakeClient()) == []
+
+
+def test_ingest_engine_runs_do_not_share_ingests() -> None:
+    url = "https://example.com/shared-between-runs"
+
+    async def afetch(url, *args, **kwargs):
+        return httpx.Response(200, text=f"<html><body><p>{url}</p></body></html>")
+
+    clients = [FakeClient(run_id="first"), FakeClient(run_id="second")]
+    with mock.patch("conductor.rag.engine.default_fetcher.afetch", side_effect=afetch):
+        for client in clients:
+            results = asyncio.run(IngestEngine(client=client).ingest([url]))
+            assert results[0].document_ids == [url]
+    # the second run writes its own documents instead of reusing the first run's result
+    assert all(len(client.inserted) == 1 for client in clients)
@@ -0,0 +1,99 @@
+"""
+Test HTML text extraction and the parse executor
+"""
+from conductor.rag.extract import ParseExecutor, extract_page, extract_text
+import asyncio
+
+
+PAGE = """<html><head><title>Acme</title><style>.a { color: red }</style></head>
+<body class="page has-sidebar">
+<header><nav><a href="/">Home</a> <a href="/about">About us</a></nav></header>
+<div id="cookie-banner">We use cookies to improve your experience</div>
+<div class="content">
+<article>
+<header><h1>Acme raises prices</h1></header>
+<p>Acme Corp announced a
+price increase today.</p>
+<p>The change takes effect<br>next month.</p>
+<ul><li>Widgets</li><li>Gadgets</li></ul>
+</article>
+<aside>Related stories</aside>
+</div>
+<footer>Copyright 2024 Acme Corp</footer>
+<script>var tracking = true;</script>
+</body></html>"""
+
+
+def test_extract_text_keeps_paragraphs() -> None:
+    assert extract_text(PAGE) == (
+        "Acme raises prices\n\n"
+        "Acme Corp announced a price increase today.\n\n"
+        "The change takes effect\nnext month.\n\n"
+        "Widgets\n\nGadgets"
+    )
+
+
+def test_extract_text_drops_boilerplate_from_whole_page() -> None:
+    text = extract_text(PAGE, main_content=False)
+    assert "Acme Corp announced" in text
+    for noise in [
+        "Home",
+        "cookies",
+        "Related stories",
+        "Copyright",
+        "tracking",
+        "color",
+    ]:
+        assert noise not in text
+
+
+def test_extract_text_finds_densest_block_without_article() -> None:
+    paragraphs = "".join(
+        f"<p>Paragraph {i} about pricing strategy.</p>" for i in range(5)
+    )
+    page = f"""<html><body>
+    <div class="links"><a href="/a">Link A</a> <a href="/b">Link B</a></div>
+    <div class="story">{paragraphs}</div>
+    <div class="legal">All rights reserved</div>
+    </body></html>"""
+    text = extract_text(page)
+    assert text.startswith("Paragraph 0")
+    assert "Link A" not in text
+    assert "All rights reserved" not in text
+
+
+def test_extract_text_decodes_bytes() -> None:
+    latin = (
+        '<html><head><meta charset="iso-8859-1"></head><body><p>café</p></body></html>'
+    )
+    assert extract_text(latin.encode("latin-1")) == "café"
+    assert extract_text("<p>café</p>".encode("utf-8")) == "café"
+    assert extract_text("<?xml version='1.0' encoding='utf-8'?><p>hello</p>") == "hello"
+
+
+def test_extract_text_empty() -> None:
+    assert extract_text("") == ""
+    assert extract_text(b"   ") == ""
+    assert extract_text("plain text") == "plain text"
+
+
+def test_extract_page_title() -> None:
+    page = extract_page(PAGE)
+    assert page.title == "Acme"
+    assert page.text.startswith("Acme raises prices")
+
+
+def test_parse_executor_small_pages_stay_in_thread() -> None:
+    executor = ParseExecutor(processes=2, min_bytes=len(PAGE) + 1)
+    assert executor.extract(PAGE) == extract_page(PAGE)
+    assert executor._pool is None
+
+
+def test_parse_executor_offloads_large_pages() -> None:
+    executor = ParseExecutor(processes=1, min_bytes=100)
+    try:
+        assert executor.extract(PAGE.encode("utf-8")) == extract_page(PAGE)
+        assert asyncio.run(executor.aextract(PAGE)) == extract_page(PAGE)
+        assert executor._pool is not None
+    finally:
+        executor.shutdown()
@@ -0,0 +1,159 @@
+"""
+Test the tiered fetch policy with a mocked transport
+"""
+from conductor.rag.fetch import (
+    FetchPolicy,
+    FetchTier,
+    TieredFetcher,
+    escalation_reason,
+)
+from conductor.health import FetchSkipped, ScrapeGuard
+from conductor.http import HttpClient, UnsupportedContent
+from conductor.zen import zenrows_client
+import asyncio
+import httpx
+import pytest
+
+
+ARTICLE = (
+    "<html><body><p>" + "Acme Corp announced its results. " * 20 + "</p></body></html>"
+)
+SPA = (
+    "<html><body><div id='root'></div><script>"
+    + "var a = 1;" * 200
+    + "</script></body></html>"
+)
+
+
+@pytest.fixture(autouse=True)
+def zenrows_api_key(monkeypatch) -> None:
+    monkeypatch.setattr(zenrows_client, "apikey", "test")
+
+
+def test_escalation_reason() -> None:
+    assert escalation_reason(200, ARTICLE) is None
+    assert escalation_reason(403, ARTICLE) == "blocked"
+    assert escalation_reason(404, ARTICLE) == "status 404"
+    assert escalation_reason(200, SPA) == "mostly script"
+    assert escalation_reason(200, "<html><body></body></html>") == "empty"
+    assert escalation_reason(200, "<title>Just a moment...</title>") == "blocked"
+
+
+def create_fetcher(pages: dict[str, str], requests: list) -> TieredFetcher:
+    """
+    Serve a page per tier, the direct tier is keyed by "direct"
+    """
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.host == "example.com":
+            tier = "direct"
+        elif "js_render" in request.url.params:
+            tier = "render"
+        else:
+            tier = "proxy"
+        requests.append(tier)
+        if tier not in pages:
+            return httpx.Response(403, text="Access Denied")
+        return httpx.Response(200, text=pages[tier])
+
+    http = HttpClient(transport=httpx.MockTransport(handler), http2=False, retries=0)
+    return TieredFetcher(policy=FetchPolicy(), http=http, guard=ScrapeGuard())
+
+
+def test_tiered_fetcher_plain_request() -> None:
+    requests = []
+    fetcher = create_fetcher({"direct": ARTICLE}, requests)
+    result = fetcher.fetch("https://example.com/news")
+    assert result.tier == FetchTier.DIRECT
+    assert requests == ["direct"]
+
+
+def test_tiered_fetcher_escalates_and_learns_domain() -> None:
+    requests = []
+    fetcher = create_fetcher({"direct": SPA, "proxy": SPA, "render": ARTICLE}, requests)
+    result = fetcher.fetch("https://example.com/app")
+    assert result.tier == FetchTier.RENDER
+    assert result.text == ARTICLE
+    assert requests == ["direct", "proxy", "render"]
+    # the next page of the domain starts at the tier that worked
+    fetcher.fetch("https://example.com/other")
+    assert requests[3:] == ["render"]
+
+
+def test_tiered_fetcher_keeps_best_response() -> None:
+    requests = []
+    fetcher = create_fetcher({"direct": SPA}, requests)
+    result = fetcher.fetch("https://example.com/app")
+    assert result.tier == FetchTier.DIRECT
+    assert result.text == SPA
+
+
+def test_tiered_fetcher_raises_when_every_tier_fails() -> None:
+    fetcher = create_fetcher({}, [])
+    with pytest.raises(httpx.HTTPStatusError):
+        fetcher.fetch("https://example.com/blocked")
+
+
+def test_tiered_fetcher_skips_recent_failures() -> None:
+    requests = []
+    fetcher = create_fetcher({}, requests)
+    with pytest.raises(httpx.HTTPStatusError):
+        fetcher.fetch("https://example.com/blocked")
+    # the failed url is not requested again until its retry window passes
+    with pytest.raises(FetchSkipped):
+        fetcher.fetch("https://example.com/blocked")
+    assert requests == ["direct", "proxy", "render"]
+
+
+def test_tiered_fetcher_async() -> None:
+    requests = []
+    fetcher = create_fetcher({"proxy": ARTICLE}, requests)
+
+    async def fetch():
+        async with fetcher.http.async_client() as client:
+            return await fetcher.afetch("https://example.com/news", client)
+
+    assert asyncio.run(fetch()).tier == FetchTier.PROXY
+    assert requests == ["direct", "proxy"]
+
+
+def test_tiered_fetcher_rejects_binary_content() -> None:
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(
+            200, headers={"Content-Type": "text/html"}, content=b"%PDF-1.4\n"
+        )
+
+    http = HttpClient(transport=httpx.MockTransport(handler), http2=False, retries=0)
+    fetcher = TieredFetcher(policy=FetchPolicy(), http=http, guard=ScrapeGuard())
+    with pytest.raises(UnsupportedContent):
+        fetcher.fetch("https://example.com/report")
+    # no escalation to zenrows for a resource that isn't a webpage
+    assert len(requests) == 1
+
+
+def test_tiered_fetcher_escalates_rate_limits_without_retrying(monkeypatch) -> None:
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        tier = "direct" if request.url.host == "example.com" else "proxy"
+        requests.append((tier, request.extensions["timeout"]["read"]))
+        if tier == "direct":
+            return httpx.Response(429, text="Too Many Requests")
+        return httpx.Response(200, text=ARTICLE)
+
+    http = HttpClient(
+        transport=httpx.MockTransport(handler), http2=False, retries=2, backoff=0
+    )
+    fetcher = TieredFetcher(policy=FetchPolicy(), http=http, guard=ScrapeGuard())
+    result = fetcher.fetch("https://example.com/news", timeout=3.0)
+    assert result.tier == FetchTier.PROXY
+    assert requests == [("direct", 3.0), ("proxy", 3.0)]
+    # without zenrows the direct tier is the last one, so it backs off and retries
+    monkeypatch.setattr(zenrows_client, "apikey", None)
+    requests.clear()
+    with pytest.raises(httpx.HTTPStatusError):
+        fetcher.fetch("https://example.com/limited")
+    assert [tier for tier, _ in requests] == ["direct"] * 3
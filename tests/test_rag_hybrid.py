@@ -0,0 +1,71 @@
+from conductor.rag.hybrid import (
+    HybridSearch,
+    fuse_hybrid_responses,
+    hybrid_search_bodies,
+)
+
+
+def hit(document_id: str) -> dict:
+    return {
+        "_id": document_id,
+        "_source": {"text": f"text {document_id}", "metadata": {"url": document_id}},
+    }
+
+
+def response(*document_ids: str) -> dict:
+    return {"hits": {"hits": [hit(document_id) for document_id in document_ids]}}
+
+
+def test_hybrid_search_bodies() -> None:
+    settings = HybridSearch(candidates=20, num_candidates=10)
+    header, lexical, _, vector = hybrid_search_bodies(
+        "NAICS 541511", [0.1, 0.2], settings
+    )
+    assert header == {}
+    assert lexical["query"]["bool"]["must"] == [
+        {"match": {"text": {"query": "NAICS 541511"}}}
+    ]
+    assert lexical["size"] == 20
+    assert vector["knn"]["query_vector"] == [0.1, 0.2]
+    # kNN can't return more hits than it considers
+    assert vector["knn"]["num_candidates"] == 20
+
+
+def test_hybrid_search_bodies_filter_and_routing() -> None:
+    run_filter = [{"term": {"metadata.run_id": "run"}}]
+    header, lexical, _, vector = hybrid_search_bodies(
+        "query", [0.1], HybridSearch(), filter=run_filter, routing="run"
+    )
+    assert header == {"routing": "run"}
+    assert lexical["query"]["bool"]["filter"] == run_filter
+    # the filter is applied while searching the graph, not after
+    assert vector["knn"]["filter"] == run_filter
+
+
+def test_fuse_hybrid_responses() -> None:
+    responses = {"responses": [response("a", "b", "c"), response("c", "d", "a")]}
+    fused = fuse_hybrid_responses(responses, k=3, settings=HybridSearch())
+    # documents found by both rankings come first
+    assert [document.id for document, _ in fused] == ["a", "c", "b"]
+    assert fused[0][0].page_content == "text a"
+    assert fused[0][0].metadata == {"url": "a"}
+    assert fused[0][1] > fused[2][1]
+
+
+def test_fuse_hybrid_responses_weights() -> None:
+    responses = {"responses": [response("a"), response("b")]}
+    fused = fuse_hybrid_responses(
+        responses, k=2, settings=HybridSearch(lexical_weight=0.5, vector_weight=1.0)
+    )
+    assert [document.id for document, _ in fused] == ["b", "a"]
+
+
+def test_fuse_hybrid_responses_failed_ranking() -> None:
+    responses = {
+        "responses": [
+            {"error": {"type": "search_phase_execution_exception"}},
+            response("b"),
+        ]
+    }
+    fused = fuse_hybrid_responses(responses, k=5, settings=HybridSearch())
+    assert [document.id for document, _ in fused] == ["b"]
@@ -0,0 +1,151 @@
+from conductor.rag.blobs import LocalBlobStore
+from conductor.rag.indices import (
+    MAPPING_VERSION,
+    IndexSettings,
+    ensure_index,
+    index_mappings,
+    needs_migration,
+    reindex,
+)
+from elasticsearch import Elasticsearch
+from unittest import mock
+import logging
+import pytest
+
+
+class FakeIndices:
+    def __init__(self) -> None:
+        self.mappings: dict[str, dict] = {}
+        self.aliases: dict[str, str] = {}
+
+    def exists(self, index: str) -> bool:
+        return index in self.mappings or index in self.aliases
+
+    def create(self, index: str, mappings: dict, settings: dict) -> None:
+        self.mappings[index] = mappings
+
+    def put_alias(self, index: str, name: str) -> None:
+        self.aliases[name] = index
+
+    def get_alias(self, index: str) -> dict:
+        if index in self.aliases:
+            return {self.aliases[index]: {"aliases": {index: {}}}}
+        return {index: {"aliases": {}}}
+
+    def get_mapping(self, index: str) -> dict:
+        name = self.aliases.get(index, index)
+        return {name: {"mappings": self.mappings[name]}}
+
+    def update_aliases(self, actions: list[dict]) -> None:
+        for action in actions:
+            if "remove_index" in action:
+                del self.mappings[action["remove_index"]["index"]]
+            elif "add" in action:
+                self.aliases[action["add"]["alias"]] = action["add"]["index"]
+
+    def put_settings(self, index: str, settings: dict) -> None:
+        pass
+
+    def refresh(self, index: str) -> None:
+        pass
+
+
+class FakeEmbeddings:
+    def __init__(self) -> None:
+        self.embedded: list[str] = []
+
+    def embed_query(self, text: str) -> list[float]:
+        return [0.0, 1.0]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.embedded.extend(texts)
+        return [[1.0, 0.0] for _ in texts]
+
+
+def fake_elasticsearch() -> mock.MagicMock:
+    elasticsearch = mock.MagicMock(spec=Elasticsearch)
+    elasticsearch.indices = FakeIndices()
+    return elasticsearch
+
+
+def test_index_mappings() -> None:
+    mappings = index_mappings(
+        1024, IndexSettings(quantization="bbq_hnsw", m=32, ef_construction=200)
+    )
+    vector = mappings["properties"]["vector"]
+    assert vector["dims"] == 1024
+    assert vector["index_options"] == {
+        "type": "bbq_hnsw",
+        "m": 32,
+        "ef_construction": 200,
+    }
+    assert "vector" in mappings["_source"]["excludes"]
+    assert (
+        "keyword" in mappings["properties"]["metadata"]["properties"]["url"]["fields"]
+    )
+    assert "fields" not in mappings["properties"]["text"]
+
+
+def test_ensure_index_creates_versioned_index_behind_alias() -> None:
+    elasticsearch = fake_elasticsearch()
+    assert ensure_index(elasticsearch, "rag", dims=8)
+    index_name = elasticsearch.indices.aliases["rag"]
+    assert index_name.startswith("rag-")
+    assert not needs_migration(elasticsearch, "rag")
+    # an existing alias is left alone
+    assert not ensure_index(elasticsearch, "rag", dims=8)
+
+
+def test_ensure_index_detects_legacy_index(caplog) -> None:
+    elasticsearch = fake_elasticsearch()
+    # an index langchain created on the first write, run_id was mapped dynamically
+    elasticsearch.indices.mappings["rag"] = {
+        "properties": {"metadata": {"properties": {"run_id": {"type": "text"}}}}
+    }
+    with caplog.at_level(logging.WARNING, logger="conductor.rag.indices"):
+        assert not ensure_index(elasticsearch, "rag", dims=8)
+    assert "reindex" in caplog.text
+    # run filters would match nothing, so run scoped clients can't use it
+    with pytest.raises(ValueError):
+        ensure_index(elasticsearch, "rag", dims=8, run_scoped=True)
+    assert elasticsearch.indices.aliases == {}
+
+
+def test_reindex_legacy_index(tmp_path) -> None:
+    elasticsearch = fake_elasticsearch()
+    elasticsearch.indices.mappings["rag"] = {"properties": {}}
+    assert needs_migration(elasticsearch, "rag")
+    hits = [
+        {
+            "_id": "a",
+            "_source": {"text": "kept vector", "vector": [0.5, 0.5], "metadata": {}},
+        },
+        {
+            "_id": "b",
+            "_source": {"text": "inline raw", "metadata": {"raw": "<html></html>"}},
+        },
+    ]
+    written = []
+
+    def bulk(client, actions, **kwargs):
+        written.extend(actions)
+        return len(written), []
+
+    embeddings = FakeEmbeddings()
+    raw_store = LocalBlobStore(directory=str(tmp_path))
+    with mock.patch(
+        "conductor.rag.indices.helpers.scan", return_value=iter(hits)
+    ), mock.patch("conductor.rag.indices.helpers.bulk", side_effect=bulk):
+        index_name = reindex(elasticsearch, "rag", embeddings, raw_store=raw_store)
+    assert elasticsearch.indices.aliases == {"rag": index_name}
+    assert "rag" not in elasticsearch.indices.mappings
+    assert (
+        elasticsearch.indices.mappings[index_name]["_meta"]["mapping_version"]
+        == MAPPING_VERSION
+    )
+    # only documents without a stored vector are embedded again
+    assert embeddings.embedded == ["inline raw"]
+    sources = {action["_id"]: action["_source"] for action in written}
+    assert sources["a"]["vector"] == [0.5, 0.5]
+    assert "raw" not in sources["b"]["metadata"]
+    assert raw_store.get(sources["b"]["metadata"]["raw_hash"]) == b"<html></html>"
@@ -0,0 +1,129 @@
+"""
+Test PDF spooling, page extraction and page by page indexing
+"""
+from conductor.http import HttpClient, ResponseTooLarge, UnsupportedContent
+from conductor.rag.client import ElasticsearchRetrieverClient
+from conductor.rag.pdf import ingest_pdf, is_pdf_url, iter_pdf_pages, spool_pdf
+from conductor.rag.utils import get_content_and_source_from_response
+from langchain_core.documents import Document
+from reportlab.pdfgen import canvas
+import httpx
+import io
+import pytest
+
+
+def create_pdf(pages: int) -> bytes:
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer)
+    for page in range(1, pages + 1):
+        pdf.drawString(
+            72, 720, f"Annual report page {page}. Revenue grew in every segment."
+        )
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def create_http(content: bytes, content_type: str = "application/pdf") -> HttpClient:
+    return HttpClient(
+        transport=httpx.MockTransport(
+            lambda request: httpx.Response(
+                200, headers={"Content-Type": content_type}, content=content
+            )
+        ),
+        http2=False,
+    )
+
+
+class RecordingClient(ElasticsearchRetrieverClient):
+    """
+    Chunk like the real client but record inserts instead of writing to Elasticsearch
+    """
+
+    def __init__(self) -> None:
+        self.chunk_size = 256
+        self.chunk_overlap = 32
+        self.run_id = None
+        self.inserts: list[list[Document]] = []
+        self.chunk_counts: dict[str, int] = {}
+
+    def update_chunk_count(self, document_ids: list[str], chunk_count: int) -> None:
+        self.chunk_counts.update(dict.fromkeys(document_ids, chunk_count))
+
+    def insert_documents(self, documents: list[Document]) -> list[str]:
+        self.inserts.append(documents)
+        return [document.id for document in documents]
+
+
+def test_is_pdf_url() -> None:
+    assert is_pdf_url("https://example.com/10-K.PDF?download=1")
+    assert not is_pdf_url("https://example.com/pdf")
+
+
+def test_iter_pdf_pages_respects_page_limit() -> None:
+    pages = list(iter_pdf_pages(io.BytesIO(create_pdf(5)), max_pages=3))
+    assert [page_number for page_number, _ in pages] == [1, 2, 3]
+    assert "Annual report page 2" in pages[1][1]
+
+
+def test_spool_pdf_limits() -> None:
+    content = create_pdf(3)
+    with spool_pdf("https://example.com/report.pdf", http=create_http(content)) as file:
+        assert file.read() == content
+    with pytest.raises(ResponseTooLarge):
+        spool_pdf(
+            "https://example.com/report.pdf",
+            http=create_http(content),
+            max_bytes=len(content) - 1,
+        )
+    with pytest.raises(UnsupportedContent):
+        spool_pdf(
+            "https://example.com/report.pdf",
+            http=create_http(b"<html><body>Not found</body></html>", "text/html"),
+        )
+
+
+def test_ingest_pdf_indexes_page_by_page() -> None:
+    client = RecordingClient()
+    result = ingest_pdf(
+        "https://example.com/annual-report.pdf",
+        client,
+        max_pages=4,
+        http=create_http(create_pdf(6)),
+    )
+    assert len(client.inserts) == 4
+    documents = [document for insert in client.inserts for document in insert]
+    assert result.document_ids == [document.id for document in documents]
+    assert [document.metadata["page"] for document in documents] == [1, 2, 3, 4]
+    # chunk indexes continue across pages so ids are unique
+    assert [document.metadata["chunk_index"] for document in documents] == [0, 1, 2, 3]
+    assert len(set(result.document_ids)) == 4
+    assert documents[0].metadata["content_type"] == "pdf"
+    assert client.chunk_counts == dict.fromkeys(result.document_ids, 4)
+
+
+def test_ingest_pdf_pages_merge_back() -> None:
+    client = RecordingClient()
+    ingest_pdf(
+        "https://example.com/annual-report.pdf",
+        client,
+        http=create_http(create_pdf(3)),
+    )
+    documents = [document for insert in client.inserts for document in insert]
+    # offsets run on across pages, so no page is taken for an overlap of the previous
+    response = {
+        "hits": {
+            "hits": [
+                {
+                    "_source": {
+                        "text": document.page_content,
+                        "metadata": document.metadata,
+                    }
+                }
+                for document in documents
+            ]
+        }
+    }
+    content = get_content_and_source_from_response(response)
+    for page in (1, 2, 3):
+        assert f"Annual report page {page}. Revenue grew in every segment." in content
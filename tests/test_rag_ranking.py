@@ -0,0 +1,58 @@
+"""
+Test reciprocal rank fusion and BM25 snippet scoring
+"""
+from conductor.rag.ranking import bm25_scores, reciprocal_rank_fusion
+from conductor.rag.urls import normalize_url
+import pytest
+
+
+def test_reciprocal_rank_fusion_rewards_agreement() -> None:
+    google = ["https://a.com", "https://b.com", "https://c.com"]
+    bing = ["https://c.com", "https://b.com", "https://d.com"]
+    ranked = [item for item, _ in reciprocal_rank_fusion([google, bing])]
+    assert ranked == [
+        "https://c.com",
+        "https://b.com",
+        "https://a.com",
+        "https://d.com",
+    ]
+
+
+def test_reciprocal_rank_fusion_deduplicates_by_key() -> None:
+    google = ["https://www.example.com/?utm_source=google", "https://a.com"]
+    bing = ["http://www.example.com", "https://a.com/"]
+    ranked = reciprocal_rank_fusion([google, bing], key=normalize_url)
+    assert [item for item, _ in ranked] == [
+        "https://www.example.com/?utm_source=google",
+        "https://a.com",
+    ]
+    assert ranked[0][1] == pytest.approx(2 / 61)
+
+
+def test_reciprocal_rank_fusion_weights() -> None:
+    ranked = reciprocal_rank_fusion([["a", "b"], ["b", "a"]], weights=[1.0, 3.0])
+    assert ranked[0][0] == "b"
+    with pytest.raises(ValueError):
+        reciprocal_rank_fusion([["a"]], weights=[1.0, 2.0])
+
+
+def test_bm25_scores_relevant_snippets_higher() -> None:
+    scores = bm25_scores(
+        "acme pricing strategy",
+        [
+            "Acme Corp pricing strategy for 2024",
+            "Acme Corp opens a new office",
+            "Ten recipes for summer",
+        ],
+    )
+    assert scores[0] > scores[1] > scores[2]
+    assert scores[2] == 0.0
+
+
+def test_bm25_scores_rare_terms_weigh_more() -> None:
+    scores = bm25_scores(
+        "acme pricing",
+        ["acme news", "acme pricing", "acme careers", "acme blog"],
+    )
+    assert scores.index(max(scores)) == 1
+    assert bm25_scores("acme", []) == []
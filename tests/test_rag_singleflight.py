@@ -0,0 +1,64 @@
+"""
+Test the single-flight registry
+"""
+from conductor.rag.singleflight import SingleFlight
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import pytest
+import threading
+import time
+
+
+def test_single_flight_shares_concurrent_work() -> None:
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def work() -> str:
+        calls.append(1)
+        started.set()
+        time.sleep(0.05)
+        return "done"
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [executor.submit(flight.do, "key", work) for _ in range(8)]
+        results = [future.result() for future in futures]
+    assert results == ["done"] * 8
+    assert len(calls) == 1
+    # later callers get the cached result
+    assert flight.do("key", work) == "done"
+    assert len(calls) == 1
+    assert flight.hits + flight.shared == 8
+
+
+def test_single_flight_does_not_cache_errors() -> None:
+    flight = SingleFlight()
+
+    def fail() -> str:
+        raise ValueError("unreachable")
+
+    with pytest.raises(ValueError):
+        flight.do("key", fail)
+    assert flight.do("key", lambda: "retried") == "retried"
+
+
+def test_single_flight_ttl() -> None:
+    flight = SingleFlight(ttl=0)
+    assert flight.do("key", lambda: 1) == 1
+    assert flight.do("key", lambda: 2) == 2
+
+
+def test_single_flight_async_waiters() -> None:
+    flight = SingleFlight()
+    future, owner = flight.claim("key")
+    assert owner
+
+    async def wait() -> list[str]:
+        waiter, waiter_owner = flight.claim("key")
+        assert not waiter_owner
+        asyncio.get_running_loop().call_later(0.01, flight.resolve, "key", "result")
+        return await asyncio.gather(
+            asyncio.wrap_future(waiter), asyncio.wrap_future(future)
+        )
+
+    assert asyncio.run(wait()) == ["result", "result"]
@@ -0,0 +1,40 @@
+"""
+Test URL normalization and document ids
+"""
+from conductor.rag.urls import normalize_url, url_hash, webpage_document_id
+
+
+def test_normalize_url_variants() -> None:
+    variants = [
+        "https://www.example.com/about",
+        "http://www.example.com/about/",
+        "HTTPS://WWW.Example.com:443/about#team",
+        "https://www.example.com/about?utm_source=google&utm_medium=cpc",
+        "https://www.example.com/about?gclid=abc&fbclid=def",
+    ]
+    assert {normalize_url(url) for url in variants} == {"https://www.example.com/about"}
+
+
+def test_normalize_url_keeps_meaningful_query() -> None:
+    assert (
+        normalize_url("https://example.com/search?q=acme&page=2&utm_campaign=x")
+        == "https://example.com/search?page=2&q=acme"
+    )
+    assert normalize_url("https://example.com:8080") == "https://example.com:8080/"
+
+
+def test_normalize_url_other_schemes() -> None:
+    assert normalize_url(" mailto:info@example.com ") == "mailto:info@example.com"
+
+
+def test_webpage_document_id() -> None:
+    assert webpage_document_id("http://example.com/a/") == webpage_document_id(
+        "https://example.com/a", 0
+    )
+    assert webpage_document_id("https://example.com/a", 3) == (
+        f"{url_hash('https://example.com/a')}-3"
+    )
+    # runs keep their own copy of a page
+    assert webpage_document_id("https://example.com/a", 3, run_id="run") == (
+        f"run-{url_hash('https://example.com/a')}-3"
+    )
@@ -52,3 +52,28 @@ def test_get_content_and_source_from_response(elasticsearch_test_index) -> None:
     result = client.find_document_by_url(url=url)
     data_with_source = get_content_and_source_from_response(result)
     assert isinstance(data_with_source, str)
+
+
+def test_get_content_and_source_from_chunked_response() -> None:
+    text = "First sentence. Second sentence. Third sentence."
+    chunks = [(0, 0, 32, "First sentence. Second sentence."), (1, 16, 48, text[16:])]
+    response = {
+        "hits": {
+            "hits": [
+                {
+                    "_source": {
+                        "text": chunk_text,
+                        "metadata": {
+                            "url": "https://www.example.com",
+                            "chunk_index": index,
+                            "chunk_start": start,
+                            "chunk_end": end,
+                        },
+                    }
+                }
+                for index, start, end, chunk_text in chunks
+            ]
+        }
+    }
+    result = get_content_and_source_from_response(response)
+    assert result == f"Source Link: https://www.example.com\nContent: {text}"
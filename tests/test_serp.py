@@ -0,0 +1,63 @@
+"""
+Test the SERP response cache with a stand-in for SerpAPI
+"""
+from conductor import serp
+from conductor.serp import SerpCache, SqliteSerpCacheStore, search_cache_key
+import pytest
+
+
+class FakeGoogleSearch:
+    calls: list[dict] = []
+
+    def __init__(self, params: dict) -> None:
+        self.params = params
+
+    def get_dict(self) -> dict:
+        FakeGoogleSearch.calls.append(self.params)
+        if self.params["q"] == "broken":
+            return {"error": "Invalid API key"}
+        return {"organic_results": [{"link": "https://example.com"}]}
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch) -> SerpCache:
+    FakeGoogleSearch.calls = []
+    monkeypatch.setattr(serp, "GoogleSearch", FakeGoogleSearch)
+    return SerpCache(store=SqliteSerpCacheStore(path=str(tmp_path / "serp.sqlite")))
+
+
+def test_search_cache_key_normalizes_parameters() -> None:
+    assert search_cache_key({"q": "Acme  Corp", "api_key": "a"}) == search_cache_key(
+        {"engine": "google", "q": " Acme Corp", "api_key": "b"}
+    )
+    # OR is an operator, or is a search term
+    assert search_cache_key({"q": "acme OR initech"}) != search_cache_key(
+        {"q": "acme or initech"}
+    )
+    assert search_cache_key({"q": "acme"}) != search_cache_key(
+        {"engine": "bing", "q": "acme"}
+    )
+
+
+def test_serp_cache_hits(cache) -> None:
+    first = cache.search({"q": "Acme Corp", "api_key": "a"})
+    second = cache.search({"q": "Acme  Corp ", "api_key": "a"})
+    assert first == second
+    assert len(FakeGoogleSearch.calls) == 1
+    assert cache.hits == 1
+    assert cache.hit_rate == 0.5
+
+
+def test_serp_cache_skips_errors(cache) -> None:
+    cache.search({"q": "broken"})
+    cache.search({"q": "broken"})
+    assert len(FakeGoogleSearch.calls) == 2
+
+
+def test_serp_cache_ttl_per_engine(cache) -> None:
+    cache.ttls = {"bing": 0}
+    cache.search({"engine": "bing", "q": "acme"})
+    cache.search({"engine": "bing", "q": "acme"})
+    cache.search({"q": "acme"})
+    cache.search({"q": "acme"})
+    assert len(FakeGoogleSearch.calls) == 3